@@ -0,0 +1,349 @@
+"""
+API HTTP de Precificação
+
+Serviço assíncrono (Starlette/uvicorn) sobre o mesmo banco de regras da
+interface. As regras ficam em memória (cache_regras) e o cálculo é o mesmo:
+motor_precificacao para um produto, precificacao_lote (vetorizado) para lotes.
+
+Para rodar: python api_precificacao.py --porta 8000 --workers 4
+            python api_precificacao.py --workers 8 --regras regras.snap
+            uvicorn api_precificacao:app --port 8000
+
+Endpoints:
+    GET  /saude       geração das regras e estatísticas do cache
+    GET  /metrics     tempos por etapa e contadores (texto do Prometheus; --metricas)
+    POST /preco       um produto (mesmos campos de uma linha do catálogo)
+    POST /preco/lote  {"itens": [produto, ...]} -> uma linha de saída por item
+    POST /preco/comparar  produto + "marketplaces" e "ufs_destino" (listas ou "todas")
+                      -> uma linha por canal, do maior lucro líquido para o menor
+
+Todo preço calculado entra no histórico (preco_snapshot): os snapshots são
+acumulados em memória e gravados em lote a cada INTERVALO_SINCRONIZACAO.
+
+Campos do produto: ncm, custo_aquisicao, uf_destino, marketplace, margem_alvo
+e, opcionais, sku, ipi_nao_recuperavel, outros_custos, credito_icms,
+credito_pis, credito_cofins, uf_origem, tipo_cliente, lucro_liquido_alvo,
+data_referencia (AAAA-MM-DD: calcula com as regras vigentes nessa data).
+
+Com o cabeçalho X-Empresa (CNPJ), valem as exceções da empresa sobre as
+regras compartilhadas (empresas.py) e a UF de origem padrão é a dela.
+"""
+
+import argparse
+import asyncio
+import contextlib
+import logging
+import math
+import os
+import sys
+
+import pandas as pd
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import JSONResponse, Response
+from starlette.routing import Route
+
+from banco_dados import caminho_empresa, inicializar_banco, normalizar_cnpj, usar_empresa
+from cache_regras import obter_cache, sincronizar_caches
+from comparacao_canais import comparar_canais
+from historico_precos import GravadorHistorico, snapshot, snapshots_do_catalogo
+from instrumentacao import ativar as ativar_metricas, contar, medir, texto_prometheus
+from matriz_icms import INDICE_UF, TIPOS_CLIENTE
+from motor_precificacao import (
+    ErroPrecificacao,
+    calcular_preco,
+    custo_total_unitario,
+    perfil_canal,
+    perfil_tributos,
+    preco_equilibrio,
+    preco_para_lucro_liquido,
+)
+from precificacao_lote import COLUNAS_OBRIGATORIAS, PADROES, precificar_catalogo
+from vigencia import data_iso
+
+# Escritas de outros processos (importador, outra instância) aparecem em até 1s
+INTERVALO_SINCRONIZACAO = 1.0
+
+MAXIMO_ITENS_LOTE = 100_000
+
+COLUNAS_CUSTO = ('custo_aquisicao', 'ipi_nao_recuperavel', 'outros_custos',
+                 'credito_icms', 'credito_pis', 'credito_cofins')
+
+class ErroEntrada(ValueError):
+    """Requisição com campo ausente ou inválido"""
+
+historico = GravadorHistorico()
+
+log = logging.getLogger(__name__)
+
+# ============================================
+# CÁLCULO DE UM PRODUTO
+# ============================================
+
+def _numero(item, campo):
+    valor = item[campo]
+    if isinstance(valor, bool):
+        raise ErroEntrada(f"'{campo}' não é número: {valor!r}")
+    try:
+        numero = float(valor)
+    except (TypeError, ValueError, OverflowError):
+        raise ErroEntrada(f"'{campo}' não é número: {valor!r}") from None
+    # nan, inf e 1e400 passam pelo float() mas não pelo Decimal do motor
+    if not math.isfinite(numero):
+        raise ErroEntrada(f"'{campo}' não é número finito: {valor!r}")
+    return numero
+
+def precificar_item(dados):
+    """Preço e detalhamento de um produto (dicionário de entrada -> dicionário de saída)
+
+    Levanta ErroEntrada para campos ausentes, regras não cadastradas ou
+    percentuais que somam 100% ou mais.
+    """
+    if not isinstance(dados, dict):
+        raise ErroEntrada("O corpo deve ser um objeto JSON")
+    faltando = [c for c in COLUNAS_OBRIGATORIAS if dados.get(c) in (None, '')]
+    if faltando:
+        raise ErroEntrada(f"Campos obrigatórios ausentes: {', '.join(faltando)}")
+    cache = obter_cache()
+    item = {**PADROES, 'uf_origem': cache.uf_origem, **{c: v for c, v in dados.items() if v is not None}}
+    for campo in ('sku', 'nome'):
+        if not isinstance(item.get(campo, ''), str):
+            raise ErroEntrada(f"'{campo}' deve ser texto: {item[campo]!r}")
+
+    data = None
+    if item.get('data_referencia', '') != '':
+        try:
+            data = data_iso(str(item['data_referencia']))
+        except ValueError:
+            raise ErroEntrada(f"Data de referência inválida: {item['data_referencia']!r}") from None
+
+    ncm = str(item['ncm']).strip()
+    regra = cache.ncm(ncm, data)
+    if regra is None:
+        raise ErroEntrada(f"NCM não cadastrado: {ncm}")
+    taxas = cache.marketplace(str(item['marketplace']).strip(), data)
+    if taxas is None:
+        raise ErroEntrada(f"Marketplace não cadastrado: {item['marketplace']}")
+    uf_origem = str(item['uf_origem']).strip().upper()
+    uf_destino = str(item['uf_destino']).strip().upper()
+    if uf_origem not in INDICE_UF or uf_destino not in INDICE_UF:
+        raise ErroEntrada(f"UF inválida: {uf_origem} -> {uf_destino}")
+    if item['tipo_cliente'] not in TIPOS_CLIENTE:
+        raise ErroEntrada(f"Tipo de cliente inválido (use {' ou '.join(TIPOS_CLIENTE)})")
+
+    icms = cache.matriz_icms().efetivo(uf_origem, uf_destino, item['tipo_cliente'], data)
+    tributos = perfil_tributos(regra.aliquota_pis, regra.aliquota_cofins,
+                               icms.icms, icms.difal, icms.fcp)
+    canal = perfil_canal(taxas.comissao_padrao, taxas.taxa_fixa,
+                         taxas.taxa_antecipacao, taxas.taxa_gateway,
+                         cache.faixas(taxas.nome, ncm, data))
+    custo_total = custo_total_unitario(*(_numero(item, c) for c in COLUNAS_CUSTO))
+
+    try:
+        with medir('calculo_preco'):
+            resultado = calcular_preco(custo_total, _numero(item, 'margem_alvo'), tributos, canal)
+            equilibrio = preco_equilibrio(custo_total, tributos, canal).preco_venda
+    except ErroPrecificacao as erro:
+        raise ErroEntrada(str(erro)) from None
+    contar('calculos')
+
+    resposta = {campo: item[campo] for campo in ('sku', 'ncm') if campo in item}
+    if data:
+        resposta['data_referencia'] = data
+    resposta.update(
+        uf_origem=uf_origem,
+        uf_destino=uf_destino,
+        tipo_cliente=item['tipo_cliente'],
+        marketplace=taxas.nome,
+        margem_alvo=_numero(item, 'margem_alvo'),
+        nivel_ncm=len(regra.codigo),
+        rota_cadastrada=icms.rota_cadastrada,
+        aliquota_pis=regra.aliquota_pis,
+        aliquota_cofins=regra.aliquota_cofins,
+        aliquota_icms=icms.icms,
+        aliquota_difal=icms.difal,
+        aliquota_fcp=icms.fcp,
+        comissao=canal.na_faixa(resultado.preco_venda).taxas[0],
+        taxa_antecipacao=taxas.taxa_antecipacao,
+        taxa_gateway=taxas.taxa_gateway,
+    )
+    resposta.update((campo, round(float(valor), 2)) for campo, valor in resultado.como_dict().items())
+    resposta['preco_equilibrio'] = round(float(equilibrio), 2)
+    if 'lucro_liquido_alvo' in item:
+        alvo = preco_para_lucro_liquido(custo_total, _numero(item, 'lucro_liquido_alvo'), tributos, canal)
+        resposta['preco_lucro_alvo'] = round(float(alvo.preco_venda), 2)
+    return resposta
+
+def precificar_itens(itens):
+    """Lote de produtos pelo cálculo vetorizado; retorna o JSON da resposta já serializado"""
+    if not isinstance(itens, list) or not all(isinstance(i, dict) for i in itens):
+        raise ErroEntrada("'itens' deve ser uma lista de objetos")
+    if len(itens) > MAXIMO_ITENS_LOTE:
+        raise ErroEntrada(f"No máximo {MAXIMO_ITENS_LOTE} itens por requisição")
+    if not itens:
+        return '{"linhas": 0, "erros": 0, "itens": []}'
+    try:
+        with medir('calculo_lote'):
+            cache = obter_cache()
+            saida = precificar_catalogo(pd.DataFrame(itens), cache.tabelas(), cache.uf_origem)
+    except (ValueError, TypeError) as erro:
+        raise ErroEntrada(str(erro)) from None
+    contar('calculos', len(saida))
+    historico.adicionar(snapshots_do_catalogo(saida, 'api'))
+    erros = int((saida['erro'] != '').sum())
+    registros = saida.to_json(orient='records', force_ascii=False)
+    return f'{{"linhas": {len(saida)}, "erros": {erros}, "itens": {registros}}}'
+
+def comparar_item(dados):
+    """Comparação entre marketplaces (e UFs) de um produto; retorna o JSON já serializado"""
+    if not isinstance(dados, dict):
+        raise ErroEntrada("O corpo deve ser um objeto JSON")
+    dados = dict(dados)
+    marketplaces = dados.pop('marketplaces', None)
+    ufs = dados.pop('ufs_destino', None)
+    ufs = list(INDICE_UF) if ufs == 'todas' else ufs
+    faltando = [c for c in COLUNAS_OBRIGATORIAS if c not in ('uf_destino', 'marketplace')
+                and dados.get(c) in (None, '')]
+    if faltando:
+        raise ErroEntrada(f"Campos obrigatórios ausentes: {', '.join(faltando)}")
+    for nome, valor in (('marketplaces', marketplaces), ('ufs_destino', ufs)):
+        if valor is not None and not (isinstance(valor, list) and all(isinstance(v, str) for v in valor)):
+            raise ErroEntrada(f"'{nome}' deve ser uma lista de textos")
+    try:
+        with medir('comparar_canais'):
+            saida = comparar_canais(dados, marketplaces, ufs)
+    except (ValueError, TypeError) as erro:
+        raise ErroEntrada(str(erro)) from None
+    contar('calculos', len(saida))
+    registros = saida.to_json(orient='records', force_ascii=False)
+    return f'{{"linhas": {len(saida)}, "itens": {registros}}}'
+
+# ============================================
+# ROTAS
+# ============================================
+
+async def _corpo_json(request):
+    try:
+        return await request.json()
+    except (ValueError, UnicodeDecodeError):
+        raise ErroEntrada("Corpo da requisição não é JSON válido") from None
+
+def _empresa(request):
+    """CNPJ do cabeçalho X-Empresa (None sem o cabeçalho); ErroEntrada se não cadastrada"""
+    cnpj = request.headers.get('x-empresa')
+    if not cnpj:
+        return None
+    try:
+        cnpj = normalizar_cnpj(cnpj)
+    except ValueError as erro:
+        raise ErroEntrada(str(erro)) from None
+    if not os.path.exists(caminho_empresa(cnpj)):
+        raise ErroEntrada(f"Empresa não cadastrada: {cnpj}")
+    return cnpj
+
+def _na_empresa(cnpj, funcao, *args):
+    with usar_empresa(cnpj):
+        return funcao(*args)
+
+async def preco(request):
+    # Um item custa microssegundos: calcula no próprio loop, sem trocar de thread
+    cnpj = _empresa(request)
+    resposta = _na_empresa(cnpj, precificar_item, await _corpo_json(request))
+    historico.adicionar([snapshot(resposta, 'api', empresa=cnpj or '')])
+    return JSONResponse(resposta)
+
+async def preco_lote(request):
+    corpo = await _corpo_json(request)
+    if not isinstance(corpo, dict) or 'itens' not in corpo:
+        raise ErroEntrada("O corpo deve ser {\"itens\": [...]}")
+    # Lotes grandes levam milissegundos: fora do loop para não travar as outras requisições
+    conteudo = await run_in_threadpool(_na_empresa, _empresa(request), precificar_itens, corpo['itens'])
+    return Response(conteudo, media_type='application/json')
+
+async def preco_comparar(request):
+    conteudo = await run_in_threadpool(_na_empresa, _empresa(request), comparar_item,
+                                       await _corpo_json(request))
+    return Response(conteudo, media_type='application/json')
+
+async def saude(request):
+    cache = _na_empresa(_empresa(request), obter_cache)
+    return JSONResponse({'status': 'ok', **cache.estatisticas()})
+
+async def metricas(request):
+    # Totais deste processo (com --workers, cada processo tem os seus)
+    return Response(texto_prometheus(), media_type='text/plain; version=0.0.4')
+
+async def _erro_entrada(request, erro):
+    return JSONResponse({'erro': str(erro)}, status_code=422)
+
+async def _sincronizar_periodicamente():
+    while True:
+        await asyncio.sleep(INTERVALO_SINCRONIZACAO)
+        # Uma falha (banco ocupado, arquivo de empresa removido) não pode parar o ciclo
+        try:
+            await run_in_threadpool(sincronizar_caches)
+        except Exception:
+            log.exception("Falha ao sincronizar as regras")
+        try:
+            await run_in_threadpool(historico.descarregar)
+        except Exception:
+            log.exception("Falha ao gravar o histórico; os snapshots ficam para o próximo ciclo")
+
+@contextlib.asynccontextmanager
+async def _ciclo_de_vida(app):
+    inicializar_banco()
+    cache = obter_cache()
+    cache.sincronizar()
+    cache.tabelas()
+    tarefa = asyncio.create_task(_sincronizar_periodicamente())
+    try:
+        yield
+    finally:
+        tarefa.cancel()
+        historico.descarregar()
+
+app = Starlette(
+    routes=[
+        Route('/saude', saude, methods=['GET']),
+        Route('/metrics', metricas, methods=['GET']),
+        Route('/preco', preco, methods=['POST']),
+        Route('/preco/lote', preco_lote, methods=['POST']),
+        Route('/preco/comparar', preco_comparar, methods=['POST']),
+    ],
+    exception_handlers={ErroEntrada: _erro_entrada},
+    lifespan=_ciclo_de_vida,
+)
+
+# ============================================
+# LINHA DE COMANDO
+# ============================================
+
+def main(argv=None):
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="API HTTP de precificação")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--porta', type=int, default=8000)
+    parser.add_argument('--banco', help="caminho do banco de regras (padrão: PRECIFICADOR_DB)")
+    parser.add_argument('--regras',
+                        help="snapshot das regras compartilhado pelos workers (PRECIFICADOR_REGRAS)")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="processos servindo a API (cada um com seu cache de regras)")
+    parser.add_argument('--metricas', action='store_true',
+                        help="mede etapas e contadores para GET /metrics (PRECIFICADOR_METRICAS=1)")
+    args = parser.parse_args(argv)
+
+    if args.banco:
+        os.environ['PRECIFICADOR_DB'] = args.banco
+    if args.regras:
+        os.environ['PRECIFICADOR_REGRAS'] = args.regras
+    if args.metricas:
+        # Pelo ambiente, para valer também nos processos dos workers
+        os.environ['PRECIFICADOR_METRICAS'] = '1'
+        ativar_metricas()
+    uvicorn.run('api_precificacao:app', host=args.host, port=args.porta,
+                workers=args.workers, access_log=False)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
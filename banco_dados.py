@@ -0,0 +1,705 @@
+"""
+Camada de Acesso ao Banco de Regras Tributárias
+
+Pool de conexões SQLite compartilhado pelo processo inteiro (threads de
+script do Streamlit, lote, API). O caminho do banco vem da variável de
+ambiente PRECIFICADOR_DB (padrão: regras_tributarias.db).
+
+Cada empresa (CNPJ) tem uma camada com as suas exceções em um banco próprio,
+PRECIFICADOR_EMPRESAS/<cnpj>.db, sobre as regras do banco compartilhado. A
+empresa ativa vale para o contexto atual (thread ou tarefa: usar_empresa) e
+as escritas de regras vão para a camada dela (caminho_regras).
+"""
+
+import os
+import queue
+import re
+import sqlite3
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from instrumentacao import ativa as instrumentacao_ativa, contar_consulta
+
+CAMINHO_BANCO_PADRAO = 'regras_tributarias.db'
+
+# Cada sessão do Streamlit roda o script em uma thread própria; o pool cresce
+# até este limite e, esgotado, a thread espera uma conexão ser devolvida.
+TAMANHO_POOL_PADRAO = int(os.environ.get('PRECIFICADOR_DB_POOL', '8'))
+
+# Statements preparados mantidos por conexão (cache do módulo sqlite3)
+STATEMENTS_EM_CACHE = 256
+
+# ============================================
+# POOL DE CONEXÕES
+# ============================================
+
+def caminho_banco():
+    """Caminho do banco configurado para o processo"""
+    return os.environ.get('PRECIFICADOR_DB', CAMINHO_BANCO_PADRAO)
+
+class PoolConexoes:
+    """Pool thread-safe de conexões SQLite em modo WAL"""
+    
+    def __init__(self, caminho, tamanho=TAMANHO_POOL_PADRAO):
+        self.caminho = caminho
+        self.tamanho = tamanho
+        self._livres = queue.LifoQueue()
+        self._abertas = 0
+        # Transações de escrita confirmadas por este processo (sem I/O para consultar)
+        self.escritas = 0
+        self._lock = threading.Lock()
+    
+    def _abrir(self):
+        # isolation_level=None: leituras em autocommit, escritas usam BEGIN IMMEDIATE
+        conn = sqlite3.connect(self.caminho, timeout=30.0, isolation_level=None,
+                               check_same_thread=False,
+                               cached_statements=STATEMENTS_EM_CACHE)
+        conn.execute('PRAGMA journal_mode = WAL')
+        conn.execute('PRAGMA synchronous = NORMAL')
+        conn.execute('PRAGMA busy_timeout = 30000')
+        return conn
+    
+    def _obter(self):
+        try:
+            return self._livres.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._abertas < self.tamanho:
+                self._abertas += 1
+                criar = True
+            else:
+                criar = False
+        if not criar:
+            return self._livres.get()
+        try:
+            return self._abrir()
+        except Exception:
+            with self._lock:
+                self._abertas -= 1
+            raise
+    
+    @contextmanager
+    def conexao(self):
+        """Empresta uma conexão do pool"""
+        conn = self._obter()
+        # Com instrumentação, conta cada instrução executada enquanto emprestada
+        rastrear = instrumentacao_ativa()
+        if rastrear:
+            conn.set_trace_callback(contar_consulta)
+        try:
+            yield conn
+        finally:
+            if conn.in_transaction:
+                conn.rollback()
+            if rastrear:
+                conn.set_trace_callback(None)
+            self._livres.put(conn)
+    
+    @contextmanager
+    def transacao(self):
+        """Conexão com transação de escrita (BEGIN IMMEDIATE ... COMMIT)"""
+        with self.conexao() as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                yield conn
+            except BaseException:
+                conn.rollback()
+                raise
+            conn.commit()
+            self.escritas += 1
+    
+    def fechar(self):
+        """Fecha as conexões ociosas do pool"""
+        while True:
+            try:
+                conn = self._livres.get_nowait()
+            except queue.Empty:
+                break
+            conn.close()
+            with self._lock:
+                self._abertas -= 1
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+def obter_pool(caminho=None):
+    """Pool do processo para o banco informado (ou o configurado)"""
+    caminho = os.path.abspath(caminho or caminho_banco())
+    pool = _pools.get(caminho)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.setdefault(caminho, PoolConexoes(caminho))
+    return pool
+
+# ============================================
+# EMPRESAS (CAMADAS DE REGRAS)
+# ============================================
+
+DIRETORIO_EMPRESAS_PADRAO = 'empresas'
+
+_empresa_ativa = ContextVar('empresa_ativa', default=None)
+
+def normalizar_cnpj(cnpj):
+    """CNPJ só com os 14 dígitos; ValueError se inválido"""
+    digitos = re.sub(r'[.\-/\s]', '', str(cnpj))
+    if len(digitos) != 14 or not digitos.isdigit():
+        raise ValueError(f"CNPJ inválido: {cnpj!r}")
+    return digitos
+
+def diretorio_empresas():
+    """Diretório com os bancos das empresas (PRECIFICADOR_EMPRESAS)"""
+    return os.environ.get('PRECIFICADOR_EMPRESAS', DIRETORIO_EMPRESAS_PADRAO)
+
+def caminho_empresa(cnpj):
+    """Banco da camada de regras da empresa"""
+    return os.path.join(diretorio_empresas(), f'{normalizar_cnpj(cnpj)}.db')
+
+def empresa_ativa():
+    """CNPJ da empresa ativa no contexto atual (None = só as regras compartilhadas)"""
+    return _empresa_ativa.get()
+
+def definir_empresa(cnpj):
+    """Ativa a empresa no contexto atual (None desativa); a camada precisa existir"""
+    if cnpj is not None:
+        cnpj = normalizar_cnpj(cnpj)
+        if not os.path.exists(caminho_empresa(cnpj)):
+            raise ValueError(f"Empresa não cadastrada: {cnpj}")
+    _empresa_ativa.set(cnpj)
+
+@contextmanager
+def usar_empresa(cnpj):
+    """Ativa a empresa (None = nenhuma) dentro do bloco"""
+    anterior = _empresa_ativa.get()
+    definir_empresa(cnpj)
+    try:
+        yield
+    finally:
+        _empresa_ativa.set(anterior)
+
+def caminho_regras():
+    """Banco que recebe as escritas de regras: a camada da empresa ativa ou o compartilhado"""
+    cnpj = _empresa_ativa.get()
+    return caminho_empresa(cnpj) if cnpj else caminho_banco()
+
+def conexao(caminho=None):
+    """Atalho para obter_pool(caminho).conexao()"""
+    return obter_pool(caminho).conexao()
+
+def transacao(caminho=None):
+    """Atalho para obter_pool(caminho).transacao()"""
+    return obter_pool(caminho).transacao()
+
+# ============================================
+# SCHEMA E MIGRAÇÕES
+# ============================================
+
+# Versão do schema gravada em PRAGMA user_version. Cada migração leva o banco
+# da versão i para i+1; a carga das regras padrão só roda quando a versão muda.
+def _migracao_v1(c):
+    """Cria as tabelas e garante uma única linha por rota de ICMS"""
+    
+    # Tabela de NCMs
+    c.execute('''CREATE TABLE IF NOT EXISTS ncm (
+        codigo TEXT PRIMARY KEY,
+        descricao TEXT,
+        aliquota_pis REAL DEFAULT 1.65,
+        aliquota_cofins REAL DEFAULT 7.60,
+        aliquota_ipi REAL DEFAULT 0.0,
+        gera_credito_pis INTEGER DEFAULT 1,
+        gera_credito_cofins INTEGER DEFAULT 1,
+        gera_credito_icms INTEGER DEFAULT 1,
+        observacoes TEXT
+    )''')
+    
+    # Tabela de ICMS por UF
+    c.execute('''CREATE TABLE IF NOT EXISTS icms_uf (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        uf_origem TEXT,
+        uf_destino TEXT,
+        aliquota_interna REAL,
+        aliquota_interestadual REAL,
+        aliquota_fcp REAL DEFAULT 0.0,
+        calcula_difal INTEGER DEFAULT 0
+    )''')
+    
+    # Tabela de Marketplaces
+    c.execute('''CREATE TABLE IF NOT EXISTS marketplace (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        nome TEXT UNIQUE,
+        comissao_padrao REAL,
+        taxa_fixa REAL DEFAULT 0.0,
+        taxa_antecipacao REAL DEFAULT 0.0,
+        taxa_gateway REAL DEFAULT 0.0,
+        ativo INTEGER DEFAULT 1
+    )''')
+    
+    # Tabela de Produtos (histórico de custos)
+    c.execute('''CREATE TABLE IF NOT EXISTS produto (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        nome TEXT,
+        ncm TEXT,
+        custo_total REAL,
+        data_cadastro TEXT,
+        FOREIGN KEY (ncm) REFERENCES ncm(codigo)
+    )''')
+    
+    # Bancos antigos acumularam rotas duplicadas a cada rerun: mantém a primeira
+    c.execute('''DELETE FROM icms_uf WHERE id NOT IN (
+        SELECT MIN(id) FROM icms_uf GROUP BY uf_origem, uf_destino
+    )''')
+    c.execute('''CREATE UNIQUE INDEX IF NOT EXISTS idx_icms_uf_rota
+        ON icms_uf (uf_origem, uf_destino)''')
+
+TABELAS_REGRAS = ('ncm', 'icms_uf', 'marketplace')
+
+def _criar_gatilhos_geracao(c, tabela):
+    for evento in ('INSERT', 'UPDATE', 'DELETE'):
+        c.execute(f'''CREATE TRIGGER IF NOT EXISTS trg_{tabela}_{evento.lower()}_geracao
+            AFTER {evento} ON {tabela}
+            BEGIN
+                UPDATE regras_geracao SET geracao = geracao + 1 WHERE id = 1;
+            END''')
+
+def _migracao_v2(c):
+    """Contador de geração das regras, incrementado por gatilhos a cada escrita"""
+    
+    c.execute('''CREATE TABLE IF NOT EXISTS regras_geracao (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        geracao INTEGER NOT NULL
+    )''')
+    c.execute('INSERT OR IGNORE INTO regras_geracao (id, geracao) VALUES (1, 0)')
+    
+    # Gatilhos também pegam edições feitas fora do app (ex.: SQLite Browser)
+    for tabela in TABELAS_REGRAS:
+        _criar_gatilhos_geracao(c, tabela)
+
+def _migracao_v3(c):
+    """Produtos por SKU e histórico de preços calculados (snapshots)"""
+    
+    c.execute('ALTER TABLE produto ADD COLUMN sku TEXT')
+    c.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_produto_sku ON produto (sku)')
+    
+    # Um snapshot por preço calculado: entradas, alíquotas resolvidas e resultado
+    c.execute('''CREATE TABLE IF NOT EXISTS preco_snapshot (
+        id INTEGER PRIMARY KEY,
+        data TEXT NOT NULL,
+        origem TEXT NOT NULL,
+        sku TEXT,
+        nome TEXT,
+        ncm TEXT NOT NULL,
+        uf_origem TEXT NOT NULL,
+        uf_destino TEXT NOT NULL,
+        tipo_cliente TEXT NOT NULL,
+        marketplace TEXT NOT NULL,
+        custo_total REAL,
+        margem_alvo REAL,
+        aliquota_pis REAL,
+        aliquota_cofins REAL,
+        aliquota_icms REAL,
+        aliquota_difal REAL,
+        aliquota_fcp REAL,
+        comissao REAL,
+        taxa_fixa REAL,
+        taxa_antecipacao REAL,
+        taxa_gateway REAL,
+        preco_venda REAL,
+        total_tributos REAL,
+        total_custos_canal REAL,
+        margem_contribuicao REAL,
+        lucro_liquido REAL,
+        lucro_liquido_pct REAL,
+        preco_equilibrio REAL
+    )''')
+    c.execute('''CREATE INDEX IF NOT EXISTS idx_preco_snapshot_regras
+        ON preco_snapshot (ncm, marketplace, uf_destino, data)''')
+    c.execute('''CREATE INDEX IF NOT EXISTS idx_preco_snapshot_sku
+        ON preco_snapshot (sku, marketplace, data)''')
+    
+    # Último snapshot de cada SKU por canal: a consulta "preço atual" não varre
+    # o histórico. Atualizada por historico_precos a cada gravação.
+    c.execute('''CREATE TABLE IF NOT EXISTS preco_atual (
+        sku TEXT NOT NULL,
+        marketplace TEXT NOT NULL,
+        uf_destino TEXT NOT NULL,
+        tipo_cliente TEXT NOT NULL,
+        snapshot_id INTEGER NOT NULL,
+        PRIMARY KEY (sku, marketplace, uf_destino, tipo_cliente)
+    ) WITHOUT ROWID''')
+
+# Por tabela de regras: expressão da chave e colunas que afetam o preço
+CHAVES_ALTERACAO = {
+    'ncm': ("{r}.codigo", ('codigo', 'aliquota_pis', 'aliquota_cofins', 'aliquota_ipi')),
+    'icms_uf': ("{r}.uf_origem || '-' || {r}.uf_destino",
+                ('uf_origem', 'uf_destino', 'aliquota_interna', 'aliquota_interestadual',
+                 'aliquota_fcp', 'calcula_difal')),
+    'marketplace': ("{r}.nome", ('nome', 'comissao_padrao', 'taxa_fixa', 'taxa_antecipacao',
+                                 'taxa_gateway')),
+}
+
+def _criar_gatilhos_alteracao(c, tabela, chave, colunas, registro=None):
+    # UPDATE só registra se alguma coluna de preço mudou (o upsert do
+    # importador reescreve linhas iguais); troca de chave registra as duas.
+    # `registro`: tabela de regras registrada, se não for a própria
+    registro = registro or tabela
+    antes = ', '.join(f'OLD.{col}' for col in colunas)
+    depois = ', '.join(f'NEW.{col}' for col in colunas)
+    c.execute(f'''CREATE TRIGGER IF NOT EXISTS trg_{tabela}_insert_alteracao
+        AFTER INSERT ON {tabela}
+        BEGIN
+            INSERT INTO regras_alteracao (tabela, chave) VALUES ('{registro}', {chave.format(r='NEW')});
+        END''')
+    c.execute(f'''CREATE TRIGGER IF NOT EXISTS trg_{tabela}_update_alteracao
+        AFTER UPDATE ON {tabela} WHEN ({antes}) IS NOT ({depois})
+        BEGIN
+            INSERT INTO regras_alteracao (tabela, chave) VALUES ('{registro}', {chave.format(r='OLD')});
+            INSERT INTO regras_alteracao (tabela, chave)
+                SELECT '{registro}', {chave.format(r='NEW')}
+                WHERE {chave.format(r='NEW')} IS NOT {chave.format(r='OLD')};
+        END''')
+    c.execute(f'''CREATE TRIGGER IF NOT EXISTS trg_{tabela}_delete_alteracao
+        AFTER DELETE ON {tabela}
+        BEGIN
+            INSERT INTO regras_alteracao (tabela, chave) VALUES ('{registro}', {chave.format(r='OLD')});
+        END''')
+
+def _migracao_v4(c):
+    """Registro das regras alteradas e índice dos preços atuais por regra usada"""
+    
+    c.execute('''CREATE TABLE IF NOT EXISTS regras_alteracao (
+        id INTEGER PRIMARY KEY,
+        tabela TEXT NOT NULL,
+        chave TEXT NOT NULL,
+        data TEXT NOT NULL DEFAULT (datetime('now', 'localtime'))
+    )''')
+    # Até qual alteração os preços atuais já foram recalculados
+    c.execute('''CREATE TABLE IF NOT EXISTS reprecificacao (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        ultima_alteracao INTEGER NOT NULL
+    )''')
+    c.execute('INSERT OR IGNORE INTO reprecificacao (id, ultima_alteracao) VALUES (1, 0)')
+    
+    for tabela, (chave, colunas) in CHAVES_ALTERACAO.items():
+        _criar_gatilhos_alteracao(c, tabela, chave, colunas)
+    
+    # Regras de que cada preço atual depende: NCM, rota (origem, destino) e marketplace
+    c.execute('ALTER TABLE preco_atual ADD COLUMN ncm TEXT')
+    c.execute('ALTER TABLE preco_atual ADD COLUMN uf_origem TEXT')
+    c.execute('''UPDATE preco_atual SET
+        ncm = (SELECT s.ncm FROM preco_snapshot s WHERE s.id = preco_atual.snapshot_id),
+        uf_origem = (SELECT s.uf_origem FROM preco_snapshot s WHERE s.id = preco_atual.snapshot_id)''')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_preco_atual_ncm ON preco_atual (ncm)')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_preco_atual_rota ON preco_atual (uf_origem, uf_destino)')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_preco_atual_marketplace ON preco_atual (marketplace)')
+
+COLUNAS_VIGENCIA = """
+        vigencia_inicio TEXT NOT NULL DEFAULT '0001-01-01',
+        vigencia_fim TEXT NOT NULL DEFAULT '9999-12-31'"""
+
+def _migracao_v5(c):
+    """Vigência (início e fim) em cada linha de regra: várias versões por chave"""
+    
+    # ncm (chave primária codigo) e marketplace (nome UNIQUE) precisam ser
+    # recriadas para aceitar uma linha por vigência; os gatilhos vão junto.
+    # produto.ncm segue referenciando ncm(codigo), sem PRAGMA foreign_keys.
+    c.execute(f'''CREATE TABLE ncm_vigencias (
+        id INTEGER PRIMARY KEY,
+        codigo TEXT NOT NULL,
+        descricao TEXT,
+        aliquota_pis REAL DEFAULT 1.65,
+        aliquota_cofins REAL DEFAULT 7.60,
+        aliquota_ipi REAL DEFAULT 0.0,
+        gera_credito_pis INTEGER DEFAULT 1,
+        gera_credito_cofins INTEGER DEFAULT 1,
+        gera_credito_icms INTEGER DEFAULT 1,
+        observacoes TEXT,{COLUNAS_VIGENCIA}
+    )''')
+    c.execute('''INSERT INTO ncm_vigencias
+        (codigo, descricao, aliquota_pis, aliquota_cofins, aliquota_ipi,
+         gera_credito_pis, gera_credito_cofins, gera_credito_icms, observacoes)
+        SELECT codigo, descricao, aliquota_pis, aliquota_cofins, aliquota_ipi,
+               gera_credito_pis, gera_credito_cofins, gera_credito_icms, observacoes
+        FROM ncm ORDER BY codigo''')
+    c.execute('DROP TABLE ncm')
+    c.execute('ALTER TABLE ncm_vigencias RENAME TO ncm')
+    
+    c.execute(f'''CREATE TABLE marketplace_vigencias (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        nome TEXT NOT NULL,
+        comissao_padrao REAL,
+        taxa_fixa REAL DEFAULT 0.0,
+        taxa_antecipacao REAL DEFAULT 0.0,
+        taxa_gateway REAL DEFAULT 0.0,
+        ativo INTEGER DEFAULT 1,{COLUNAS_VIGENCIA}
+    )''')
+    c.execute('''INSERT INTO marketplace_vigencias
+        (id, nome, comissao_padrao, taxa_fixa, taxa_antecipacao, taxa_gateway, ativo)
+        SELECT id, nome, comissao_padrao, taxa_fixa, taxa_antecipacao, taxa_gateway, ativo
+        FROM marketplace''')
+    c.execute('DROP TABLE marketplace')
+    c.execute('ALTER TABLE marketplace_vigencias RENAME TO marketplace')
+    
+    c.execute("ALTER TABLE icms_uf ADD COLUMN vigencia_inicio TEXT NOT NULL DEFAULT '0001-01-01'")
+    c.execute("ALTER TABLE icms_uf ADD COLUMN vigencia_fim TEXT NOT NULL DEFAULT '9999-12-31'")
+    c.execute('DROP INDEX IF EXISTS idx_icms_uf_rota')
+    
+    # Índice de intervalo: (chave, início) acha a versão vigente numa busca só
+    # (última com início <= data) e é o alvo dos upserts
+    c.execute('CREATE UNIQUE INDEX idx_ncm_vigencia ON ncm (codigo, vigencia_inicio)')
+    c.execute('''CREATE UNIQUE INDEX idx_icms_uf_vigencia
+        ON icms_uf (uf_origem, uf_destino, vigencia_inicio)''')
+    c.execute('CREATE UNIQUE INDEX idx_marketplace_vigencia ON marketplace (nome, vigencia_inicio)')
+    
+    # Mudança de vigência também desatualiza preços
+    for tabela, (chave, colunas) in CHAVES_ALTERACAO.items():
+        for evento in ('insert', 'update', 'delete'):
+            c.execute(f'DROP TRIGGER IF EXISTS trg_{tabela}_{evento}_alteracao')
+        _criar_gatilhos_geracao(c, tabela)
+        _criar_gatilhos_alteracao(c, tabela, chave, colunas + ('vigencia_inicio', 'vigencia_fim'))
+    
+    # Data de referência (as-of) usada no cálculo; vazia = data do cálculo
+    c.execute('ALTER TABLE preco_snapshot ADD COLUMN data_referencia TEXT')
+
+def _migracao_v6(c):
+    """Índice de texto (FTS5) das descrições de NCM, sem acentos"""
+    
+    # Conteúdo externo: o índice guarda só os termos, o texto fica em ncm
+    c.execute('''CREATE VIRTUAL TABLE ncm_busca USING fts5(
+        descricao, content='ncm', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    )''')
+    c.execute("INSERT INTO ncm_busca (ncm_busca) VALUES ('rebuild')")
+    c.execute('''CREATE TRIGGER trg_ncm_insert_busca AFTER INSERT ON ncm
+        BEGIN
+            INSERT INTO ncm_busca (rowid, descricao) VALUES (NEW.id, NEW.descricao);
+        END''')
+    c.execute('''CREATE TRIGGER trg_ncm_update_busca AFTER UPDATE OF descricao ON ncm
+        BEGIN
+            INSERT INTO ncm_busca (ncm_busca, rowid, descricao) VALUES ('delete', OLD.id, OLD.descricao);
+            INSERT INTO ncm_busca (rowid, descricao) VALUES (NEW.id, NEW.descricao);
+        END''')
+    c.execute('''CREATE TRIGGER trg_ncm_delete_busca AFTER DELETE ON ncm
+        BEGIN
+            INSERT INTO ncm_busca (ncm_busca, rowid, descricao) VALUES ('delete', OLD.id, OLD.descricao);
+        END''')
+
+def _migracao_v7(c):
+    """Taxas do marketplace por faixa de preço (e categoria de NCM)"""
+    
+    # Cada linha abre uma faixa em preco_minimo, que vai até o mínimo seguinte
+    # da mesma tabela (marketplace, categoria, vigência); abaixo da primeira
+    # valem comissao_padrao e taxa_fixa do marketplace. categoria é um prefixo
+    # de NCM (2, 4, 6 ou 8 dígitos; vazia = todos): vale a mais longa.
+    c.execute(f'''CREATE TABLE marketplace_faixa (
+        id INTEGER PRIMARY KEY,
+        marketplace TEXT NOT NULL,
+        categoria TEXT NOT NULL DEFAULT '',
+        preco_minimo REAL NOT NULL DEFAULT 0.0,
+        comissao REAL NOT NULL,
+        taxa_fixa REAL NOT NULL DEFAULT 0.0,{COLUNAS_VIGENCIA}
+    )''')
+    c.execute('''CREATE UNIQUE INDEX idx_marketplace_faixa
+        ON marketplace_faixa (marketplace, categoria, vigencia_inicio, preco_minimo)''')
+    
+    # Faixa alterada = marketplace alterado (cache e reprecificação)
+    _criar_gatilhos_geracao(c, 'marketplace_faixa')
+    _criar_gatilhos_alteracao(c, 'marketplace_faixa', "{r}.marketplace",
+                              ('marketplace', 'categoria', 'preco_minimo', 'comissao', 'taxa_fixa',
+                               'vigencia_inicio', 'vigencia_fim'), registro='marketplace')
+
+def _migracao_v8(c):
+    """Índices das ordenações da consulta paginada (consulta_regras)"""
+    
+    # A chave de cada ordenação é o índice inteiro: a página seguinte começa
+    # numa busca no índice (keyset), sem OFFSET. Descrição vazia = ''.
+    c.execute('''CREATE INDEX idx_ncm_descricao
+        ON ncm (ifnull(descricao, ''), codigo, vigencia_inicio)''')
+    c.execute('''CREATE INDEX idx_icms_uf_destino
+        ON icms_uf (uf_destino, uf_origem, vigencia_inicio)''')
+
+def _migracao_v9(c):
+    """Dados da empresa nas camadas de regras por CNPJ"""
+    
+    # Só a camada de uma empresa tem a linha; no banco compartilhado fica vazia
+    c.execute('''CREATE TABLE empresa (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        cnpj TEXT NOT NULL,
+        nome TEXT NOT NULL,
+        uf_origem TEXT NOT NULL DEFAULT 'SP'
+    )''')
+    _criar_gatilhos_geracao(c, 'empresa')
+
+def _migracao_v10(c):
+    """Empresa (CNPJ) de cada preço calculado; o preço atual passa a ser por empresa"""
+    
+    # '' = calculado com as regras compartilhadas, sem empresa
+    c.execute("ALTER TABLE preco_snapshot ADD COLUMN empresa TEXT NOT NULL DEFAULT ''")
+    
+    # A chave primária muda: preco_atual é recriada com a empresa na frente
+    c.execute('''CREATE TABLE preco_atual_nova (
+        empresa TEXT NOT NULL DEFAULT '',
+        sku TEXT NOT NULL,
+        marketplace TEXT NOT NULL,
+        uf_destino TEXT NOT NULL,
+        tipo_cliente TEXT NOT NULL,
+        snapshot_id INTEGER NOT NULL,
+        ncm TEXT,
+        uf_origem TEXT,
+        PRIMARY KEY (empresa, sku, marketplace, uf_destino, tipo_cliente)
+    ) WITHOUT ROWID''')
+    c.execute('''INSERT INTO preco_atual_nova
+        (sku, marketplace, uf_destino, tipo_cliente, snapshot_id, ncm, uf_origem)
+        SELECT sku, marketplace, uf_destino, tipo_cliente, snapshot_id, ncm, uf_origem FROM preco_atual''')
+    c.execute('DROP TABLE preco_atual')
+    c.execute('ALTER TABLE preco_atual_nova RENAME TO preco_atual')
+    # Com snapshot_id, os índices cobrem a busca dos afetados: sem ele, o SQLite
+    # prefere a chave primária (empresa=?) e varre todos os preços da empresa
+    c.execute('CREATE INDEX idx_preco_atual_ncm ON preco_atual (empresa, ncm, snapshot_id)')
+    c.execute('CREATE INDEX idx_preco_atual_rota ON preco_atual (empresa, uf_origem, uf_destino, snapshot_id)')
+    c.execute('CREATE INDEX idx_preco_atual_marketplace ON preco_atual (empresa, marketplace, snapshot_id)')
+    # Na camada de uma empresa: até qual alteração do banco compartilhado os
+    # preços dela já foram recalculados (o marco da própria camada é ultima_alteracao)
+    c.execute('ALTER TABLE reprecificacao ADD COLUMN ultima_alteracao_compartilhada INTEGER NOT NULL DEFAULT 0')
+
+MIGRACOES = [_migracao_v1, _migracao_v2, _migracao_v3, _migracao_v4, _migracao_v5, _migracao_v6,
+             _migracao_v7, _migracao_v8, _migracao_v9, _migracao_v10]
+VERSAO_SCHEMA = len(MIGRACOES)
+
+def _popular_regras_padrao(c):
+    """Insere as regras tributárias padrão que ainda não existem"""
+    
+    # Inserir NCMs comuns (exemplos)
+    ncms_exemplo = [
+        ('85171231', 'Smartphones', 1.65, 7.60, 0.0, 1, 1, 1, 'Eletrônicos importados'),
+        ('64022000', 'Calçados', 1.65, 7.60, 0.0, 1, 1, 1, 'Calçados diversos'),
+        ('61091000', 'Camisetas de algodão', 1.65, 7.60, 0.0, 1, 1, 1, 'Vestuário'),
+        ('84713012', 'Notebooks', 1.65, 7.60, 0.0, 1, 1, 1, 'Informática'),
+        ('33049900', 'Cosméticos', 1.65, 7.60, 0.0, 1, 1, 1, 'Beleza'),
+        ('94036000', 'Móveis de madeira', 1.65, 7.60, 0.0, 1, 1, 1, 'Móveis'),
+        ('39269090', 'Produtos de plástico', 1.65, 7.60, 0.0, 1, 1, 1, 'Plásticos'),
+        ('73269090', 'Produtos de ferro', 1.65, 7.60, 0.0, 1, 1, 1, 'Metais'),
+    ]
+    
+    c.executemany('''INSERT OR IGNORE INTO ncm 
+        (codigo, descricao, aliquota_pis, aliquota_cofins, aliquota_ipi, 
+         gera_credito_pis, gera_credito_cofins, gera_credito_icms, observacoes) 
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)''', ncms_exemplo)
+    
+    # Inserir ICMS por UF (principais rotas)
+    # Formato: (uf_origem, uf_destino, aliq_interna, aliq_inter, fcp, calcula_difal)
+    icms_dados = [
+        # SP
+        ('SP', 'SP', 18.0, 18.0, 0.0, 0),
+        ('SP', 'RJ', 18.0, 12.0, 2.0, 1),
+        ('SP', 'MG', 18.0, 12.0, 2.0, 1),
+        ('SP', 'RS', 18.0, 12.0, 2.0, 1),
+        ('SP', 'BA', 18.0, 7.0, 2.0, 1),
+        ('SP', 'PR', 18.0, 12.0, 2.0, 1),
+        ('SP', 'SC', 18.0, 12.0, 2.0, 1),
+        ('SP', 'PE', 18.0, 7.0, 2.0, 1),
+        ('SP', 'CE', 18.0, 7.0, 2.0, 1),
+        ('SP', 'GO', 18.0, 12.0, 2.0, 1),
+        ('SP', 'AM', 18.0, 7.0, 2.0, 1),
+        ('SP', 'DF', 18.0, 12.0, 2.0, 1),
+        
+        # RJ
+        ('RJ', 'RJ', 18.0, 18.0, 2.0, 0),
+        ('RJ', 'SP', 18.0, 12.0, 0.0, 1),
+        ('RJ', 'MG', 18.0, 12.0, 2.0, 1),
+        ('RJ', 'RS', 18.0, 12.0, 2.0, 1),
+        ('RJ', 'BA', 18.0, 7.0, 2.0, 1),
+        
+        # MG
+        ('MG', 'MG', 18.0, 18.0, 2.0, 0),
+        ('MG', 'SP', 18.0, 12.0, 0.0, 1),
+        ('MG', 'RJ', 18.0, 12.0, 2.0, 1),
+        ('MG', 'RS', 18.0, 12.0, 2.0, 1),
+        
+        # RS
+        ('RS', 'RS', 18.0, 18.0, 2.0, 0),
+        ('RS', 'SP', 18.0, 12.0, 0.0, 1),
+        ('RS', 'SC', 18.0, 12.0, 2.0, 1),
+        ('RS', 'PR', 18.0, 12.0, 2.0, 1),
+        
+        # BA
+        ('BA', 'BA', 18.0, 18.0, 2.0, 0),
+        ('BA', 'SP', 18.0, 7.0, 0.0, 1),
+        ('BA', 'RJ', 18.0, 7.0, 2.0, 1),
+    ]
+    
+    c.executemany('''INSERT OR IGNORE INTO icms_uf 
+        (uf_origem, uf_destino, aliquota_interna, aliquota_interestadual, aliquota_fcp, calcula_difal) 
+        VALUES (?, ?, ?, ?, ?, ?)''', icms_dados)
+    
+    # Inserir Marketplaces
+    marketplaces = [
+        ('Mercado Livre', 16.0, 5.0, 2.5, 2.5, 1),
+        ('Shopee', 14.0, 0.0, 2.0, 2.0, 1),
+        ('Amazon', 15.0, 0.0, 2.5, 2.5, 1),
+        ('Magalu', 18.0, 0.0, 2.0, 2.0, 1),
+        ('Venda Direta', 0.0, 0.0, 0.0, 0.0, 1),
+    ]
+    
+    c.executemany('''INSERT OR IGNORE INTO marketplace 
+        (nome, comissao_padrao, taxa_fixa, taxa_antecipacao, taxa_gateway, ativo) 
+        VALUES (?, ?, ?, ?, ?, ?)''', marketplaces)
+
+_inicializados = set()
+_inicializacao_lock = threading.Lock()
+
+def inicializar_banco(caminho=None, regras_padrao=True):
+    """Cria, migra e popula o banco de dados com regras tributárias (uma vez por processo)
+
+    Sem `regras_padrao` (camada de uma empresa), o banco nasce sem regras; as
+    camadas nunca recebem as regras padrão, nem em migrações futuras.
+    """
+    
+    pool = obter_pool(caminho)
+    if pool.caminho in _inicializados:
+        return VERSAO_SCHEMA
+    
+    with _inicializacao_lock:
+        if pool.caminho in _inicializados:
+            return VERSAO_SCHEMA
+        
+        with pool.conexao() as conn:
+            versao = conn.execute('PRAGMA user_version').fetchone()[0]
+        if versao < VERSAO_SCHEMA:
+            # BEGIN IMMEDIATE serializa processos que sobem ao mesmo tempo
+            with pool.transacao() as conn:
+                c = conn.cursor()
+                versao = c.execute('PRAGMA user_version').fetchone()[0]
+                for migracao in MIGRACOES[versao:]:
+                    migracao(c)
+                camada = c.execute('SELECT COUNT(*) FROM empresa').fetchone()[0] > 0
+                if versao < VERSAO_SCHEMA and regras_padrao and not camada:
+                    antes = c.execute('SELECT COALESCE(MAX(id), 0) FROM regras_alteracao').fetchone()[0]
+                    _popular_regras_padrao(c)
+                    # Regras padrão não desatualizam nenhum preço já calculado; alterações
+                    # pendentes de antes da migração continuam pendentes
+                    c.execute('''UPDATE reprecificacao SET ultima_alteracao =
+                        (SELECT COALESCE(MAX(id), 0) FROM regras_alteracao)
+                        WHERE ultima_alteracao = ?''', (antes,))
+                c.execute(f'PRAGMA user_version = {VERSAO_SCHEMA}')
+        
+        _inicializados.add(pool.caminho)
+    return VERSAO_SCHEMA
+
+# ============================================
+# LEITURA E ESCRITA DAS REGRAS
+# ============================================
+
+def ler_geracao(conn):
+    """Geração atual das regras tributárias"""
+    return conn.execute('SELECT geracao FROM regras_geracao WHERE id = 1').fetchone()[0]
+
+def cadastrar_ncm_customizado(codigo, descricao, pis, cofins, ipi):
+    """Cadastra um NCM novo (com empresa ativa, só na camada dela)"""
+    try:
+        with transacao(caminho_regras()) as conn:
+            conn.execute('''INSERT INTO ncm (codigo, descricao, aliquota_pis, aliquota_cofins, aliquota_ipi) 
+                            VALUES (?, ?, ?, ?, ?)''', (codigo, descricao, pis, cofins, ipi))
+        return True
+    except sqlite3.IntegrityError:
+        return False
@@ -0,0 +1,360 @@
+"""
+Benchmark de Desempenho
+
+Monta um banco sintético (tabela NCM com ~10 mil códigos e regras de
+capítulo, as 27 x 27 rotas de ICMS) e catálogos sintéticos de 1 mil, 100 mil
+e 1 milhão de SKUs, sempre com a mesma semente, e mede:
+
+    - latência de um cálculo (motor_precificacao) e das buscas de regras
+    - inicialização do banco e primeira carga do cache em um processo novo
+    - abertura do snapshot mapeado das regras (snapshot_regras) em um processo novo
+    - vazão do lote vetorizado e pico de memória alocada por tamanho
+    - vazão da gravação no histórico
+    - custo de um clique na calculadora, de ponta a ponta (AppTest do Streamlit)
+
+O resultado vai para um JSON. Com --comparar, cada métrica de vazão é
+comparada com a de uma execução anterior e o comando sai com erro se alguma
+cair mais que --tolerancia (%).
+
+Para rodar: python benchmark.py -o bench.json
+            python benchmark.py --tamanhos 1k,100k -o novo.json --comparar bench.json --tolerancia 10
+"""
+
+import argparse
+import io
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from banco_dados import inicializar_banco
+from busca_ncm import buscar_ncms
+from cache_regras import obter_cache
+from historico_precos import gravar_snapshots, snapshots_do_catalogo
+from importador_regras import importar
+from motor_precificacao import (
+    CONSUMIDOR_FINAL,
+    CONTRIBUINTE_ICMS,
+    UFS,
+    calcular_preco,
+    perfil_canal,
+    perfil_tributos,
+)
+from precificacao_lote import precificar_catalogo, tabelas_atuais
+from snapshot_regras import exportar_snapshot
+
+SEMENTE = 20240601
+NCMS_SINTETICOS = 10_000
+TAMANHOS = {'1k': 1_000, '100k': 100_000, '1M': 1_000_000}
+REPETICOES = 3
+TOLERANCIA_PADRAO = 10.0
+
+# Chamadas por medição nos cenários de microssegundos
+CHAMADAS_POR_MEDICAO = 10_000
+
+MARKETPLACES = ('Mercado Livre', 'Shopee', 'Amazon', 'Magazine Luiza', 'Americanas')
+
+DIRETORIO = os.path.dirname(os.path.abspath(__file__))
+
+# ============================================
+# DADOS SINTÉTICOS
+# ============================================
+
+def _csv(cabecalho, linhas):
+    return io.StringIO('\n'.join([cabecalho, *(','.join(map(str, linha)) for linha in linhas)]))
+
+def codigos_ncm(rng, quantidade=NCMS_SINTETICOS):
+    """Códigos NCM de 8 dígitos, únicos e ordenados (capítulos 01 a 97)"""
+    capitulos = rng.integers(1, 98, quantidade * 2)
+    restos = rng.integers(0, 1_000_000, quantidade * 2)
+    codigos = np.unique([f'{c:02d}{r:06d}' for c, r in zip(capitulos, restos)])
+    return rng.choice(codigos, quantidade, replace=False)
+
+def montar_banco(caminho, rng):
+    """Banco de regras sintético: NCMs, regras de capítulo e todas as rotas; retorna os códigos"""
+    inicializar_banco(caminho)
+    codigos = codigos_ncm(rng)
+    importar('ncm', _csv('codigo,descricao,aliquota_pis,aliquota_cofins',
+                         ((c, f'Produto sintetico {c[:4]} {i}', 1.65, 7.60)
+                          for i, c in enumerate(codigos))), caminho)
+    importar('ncm', _csv('codigo,descricao', ((f'{c:02d}', f'Capitulo {c:02d}') for c in range(1, 98))),
+             caminho)
+    rotas = []
+    for origem in UFS:
+        for destino in UFS:
+            interna = round(float(rng.choice([17.0, 18.0, 19.0, 20.0, 22.0])), 2)
+            interestadual = interna if origem == destino else float(rng.choice([4.0, 7.0, 12.0]))
+            rotas.append((origem, destino, interna, interestadual, float(rng.choice([0.0, 1.0, 2.0])), 1))
+    importar('icms', _csv('uf_origem,uf_destino,aliquota_interna,aliquota_interestadual,'
+                          'aliquota_fcp,calcula_difal', rotas), caminho)
+    importar('marketplace', _csv('nome,comissao_padrao,taxa_fixa,taxa_antecipacao,taxa_gateway',
+                                 ((nome, 12 + 2 * i, 5.0, 1.0, 1.0) for i, nome in enumerate(MARKETPLACES))),
+             caminho)
+    return codigos
+
+def catalogo_sintetico(linhas, codigos, rng):
+    """Catálogo com SKUs, NCMs do banco (5% sem regra própria) e canais aleatórios"""
+    ncm = rng.choice(codigos, linhas)
+    sem_regra = rng.random(linhas) < 0.05
+    ncm[sem_regra] = [f'{c[:2]}999999' for c in ncm[sem_regra]]
+    return pd.DataFrame({
+        'sku': [f'SKU{i:07d}' for i in range(linhas)],
+        'ncm': ncm,
+        'custo_aquisicao': np.round(rng.lognormal(4.0, 1.0, linhas), 2),
+        'uf_origem': rng.choice(['SP', 'MG', 'PR', 'SC'], linhas),
+        'uf_destino': rng.choice(UFS, linhas),
+        'tipo_cliente': rng.choice([CONSUMIDOR_FINAL, CONTRIBUINTE_ICMS], linhas),
+        'marketplace': rng.choice(MARKETPLACES, linhas),
+        'margem_alvo': np.round(rng.uniform(5.0, 40.0, linhas), 1),
+    })
+
+# ============================================
+# CENÁRIOS
+# ============================================
+
+def _mediana(funcao, repeticoes=REPETICOES):
+    tempos = []
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        funcao()
+        tempos.append(time.perf_counter() - inicio)
+    return statistics.median(tempos)
+
+def _por_chamada(funcao, argumentos):
+    # Segundos por chamada, percorrendo a lista de argumentos
+    def rodada():
+        for args in argumentos:
+            funcao(*args)
+    return _mediana(rodada) / len(argumentos)
+
+def _metrica(valor, unidade, maior_melhor):
+    return {'valor': round(valor, 3), 'unidade': unidade, 'maior_melhor': maior_melhor}
+
+def medir_latencias(caminho, codigos, rng):
+    """Um cálculo pelo motor Decimal e as buscas de regras servidas do cache"""
+    cache = obter_cache(caminho)
+    cache.sincronizar()
+    matriz = cache.matriz_icms()
+    tributos = perfil_tributos(1.65, 7.60, 12.0, 6.0, 2.0)
+    canal = perfil_canal(16.0, 5.0, 1.0, 1.0)
+
+    n = CHAMADAS_POR_MEDICAO
+    custos = rng.lognormal(4.0, 1.0, n).round(2).tolist()
+    margens = rng.uniform(5.0, 40.0, n).round(1).tolist()
+    ncms = rng.choice(codigos, n).tolist()
+    origens, destinos = rng.choice(UFS, n).tolist(), rng.choice(UFS, n).tolist()
+    termos = ['produto', 'sintetico 85', '8517', '85', 'capitulo']
+
+    return {
+        'calculo_unitario_us': _metrica(
+            _por_chamada(lambda c, m: calcular_preco(c, m, tributos, canal),
+                         list(zip(custos, margens))) * 1e6, 'µs', False),
+        'busca_ncm_ns': _metrica(
+            _por_chamada(cache.ncm, [(c,) for c in ncms]) * 1e9, 'ns', False),
+        'busca_ncm_herdado_ns': _metrica(
+            _por_chamada(cache.ncm, [(f'{c[:2]}999999',) for c in ncms]) * 1e9, 'ns', False),
+        'busca_icms_ns': _metrica(
+            _por_chamada(matriz.efetivo, [(o, d, CONSUMIDOR_FINAL) for o, d in zip(origens, destinos)])
+            * 1e9, 'ns', False),
+        'busca_ncm_texto_ms': _metrica(
+            _por_chamada(lambda t: buscar_ncms(t, caminho_banco=caminho), [(t,) for t in termos]) * 1e3,
+            'ms', False),
+    }
+
+_SCRIPT_PROCESSO_NOVO = '''
+import json, sys, time
+inicio = time.perf_counter()
+from banco_dados import inicializar_banco
+from cache_regras import obter_cache
+importado = time.perf_counter()
+inicializar_banco(sys.argv[1])
+inicializado = time.perf_counter()
+obter_cache(sys.argv[1]).sincronizar()
+carregado = time.perf_counter()
+print(json.dumps({"importacao": importado - inicio, "inicializacao": inicializado - importado,
+                  "carga_cache": carregado - inicializado}))
+'''
+
+def medir_processo_novo(caminho):
+    """Importação dos módulos, inicializar_banco() e primeira carga do cache em um processo novo"""
+    rodadas = []
+    for _ in range(REPETICOES):
+        saida = subprocess.run([sys.executable, '-c', _SCRIPT_PROCESSO_NOVO, caminho], cwd=DIRETORIO,
+                               capture_output=True, text=True, check=True).stdout
+        rodadas.append(json.loads(saida))
+    return {
+        f'{etapa}_ms': _metrica(statistics.median(r[etapa] for r in rodadas) * 1e3, 'ms', False)
+        for etapa in ('importacao', 'inicializacao', 'carga_cache')
+    }
+
+_SCRIPT_SNAPSHOT = '''
+import json, sys, time
+from tabelas_regras import TabelasRegras
+inicio = time.perf_counter()
+TabelasRegras.abrir_arquivo(sys.argv[1])
+print(json.dumps({"abrir_snapshot": time.perf_counter() - inicio}))
+'''
+
+def medir_snapshot(caminho, diretorio):
+    """Abertura do snapshot das regras (mmap, sem banco) em um processo novo"""
+    arquivo = os.path.join(diretorio, 'regras.snap')
+    exportar_snapshot(arquivo, caminho)
+    tempos = []
+    for _ in range(REPETICOES):
+        saida = subprocess.run([sys.executable, '-c', _SCRIPT_SNAPSHOT, arquivo], cwd=DIRETORIO,
+                               capture_output=True, text=True, check=True).stdout
+        tempos.append(json.loads(saida)['abrir_snapshot'])
+    return {'abrir_snapshot_us': _metrica(statistics.median(tempos) * 1e6, 'µs', False)}
+
+def medir_lote(caminho, catalogo, nome):
+    """Vazão do lote vetorizado (mediana) e pico de memória alocada numa execução à parte"""
+    tabelas = tabelas_atuais(obter_cache(caminho))
+    segundos = _mediana(lambda: precificar_catalogo(catalogo, tabelas))
+    tracemalloc.start()
+    try:
+        precificar_catalogo(catalogo, tabelas)
+        pico = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return {
+        f'lote_{nome}_linhas_s': _metrica(len(catalogo) / segundos, 'linhas/s', True),
+        f'lote_{nome}_pico_mb': _metrica(pico / 2**20, 'MB', False),
+    }
+
+def medir_historico(caminho, catalogo):
+    """Vazão da gravação de snapshots (uma transação por lote, como no precificacao_lote)"""
+    saida = precificar_catalogo(catalogo, tabelas_atuais(obter_cache(caminho)))
+    segundos = _mediana(lambda: gravar_snapshots(snapshots_do_catalogo(saida, 'benchmark'), caminho))
+    return {'historico_linhas_s': _metrica(len(saida[saida['erro'] == '']) / segundos, 'linhas/s', True)}
+
+def medir_clique(caminho):
+    """Carga da calculadora e um clique em CALCULAR, pelo AppTest do Streamlit (sem navegador)"""
+    from streamlit.testing.v1 import AppTest
+
+    os.environ['PRECIFICADOR_DB'] = caminho
+    app = os.path.join(DIRETORIO, 'precificacao_automatica.py')
+
+    def carregar():
+        teste = AppTest.from_file(app, default_timeout=60).run()
+        teste.text_input(key='ncm_calculadora_busca').input('85171231').run()
+        teste.selectbox(key='ncm_calculadora').select_index(1).run()
+        return teste
+
+    carga = _mediana(lambda: AppTest.from_file(app, default_timeout=60).run())
+    testes = [carregar() for _ in range(REPETICOES)]
+    tempos = []
+    for teste in testes:
+        inicio = time.perf_counter()
+        teste.button[0].click().run()
+        tempos.append(time.perf_counter() - inicio)
+        if teste.exception:
+            raise RuntimeError(f"Erro na calculadora: {teste.exception}")
+    return {
+        'carga_calculadora_ms': _metrica(carga * 1e3, 'ms', False),
+        'clique_calcular_ms': _metrica(statistics.median(tempos) * 1e3, 'ms', False),
+    }
+
+def executar(tamanhos, diretorio, clique=True):
+    """Roda todos os cenários em um banco novo no diretório; retorna o dicionário de resultados"""
+    rng = np.random.default_rng(SEMENTE)
+    caminho = os.path.join(diretorio, 'benchmark.db')
+    codigos = montar_banco(caminho, rng)
+
+    metricas = {}
+    metricas.update(medir_latencias(caminho, codigos, rng))
+    for nome in tamanhos:
+        catalogo = catalogo_sintetico(TAMANHOS[nome], codigos, rng)
+        metricas.update(medir_lote(caminho, catalogo, nome))
+    metricas.update(medir_historico(caminho, catalogo_sintetico(TAMANHOS['100k'], codigos, rng)))
+    # Banco já crescido (regras e histórico) para a inicialização
+    metricas.update(medir_processo_novo(caminho))
+    metricas.update(medir_snapshot(caminho, diretorio))
+    if clique:
+        metricas.update(medir_clique(caminho))
+
+    return {
+        'data': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+        'maquina': f'{platform.machine()} {platform.processor()} ({os.cpu_count()} núcleos)'.strip(),
+        'semente': SEMENTE,
+        'metricas': metricas,
+    }
+
+# ============================================
+# COMPARAÇÃO
+# ============================================
+
+def comparar(atual, base, tolerancia=TOLERANCIA_PADRAO):
+    """Linhas (métrica, base, atual, variação %, regrediu) para as métricas presentes nos dois
+
+    Só métricas de vazão (maior_melhor) reprovam: latências em milissegundos
+    variam demais entre execuções para barrar um build.
+    """
+    linhas = []
+    for nome, metrica in atual['metricas'].items():
+        anterior = base['metricas'].get(nome)
+        if not anterior or not anterior['valor']:
+            continue
+        variacao = (metrica['valor'] - anterior['valor']) / anterior['valor'] * 100
+        piora = -variacao if metrica['maior_melhor'] else variacao
+        regrediu = metrica['maior_melhor'] and piora > tolerancia
+        linhas.append((nome, anterior['valor'], metrica['valor'], variacao, regrediu))
+    return linhas
+
+# ============================================
+# LINHA DE COMANDO
+# ============================================
+
+def _tamanhos(valor):
+    tamanhos = [t.strip() for t in valor.split(',') if t.strip()]
+    desconhecidos = [t for t in tamanhos if t not in TAMANHOS]
+    if desconhecidos:
+        raise argparse.ArgumentTypeError(f"tamanho desconhecido: {', '.join(desconhecidos)} "
+                                         f"(use {', '.join(TAMANHOS)})")
+    return tamanhos
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark de desempenho com dados sintéticos")
+    parser.add_argument('--tamanhos', type=_tamanhos, default=list(TAMANHOS),
+                        help=f"catálogos sintéticos (padrão: {','.join(TAMANHOS)})")
+    parser.add_argument('-o', '--saida', help="arquivo JSON com os resultados")
+    parser.add_argument('--comparar', help="JSON de uma execução anterior")
+    parser.add_argument('--tolerancia', type=float, default=TOLERANCIA_PADRAO,
+                        help=f"queda de vazão aceita em %% (padrão: {TOLERANCIA_PADRAO:g})")
+    parser.add_argument('--sem-clique', action='store_true', help="pula o cenário da interface")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory(prefix='benchmark-') as diretorio:
+        resultado = executar(args.tamanhos, diretorio, clique=not args.sem_clique)
+
+    for nome, metrica in resultado['metricas'].items():
+        print(f"{nome:28} {metrica['valor']:>14,.3f} {metrica['unidade']}")
+    if args.saida:
+        with open(args.saida, 'w', encoding='utf-8') as arquivo:
+            json.dump(resultado, arquivo, ensure_ascii=False, indent=2)
+
+    if not args.comparar:
+        return 0
+    with open(args.comparar, encoding='utf-8') as arquivo:
+        base = json.load(arquivo)
+    regressoes = 0
+    print(f"\nComparação com {args.comparar} ({base.get('data', '?')}), tolerância {args.tolerancia:g}%:")
+    for nome, anterior, atual, variacao, regrediu in comparar(resultado, base, args.tolerancia):
+        regressoes += regrediu
+        print(f"{nome:28} {anterior:>14,.3f} -> {atual:>14,.3f} ({variacao:+.1f}%)"
+              f"{'  <- REGRESSÃO' if regrediu else ''}")
+    return 1 if regressoes else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,106 @@
+"""
+Busca de NCMs
+
+Por prefixo de código (capítulo "85", posição "8517", subposição "851712";
+pontos são ignorados) pelo índice de ncm, ou por palavras da descrição pelo
+índice FTS5 ncm_busca, sem diferenciar acentos e maiúsculas ("calcado"
+encontra "Calçados"). Devolve só os primeiros resultados, então o seletor da
+interface não precisa carregar a tabela inteira. Com uma empresa ativa, os
+NCMs da camada dela entram na busca e valem sobre os do banco compartilhado.
+
+Para rodar: python busca_ncm.py 8517
+            python busca_ncm.py "camiseta algodao"
+"""
+
+import argparse
+import re
+import sys
+
+from banco_dados import caminho_empresa, conexao, empresa_ativa, inicializar_banco
+from instrumentacao import medir
+from vigencia import data_iso
+
+LIMITE_PADRAO = 20
+
+# Só os NCMs vigentes na data; com vigências sobrepostas, a de início mais recente.
+# O LIMIT (com folga para essas repetições) evita ordenar todos os resultados.
+_SQL_PREFIXO = '''SELECT codigo, descricao FROM ncm
+    WHERE codigo GLOB ? AND vigencia_inicio <= ? AND vigencia_fim >= ?
+    ORDER BY codigo, vigencia_inicio DESC LIMIT ?'''
+
+# Descrição mais curta primeiro (a mais específica para as palavras digitadas).
+# Mesmo efeito do bm25 para termos comuns a milhares de NCMs, a ~1/5 do custo.
+_SQL_TEXTO = '''SELECT n.codigo, n.descricao FROM ncm_busca b JOIN ncm n ON n.id = b.rowid
+    WHERE ncm_busca MATCH ? AND n.vigencia_inicio <= ? AND n.vigencia_fim >= ?
+    ORDER BY length(n.descricao), n.codigo, n.vigencia_inicio DESC LIMIT ?'''
+
+_SQL_CODIGOS = 'SELECT DISTINCT codigo FROM ncm WHERE vigencia_inicio <= ? AND vigencia_fim >= ?'
+
+def _consulta_fts(palavras):
+    # Cada palavra entre aspas (sem sintaxe FTS5 vinda do usuário) e como prefixo
+    return ' '.join(f'"{palavra}"*' for palavra in palavras)
+
+def _resultados(conn, sql, parametros, limite, ignorar=()):
+    resultados = {}
+    for codigo_ncm, descricao in conn.execute(sql, parametros):
+        if codigo_ncm not in ignorar:
+            resultados.setdefault(codigo_ncm, descricao)
+            if len(resultados) >= limite:
+                break
+    return list(resultados.items())
+
+def buscar_ncms(termo, limite=LIMITE_PADRAO, data=None, caminho_banco=None):
+    """Até `limite` NCMs (código, descrição) para o termo digitado
+
+    Só dígitos: prefixo do código, em ordem de código. Texto: palavras da
+    descrição (todas, cada uma como início de palavra), das descrições mais
+    curtas para as mais longas. Termo vazio: os primeiros códigos.
+    Sem `caminho_banco`, inclui os NCMs da empresa ativa (o código da
+    empresa esconde o mesmo código do banco compartilhado).
+    """
+    termo = (termo or '').strip()
+    codigo = re.sub(r'[\s.]', '', termo)
+    hoje = data_iso(data)
+    if codigo.isdigit() or not codigo:
+        sql, parametros = _SQL_PREFIXO, (f'{codigo}*', hoje, hoje, 2 * limite)
+        ordem = lambda ncm: ncm[0]
+    else:
+        palavras = re.findall(r'\w+', termo)
+        if not palavras:
+            return []
+        sql, parametros = _SQL_TEXTO, (_consulta_fts(palavras), hoje, hoje, 2 * limite)
+        ordem = lambda ncm: (len(ncm[1] or ''), ncm[0])
+
+    cnpj = empresa_ativa() if caminho_banco is None else None
+    with medir('buscar_ncms'):
+        if not cnpj:
+            with conexao(caminho_banco) as conn:
+                return _resultados(conn, sql, parametros, limite)
+        # A camada é pequena: todos os códigos dela, para pular os mesmos no compartilhado
+        with conexao(caminho_empresa(cnpj)) as conn:
+            da_empresa = _resultados(conn, sql, parametros, limite)
+            substituidos = {c for c, in conn.execute(_SQL_CODIGOS, (hoje, hoje))}
+        with conexao() as conn:
+            compartilhados = _resultados(conn, sql, (*parametros[:-1], parametros[-1] + len(substituidos)),
+                                         limite, substituidos)
+    return sorted(da_empresa + compartilhados, key=ordem)[:limite]
+
+# ============================================
+# LINHA DE COMANDO
+# ============================================
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Busca NCMs por código ou descrição")
+    parser.add_argument('termo', help="prefixo do código (ex.: 8517) ou palavras da descrição")
+    parser.add_argument('--limite', type=int, default=LIMITE_PADRAO)
+    parser.add_argument('--banco', help="caminho do banco de regras (padrão: PRECIFICADOR_DB)")
+    args = parser.parse_args(argv)
+
+    inicializar_banco(args.banco)
+    resultados = buscar_ncms(args.termo, args.limite, caminho_banco=args.banco)
+    for codigo, descricao in resultados:
+        print(f"{codigo}  {descricao}")
+    return 0 if resultados else 1
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,485 @@
+"""
+Cache em Memória das Regras Tributárias
+
+As tabelas ncm, icms_uf e marketplace quase nunca mudam: são carregadas uma
+vez em dicionários e servidas sem I/O. A validade do cache é controlada pelo
+contador regras_geracao do SQLite, incrementado por gatilhos a cada escrita.
+
+Todas as vigências ficam em memória: as buscas usam a regra vigente hoje ou,
+com `data`, a vigente na data informada. Um NCM sem regra própria usa a do
+prefixo de 6, 4 ou 2 dígitos (NIVEIS_NCM): uma consulta ao dicionário por nível.
+As faixas de preço das taxas (marketplace_faixa) seguem a mesma regra, pela
+categoria (prefixo do NCM) mais longa.
+
+As tabelas em arrays (cálculo vetorizado) vêm do snapshot mapeado quando
+PRECIFICADOR_REGRAS está definido (snapshot_regras).
+
+Com uma empresa ativa (banco_dados.usar_empresa), as buscas passam por um
+CacheEmpresa: a camada da empresa na frente do cache compartilhado, em
+ChainMaps sobre os dicionários dos dois (nada é copiado). Escrever na camada
+de uma empresa recarrega só ela; as outras e o cache base seguem valendo.
+"""
+
+import heapq
+import itertools
+import threading
+from collections import ChainMap
+from typing import NamedTuple, Optional
+
+from banco_dados import (caminho_banco, caminho_empresa, empresa_ativa, ler_geracao, normalizar_cnpj,
+                         obter_pool)
+from empresas import Empresa, ler_empresa
+from instrumentacao import contar, medir
+from matriz_icms import MatrizICMS
+from snapshot_regras import caminho_snapshot, gravar_snapshot, snapshot_da_geracao
+from tabelas_regras import NIVEIS_NCM, TabelasEmpresa, TabelasRegras
+from vigencia import FIM_ABERTO, INICIO_ABERTO, data_iso
+
+# ============================================
+# REGISTROS TIPADOS
+# ============================================
+
+class RegraNCM(NamedTuple):
+    codigo: str
+    descricao: str
+    aliquota_pis: float
+    aliquota_cofins: float
+    aliquota_ipi: float
+    gera_credito_pis: int
+    gera_credito_cofins: int
+    gera_credito_icms: int
+    observacoes: Optional[str]
+    vigencia_inicio: str = INICIO_ABERTO
+    vigencia_fim: str = FIM_ABERTO
+
+class RotaICMS(NamedTuple):
+    aliquota_interna: float
+    aliquota_interestadual: float
+    aliquota_fcp: float
+    calcula_difal: int
+    vigencia_inicio: str = INICIO_ABERTO
+    vigencia_fim: str = FIM_ABERTO
+
+class TaxasMarketplace(NamedTuple):
+    id: int
+    nome: str
+    comissao_padrao: float
+    taxa_fixa: float
+    taxa_antecipacao: float
+    taxa_gateway: float
+    ativo: int
+    vigencia_inicio: str = INICIO_ABERTO
+    vigencia_fim: str = FIM_ABERTO
+
+class TabelaFaixas(NamedTuple):
+    faixas: tuple  # ((preco_minimo, comissao, taxa_fixa), ...) em ordem de preço
+    vigencia_inicio: str = INICIO_ABERTO
+    vigencia_fim: str = FIM_ABERTO
+
+def _tabelas_faixas(linhas):
+    # Uma tabela por (marketplace, categoria, início); vale até o menor fim entre as faixas
+    for (marketplace, categoria, inicio), grupo in itertools.groupby(linhas, key=lambda r: r[:3]):
+        grupo = list(grupo)
+        yield ((marketplace, categoria),
+               TabelaFaixas(tuple(r[4:] for r in grupo), inicio, min(r[3] for r in grupo)))
+
+def _versoes(registros):
+    # Versões de cada chave em ordem de início (as consultas vêm ordenadas)
+    versoes = {}
+    for chave, registro in registros:
+        versoes.setdefault(chave, []).append(registro)
+    return versoes
+
+def _na_data(versoes, data):
+    # Versão de início mais recente até a data, se ainda vigente (sobrepostas: vale a mais nova)
+    for registro in reversed(versoes or ()):
+        if registro.vigencia_inicio <= data:
+            return registro if data <= registro.vigencia_fim else None
+    return None
+
+def _vigentes(versoes, data):
+    vigentes = {}
+    for chave, lista in versoes.items():
+        registro = _na_data(lista, data)
+        if registro is not None:
+            vigentes[chave] = registro
+    return vigentes
+
+# ============================================
+# CACHE
+# ============================================
+
+class CacheRegras:
+    """Regras tributárias em dicionários, recarregadas quando a geração muda"""
+
+    empresa: Optional[Empresa] = None
+    uf_origem = 'SP'  # padrão das entradas sem UF de origem
+
+    def __init__(self, pool):
+        self._pool = pool
+        self._lock = threading.Lock()
+        self._geracao = None
+        self._hoje = None
+        self._escritas_vistas = None
+        # Regras vigentes hoje
+        self.ncms: dict[str, RegraNCM] = {}
+        self.rotas: dict[tuple[str, str], RotaICMS] = {}
+        self.marketplaces: dict[str, TaxasMarketplace] = {}
+        # Todas as vigências, por chave
+        self.versoes_ncm: dict[str, list[RegraNCM]] = {}
+        self.versoes_rota: dict[tuple[str, str], list[RotaICMS]] = {}
+        self.versoes_marketplace: dict[str, list[TaxasMarketplace]] = {}
+        self.versoes_faixas: dict[tuple[str, str], list[TabelaFaixas]] = {}
+        self._ncms_ordenados: list[tuple[str, str]] = []
+        self._marketplaces_ativos: list[str] = []
+        self._matriz_icms: Optional[MatrizICMS] = None
+        self._tabelas: Optional[TabelasRegras] = None
+        self.acertos = 0
+        self.falhas = 0
+        self.recargas = 0
+
+    @property
+    def caminho_banco(self):
+        return self._pool.caminho
+
+    def _carregar(self, conn, geracao, hoje):
+        versoes_ncm = _versoes(
+            (r[0], RegraNCM(*r)) for r in conn.execute(
+                '''SELECT codigo, descricao, aliquota_pis, aliquota_cofins, aliquota_ipi,
+                          gera_credito_pis, gera_credito_cofins, gera_credito_icms, observacoes,
+                          vigencia_inicio, vigencia_fim
+                   FROM ncm ORDER BY codigo, vigencia_inicio'''))
+        versoes_rota = _versoes(
+            ((r[0], r[1]), RotaICMS(*r[2:])) for r in conn.execute(
+                '''SELECT uf_origem, uf_destino, aliquota_interna, aliquota_interestadual,
+                          aliquota_fcp, calcula_difal, vigencia_inicio, vigencia_fim
+                   FROM icms_uf ORDER BY uf_origem, uf_destino, vigencia_inicio'''))
+        versoes_marketplace = _versoes(
+            (r[1], TaxasMarketplace(*r)) for r in conn.execute(
+                '''SELECT id, nome, comissao_padrao, taxa_fixa, taxa_antecipacao,
+                          taxa_gateway, ativo, vigencia_inicio, vigencia_fim
+                   FROM marketplace ORDER BY nome, vigencia_inicio'''))
+        self.versoes_faixas = _versoes(_tabelas_faixas(conn.execute(
+            '''SELECT marketplace, categoria, vigencia_inicio, vigencia_fim,
+                      preco_minimo, comissao, taxa_fixa
+               FROM marketplace_faixa ORDER BY marketplace, categoria, vigencia_inicio, preco_minimo''')))
+        ncms, rotas, marketplaces = (_vigentes(versoes, hoje) for versoes in
+                                     (versoes_ncm, versoes_rota, versoes_marketplace))
+        self.versoes_ncm, self.versoes_rota, self.versoes_marketplace = (
+            versoes_ncm, versoes_rota, versoes_marketplace)
+        self.ncms, self.rotas, self.marketplaces = ncms, rotas, marketplaces
+        self._ncms_ordenados = sorted(((n.codigo, n.descricao) for n in ncms.values()),
+                                      key=lambda n: (n[1] or '', n[0]))
+        self._marketplaces_ativos = sorted(m.nome for m in marketplaces.values() if m.ativo == 1)
+        self._matriz_icms = None
+        self._tabelas = None
+        self._geracao = geracao
+        self._hoje = hoje
+        self.recargas += 1
+
+    def sincronizar(self):
+        """Confere a geração no banco (uma consulta) e recarrega se mudou ou virou o dia"""
+        with self._lock:
+            escritas = self._pool.escritas
+            hoje = data_iso()
+            with self._pool.conexao() as conn:
+                geracao = ler_geracao(conn)
+                if geracao != self._geracao or hoje != self._hoje:
+                    with medir('carga_regras'):
+                        self._carregar(conn, geracao, hoje)
+            self._escritas_vistas = escritas
+
+    def invalidar(self):
+        """Força recarga na próxima consulta"""
+        with self._lock:
+            self._geracao = None
+            self._escritas_vistas = None
+
+    def _garantir(self):
+        # Escritas deste processo são vistas pelo contador do pool, sem I/O;
+        # escritas de outros processos exigem sincronizar()
+        if self._escritas_vistas == self._pool.escritas and self._geracao is not None:
+            self.acertos += 1
+            contar('cache_acertos')
+        else:
+            self.falhas += 1
+            contar('cache_falhas')
+            self.sincronizar()
+
+    def ncm(self, codigo, data=None) -> Optional[RegraNCM]:
+        """Regra do código ou do prefixo mais longo cadastrado; o nível é len(regra.codigo)"""
+        self._garantir()
+        if data is not None:
+            data = data_iso(data)
+        for digitos in NIVEIS_NCM:
+            prefixo = codigo[:digitos]
+            if data is None:
+                regra = self.ncms.get(prefixo)
+            else:
+                regra = _na_data(self.versoes_ncm.get(prefixo), data)
+            if regra is not None:
+                return regra
+        return None
+
+    def rota(self, uf_origem, uf_destino, data=None) -> Optional[RotaICMS]:
+        self._garantir()
+        if data is None:
+            return self.rotas.get((uf_origem, uf_destino))
+        return _na_data(self.versoes_rota.get((uf_origem, uf_destino)), data_iso(data))
+
+    def marketplace(self, nome, data=None) -> Optional[TaxasMarketplace]:
+        self._garantir()
+        if data is None:
+            return self.marketplaces.get(nome)
+        return _na_data(self.versoes_marketplace.get(nome), data_iso(data))
+
+    def faixas(self, marketplace, ncm='', data=None) -> tuple:
+        """Faixas de preço ((mínimo, comissão, taxa fixa), ...) do marketplace para o NCM; () = taxa única
+
+        Vale a tabela vigente da categoria (prefixo do NCM) mais longa; categoria vazia = todos.
+        """
+        self._garantir()
+        data = self._hoje if data is None else data_iso(data)
+        for digitos in NIVEIS_NCM + (0,):
+            tabela = _na_data(self.versoes_faixas.get((marketplace, ncm[:digitos])), data)
+            if tabela is not None:
+                return tabela.faixas
+        return ()
+
+    def matriz_icms(self) -> MatrizICMS:
+        """Matriz de ICMS efetivo (todos os períodos), montada uma vez por geração das regras"""
+        self._garantir()
+        matriz = self._matriz_icms
+        if matriz is None:
+            matriz = self._matriz_icms = MatrizICMS.de_versoes(self.versoes_rota)
+        return matriz
+
+    def tabelas(self) -> TabelasRegras:
+        """Regras em arrays para o cálculo vetorizado, montadas uma vez por geração"""
+        self._garantir()
+        tabelas = self._tabelas
+        if tabelas is None:
+            tabelas = self._tabelas = self._montar_tabelas()
+        return tabelas
+
+    def _montar_tabelas(self):
+        # Com snapshot configurado: o da geração atual, mapeado; se falta ou está
+        # velho, grava um novo (sem permissão de escrita, fica com as montadas)
+        caminho = caminho_snapshot()
+        if not caminho:
+            return TabelasRegras.de_cache(self)
+        geracao = self._geracao
+        tabelas = snapshot_da_geracao(caminho, self.caminho_banco, geracao)
+        if tabelas is not None:
+            return tabelas
+        montadas = TabelasRegras.de_cache(self)
+        try:
+            gravar_snapshot(montadas, caminho, self.caminho_banco, geracao)
+        except OSError:
+            return montadas
+        contar('snapshot_gravado')
+        return snapshot_da_geracao(caminho, self.caminho_banco, geracao) or montadas
+
+    def lista_ncms(self) -> list[tuple[str, str]]:
+        self._garantir()
+        return self._ncms_ordenados
+
+    def lista_marketplaces(self) -> list[str]:
+        self._garantir()
+        return self._marketplaces_ativos
+
+    def estatisticas(self):
+        """Contadores de acertos/falhas para conferir que consultas não fazem I/O"""
+        return {
+            'geracao': self._geracao,
+            'acertos': self.acertos,
+            'falhas': self.falhas,
+            'recargas': self.recargas,
+            'ncms': len(self.ncms),
+            'rotas': len(self.rotas),
+            'marketplaces': len(self.marketplaces),
+        }
+
+class CacheEmpresa(CacheRegras):
+    """Regras da empresa: a camada dela sobre o cache compartilhado, mescladas na busca
+
+    Chave a chave (e nível a nível do NCM), vale a da camada; o resto vem do
+    base. Um marketplace que a empresa cadastra (comissão negociada) ou com
+    faixas próprias usa só as faixas da camada. Os dicionários são ChainMaps
+    refeitos quando um dos dois caches recarrega.
+    """
+
+    def __init__(self, cnpj, base, camada):
+        super().__init__(camada._pool)
+        self.cnpj = cnpj
+        self._base = base
+        self._camada = camada
+        self._recargas_vistas = None
+
+    @property
+    def uf_origem(self):
+        self._garantir()
+        return self.empresa.uf_origem if self.empresa else CacheRegras.uf_origem
+
+    def _mesclar(self):
+        base, camada = self._base, self._camada
+        self.versoes_ncm = ChainMap(camada.versoes_ncm, base.versoes_ncm)
+        self.versoes_rota = ChainMap(camada.versoes_rota, base.versoes_rota)
+        self.versoes_marketplace = ChainMap(camada.versoes_marketplace, base.versoes_marketplace)
+        substituidos = set(camada.versoes_marketplace) | {m for m, _ in camada.versoes_faixas}
+        sem_faixas_base = {chave: [] for chave in base.versoes_faixas
+                           if chave[0] in substituidos and chave not in camada.versoes_faixas}
+        self.versoes_faixas = ChainMap(camada.versoes_faixas, sem_faixas_base, base.versoes_faixas)
+        self.ncms = ChainMap(camada.ncms, base.ncms)
+        self.rotas = ChainMap(camada.rotas, base.rotas)
+        self.marketplaces = ChainMap(camada.marketplaces, base.marketplaces)
+        # Listas e matriz: as do base enquanto a camada não mexe nelas
+        self._ncms_ordenados = None if camada.ncms else base._ncms_ordenados
+        self._marketplaces_ativos = (sorted(m.nome for m in self.marketplaces.values() if m.ativo == 1)
+                                     if camada.marketplaces else base._marketplaces_ativos)
+        self._matriz_icms = None if camada.versoes_rota else base.matriz_icms()
+        self._tabelas = None
+        self.empresa = ler_empresa(self.cnpj)
+        self._geracao = (base._geracao, camada._geracao)
+        self._hoje = base._hoje
+        self._recargas_vistas = (base.recargas, camada.recargas)
+        self.recargas += 1
+
+    def sincronizar(self):
+        """Confere as gerações do base e da camada e remescla se um dos dois recarregou"""
+        self._base.sincronizar()
+        self._camada.sincronizar()
+        with self._lock:
+            if self._recargas_vistas != (self._base.recargas, self._camada.recargas):
+                self._mesclar()
+
+    def invalidar(self):
+        """Força recarga da camada (o cache base, compartilhado, não é tocado)"""
+        self._camada.invalidar()
+
+    def _garantir(self):
+        self._base._garantir()
+        self._camada._garantir()
+        if self._recargas_vistas == (self._base.recargas, self._camada.recargas):
+            self.acertos += 1
+            return
+        self.falhas += 1
+        with self._lock:
+            if self._recargas_vistas != (self._base.recargas, self._camada.recargas):
+                self._mesclar()
+
+    def lista_ncms(self) -> list[tuple[str, str]]:
+        self._garantir()
+        lista = self._ncms_ordenados
+        if lista is None:
+            # Só quando pedida: as duas listas já ordenadas intercaladas, sem os códigos da camada no base
+            camada = self._camada._ncms_ordenados
+            codigos = {codigo for codigo, _ in camada}
+            lista = self._ncms_ordenados = list(heapq.merge(
+                (n for n in self._base._ncms_ordenados if n[0] not in codigos), camada,
+                key=lambda n: (n[1] or '', n[0])))
+        return lista
+
+    def _montar_tabelas(self):
+        # As tabelas (ou o snapshot) do base, sem cópia; a camada em arrays só
+        # com as exceções e os marketplaces que ela substitui
+        camada = self._camada
+        if not (camada.versoes_ncm or camada.versoes_rota or camada.versoes_marketplace
+                or camada.versoes_faixas):
+            return self._base.tabelas()
+        substituidos = set(camada.versoes_marketplace) | {m for m, _ in camada.versoes_faixas}
+        marketplaces = {nome: self.versoes_marketplace[nome] for nome in substituidos
+                        if nome in self.versoes_marketplace}
+        tabelas_camada = TabelasRegras.de_registros(camada.versoes_ncm, {}, marketplaces,
+                                                    self.matriz_icms(), camada.versoes_faixas)
+        return TabelasEmpresa(self._base.tabelas(), tabelas_camada)
+
+    def estatisticas(self):
+        return {**super().estatisticas(), 'empresa': self.cnpj,
+                'excecoes_ncm': len(self._camada.versoes_ncm),
+                'excecoes_rota': len(self._camada.versoes_rota),
+                'excecoes_marketplace': len(self._camada.versoes_marketplace)}
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+def obter_cache(caminho=None) -> CacheRegras:
+    """Cache do processo para o banco informado (ou o configurado)
+
+    Sem `caminho` e com uma empresa ativa, o CacheEmpresa dela.
+    """
+    if caminho is None:
+        cnpj = empresa_ativa()
+        if cnpj:
+            return obter_cache_empresa(cnpj)
+    pool = obter_pool(caminho)
+    cache = _caches.get(pool.caminho)
+    if cache is None:
+        with _caches_lock:
+            cache = _caches.setdefault(pool.caminho, CacheRegras(pool))
+    return cache
+
+_caches_empresa = {}
+
+def obter_cache_empresa(cnpj, caminho_base=None) -> CacheEmpresa:
+    """Regras da empresa sobre as do banco informado (ou o configurado)
+
+    Um CacheEmpresa por CNPJ e banco no processo; o compartilhado e a camada
+    são os mesmos caches de obter_cache.
+    """
+    chave = cnpj if caminho_base is None else (obter_pool(caminho_base).caminho, cnpj)
+    cache = _caches_empresa.get(chave)
+    if cache is None:
+        cnpj = normalizar_cnpj(cnpj)
+        chave = cnpj if caminho_base is None else (chave[0], cnpj)
+        cache = _caches_empresa.get(chave)
+    if cache is None:
+        if ler_empresa(cnpj) is None:
+            raise ValueError(f"Empresa não cadastrada: {cnpj}")
+        base = obter_cache(caminho_banco() if caminho_base is None else caminho_base)
+        camada = obter_cache(caminho_empresa(cnpj))
+        with _caches_lock:
+            cache = _caches_empresa.setdefault(chave, CacheEmpresa(cnpj, base, camada))
+    return cache
+
+def sincronizar_caches():
+    """Sincroniza os caches abertos no processo: o compartilhado e as camadas das empresas"""
+    for cache in list(_caches.values()):
+        cache.sincronizar()
+
+# ============================================
+# FUNÇÕES DE BUSCA (VIA CACHE)
+# ============================================
+
+def buscar_ncm(codigo_ncm, data=None):
+    """Busca informações do NCM (vigente hoje ou na data), herdando a do capítulo/posição/subposição"""
+    with medir('buscar_ncm'):
+        return obter_cache().ncm(codigo_ncm, data)
+
+def buscar_icms(uf_origem, uf_destino, data=None):
+    """Busca alíquotas de ICMS entre UFs (vigentes hoje ou na data)"""
+    with medir('buscar_icms'):
+        return obter_cache().rota(uf_origem, uf_destino, data)
+
+def buscar_icms_efetivo(uf_origem, uf_destino, tipo_cliente, data=None):
+    """ICMS, DIFAL e FCP efetivos da rota para o tipo de cliente (matriz pré-calculada)"""
+    with medir('buscar_icms_efetivo'):
+        return obter_cache().matriz_icms().efetivo(uf_origem, uf_destino, tipo_cliente, data)
+
+def buscar_marketplace(nome, data=None):
+    """Busca configurações do marketplace (vigentes hoje ou na data)"""
+    with medir('buscar_marketplace'):
+        return obter_cache().marketplace(nome, data)
+
+def buscar_faixas(marketplace, ncm='', data=None):
+    """Faixas de preço das taxas do marketplace para o NCM (vigentes hoje ou na data); () = taxa única"""
+    with medir('buscar_faixas'):
+        return obter_cache().faixas(marketplace, ncm, data)
+
+def listar_ncms():
+    """Lista todos os NCMs cadastrados (código, descrição), ordenados pela descrição"""
+    return obter_cache().lista_ncms()
+
+def listar_marketplaces():
+    """Lista os nomes dos marketplaces ativos"""
+    return obter_cache().lista_marketplaces()
@@ -0,0 +1,86 @@
+"""
+Comparação entre Marketplaces
+
+Precifica um produto em todos os marketplaces ativos (e, opcionalmente, em
+todas as UFs de destino) numa única passada do cálculo vetorizado do lote,
+com as regras já em memória, e ordena do maior lucro líquido para o menor.
+
+Para rodar: python comparacao_canais.py 85171231 --custo 100 --margem 20
+            python comparacao_canais.py 85171231 --custo 100 --margem 20 --ufs-destino todas
+"""
+
+import argparse
+import sys
+
+import pandas as pd
+
+from banco_dados import inicializar_banco
+from cache_regras import obter_cache
+from motor_precificacao import CONSUMIDOR_FINAL, CONTRIBUINTE_ICMS, UFS
+from precificacao_lote import expandir_catalogo, precificar_catalogo, tabelas_atuais
+
+# Colunas da tabela comparativa, na ordem exibida
+COLUNAS_COMPARACAO = (
+    'posicao', 'marketplace', 'uf_destino', 'preco_venda', 'lucro_liquido', 'lucro_liquido_pct',
+    'margem_percentual', 'total_tributos', 'total_custos_canal', 'preco_equilibrio', 'erro',
+)
+
+def comparar_canais(produto, marketplaces=None, ufs_destino=None, caminho_banco=None):
+    """Uma linha por marketplace x UF de destino, da de maior lucro líquido para a de menor
+
+    `produto` tem os campos de uma linha do catálogo (ncm, custo_aquisicao,
+    margem_alvo e os opcionais); sem `marketplaces`, usa os ativos; sem
+    `ufs_destino`, só a UF do produto. Canais sem cálculo (fora da vigência,
+    percentuais acima de 100%) vêm por último, com `erro` e sem posição.
+    """
+    cache = obter_cache(caminho_banco)
+    tabelas = tabelas_atuais(cache)
+    marketplaces = list(marketplaces or cache.lista_marketplaces())
+    if not marketplaces:
+        raise ValueError("Nenhum marketplace ativo para comparar")
+    produto = dict(produto)
+    if not ufs_destino:
+        ufs_destino = [produto.get('uf_destino') or 'SP']
+    produto.setdefault('uf_destino', ufs_destino[0])
+    produto.setdefault('marketplace', marketplaces[0])
+
+    catalogo = expandir_catalogo(pd.DataFrame([produto]), uf_destino=list(ufs_destino),
+                                 marketplace=marketplaces)
+    saida = precificar_catalogo(catalogo, tabelas, cache.uf_origem)
+    saida = saida.sort_values('lucro_liquido', ascending=False, na_position='last',
+                              kind='stable', ignore_index=True)
+    validos = saida['erro'] == ''
+    saida.insert(0, 'posicao', pd.array(validos.cumsum().where(validos), dtype='Int64'))
+    return saida
+
+# ============================================
+# LINHA DE COMANDO
+# ============================================
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compara o preço de um produto entre marketplaces e UFs")
+    parser.add_argument('ncm')
+    parser.add_argument('--custo', type=float, required=True, help="custo de aquisição (R$)")
+    parser.add_argument('--margem', type=float, required=True, help="margem alvo (%%)")
+    parser.add_argument('--uf-origem', default='SP')
+    parser.add_argument('--ufs-destino', default='RJ',
+                        help="UFs de destino separadas por vírgula ('todas' = as 27)")
+    parser.add_argument('--tipo-cliente', choices=(CONSUMIDOR_FINAL, CONTRIBUINTE_ICMS),
+                        default=CONSUMIDOR_FINAL)
+    parser.add_argument('--marketplaces', help="marketplaces separados por vírgula (padrão: ativos)")
+    parser.add_argument('--banco', help="caminho do banco de regras (padrão: PRECIFICADOR_DB)")
+    args = parser.parse_args(argv)
+
+    inicializar_banco(args.banco)
+    ufs = UFS if args.ufs_destino == 'todas' else [u.strip().upper() for u in args.ufs_destino.split(',')]
+    marketplaces = [m.strip() for m in args.marketplaces.split(',')] if args.marketplaces else None
+    comparacao = comparar_canais(
+        {'ncm': args.ncm, 'custo_aquisicao': args.custo, 'margem_alvo': args.margem,
+         'uf_origem': args.uf_origem.upper(), 'tipo_cliente': args.tipo_cliente},
+        marketplaces, ufs, caminho_banco=args.banco)
+    with pd.option_context('display.max_rows', None, 'display.width', 200):
+        print(comparacao[list(COLUNAS_COMPARACAO)].to_string(index=False))
+    return 0 if (comparacao['erro'] == '').any() else 1
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,188 @@
+"""
+Consulta Paginada das Regras
+
+Páginas das tabelas de regras (ncm, icms_uf, marketplace, marketplace_faixa)
+filtradas e ordenadas no banco. A página seguinte continua da chave da
+última linha (keyset: WHERE (chave) > (...) ORDER BY chave LIMIT n), uma
+busca no índice da ordenação: o custo de uma página não depende do tamanho
+da tabela nem de quantas páginas vieram antes. Não há contagem de linhas
+(COUNT percorreria a tabela): a página diz só se existe uma próxima.
+
+A exportação em CSV percorre o mesmo cursor em blocos, sem montar a tabela
+em memória. As colunas têm os nomes do importador_regras: o arquivo
+exportado pode ser editado e importado de volta.
+
+Para rodar: python consulta_regras.py ncm --prefixo-ncm 85 -o ncm_85.csv
+            python consulta_regras.py icms --uf-destino SP > rotas_sp.csv
+"""
+
+import argparse
+import csv
+import sys
+from typing import NamedTuple, Optional
+
+from banco_dados import conexao, inicializar_banco
+from instrumentacao import medir
+
+TAMANHO_PAGINA = 50
+TAMANHO_BLOCO_EXPORTACAO = 5000
+
+class Visao(NamedTuple):
+    tabela: str
+    colunas: tuple      # ((coluna, rótulo), ...)
+    ordens: dict        # nome -> expressões da chave: as colunas de um índice, únicas juntas
+    filtros: dict       # nome -> (condição com um ?, conversão do valor digitado)
+    condicao: str = ''  # filtro fixo
+
+class Pagina(NamedTuple):
+    linhas: list
+    proxima: Optional[tuple]  # chave da última linha (apos= da próxima página); None = última
+
+def _prefixo_ncm(valor):
+    prefixo = valor.strip().replace('.', '')
+    if not prefixo.isdigit():
+        raise ValueError(f"prefixo de NCM deve ter só dígitos: {valor!r}")
+    return f'{prefixo}*'
+
+def _uf(valor):
+    return valor.strip().upper()
+
+def _texto(valor):
+    return valor.strip()
+
+_VIGENCIA = (('vigencia_inicio', 'Vigência Início'), ('vigencia_fim', 'Vigência Fim'))
+
+VISOES = {
+    'ncm': Visao(
+        'ncm',
+        (('codigo', 'Código NCM'), ('descricao', 'Descrição'), ('aliquota_pis', 'PIS %'),
+         ('aliquota_cofins', 'COFINS %'), ('aliquota_ipi', 'IPI %')) + _VIGENCIA
+        + (('gera_credito_pis', 'Crédito PIS?'), ('gera_credito_cofins', 'Crédito COFINS?'),
+           ('gera_credito_icms', 'Crédito ICMS?'), ('observacoes', 'Observações')),
+        {'codigo': ('codigo', 'vigencia_inicio'),
+         'descricao': ("ifnull(descricao, '')", 'codigo', 'vigencia_inicio')},
+        {'prefixo_ncm': ('codigo GLOB ?', _prefixo_ncm)}),
+    'icms': Visao(
+        'icms_uf',
+        (('uf_origem', 'Origem'), ('uf_destino', 'Destino'), ('aliquota_interna', 'ICMS Interno %'),
+         ('aliquota_interestadual', 'ICMS %'), ('aliquota_fcp', 'FCP %'),
+         ('calcula_difal', 'DIFAL?')) + _VIGENCIA,
+        {'origem': ('uf_origem', 'uf_destino', 'vigencia_inicio'),
+         'destino': ('uf_destino', 'uf_origem', 'vigencia_inicio')},
+        {'uf_origem': ('uf_origem = ?', _uf), 'uf_destino': ('uf_destino = ?', _uf)}),
+    'marketplace': Visao(
+        'marketplace',
+        (('nome', 'Nome'), ('comissao_padrao', 'Comissão %'), ('taxa_fixa', 'Taxa Fixa'),
+         ('taxa_antecipacao', 'Antecipação %'), ('taxa_gateway', 'Gateway %')) + _VIGENCIA,
+        {'nome': ('nome', 'vigencia_inicio')},
+        {'marketplace': ('nome = ?', _texto)},
+        'ativo = 1'),
+    'faixa': Visao(
+        'marketplace_faixa',
+        (('marketplace', 'Marketplace'), ('categoria', 'Categoria'),
+         ('preco_minimo', 'A partir de (R$)'), ('comissao', 'Comissão %'),
+         ('taxa_fixa', 'Taxa Fixa')) + _VIGENCIA,
+        {'marketplace': ('marketplace', 'categoria', 'vigencia_inicio', 'preco_minimo')},
+        {'marketplace': ('marketplace = ?', _texto)},
+        'marketplace IN (SELECT nome FROM marketplace WHERE ativo = 1)'),
+}
+
+def rotulos(visao):
+    """Rótulos das colunas da visão, para exibir"""
+    return [rotulo for _, rotulo in VISOES[visao].colunas]
+
+def _consulta(visao, filtros, ordem, decrescente, apos=None):
+    # SELECT das colunas seguidas da chave da ordenação; filtros vazios são ignorados
+    definicao = VISOES[visao]
+    ordem = ordem or next(iter(definicao.ordens))
+    if ordem not in definicao.ordens:
+        raise ValueError(f"ordenação desconhecida para {visao}: {ordem!r}")
+    chave = definicao.ordens[ordem]
+
+    condicoes = [definicao.condicao] if definicao.condicao else []
+    parametros = []
+    for nome, valor in (filtros or {}).items():
+        if valor is None or str(valor).strip() == '':
+            continue
+        if nome not in definicao.filtros:
+            raise ValueError(f"filtro desconhecido para {visao}: {nome!r}")
+        condicao, converter = definicao.filtros[nome]
+        condicoes.append(condicao)
+        parametros.append(converter(str(valor)))
+    if apos is not None:
+        # O limite na primeira coluna sozinha deixa o SQLite buscar também no
+        # índice de expressão (a comparação de tuplas só ele não usa)
+        operador = '<' if decrescente else '>'
+        condicoes.append(f"{chave[0]} {operador}= ? AND ({', '.join(chave)}) {operador} "
+                         f"({', '.join('?' * len(chave))})")
+        parametros.extend((apos[0], *apos))
+
+    where = f"WHERE {' AND '.join(condicoes)}" if condicoes else ''
+    direcao = ' DESC' if decrescente else ''
+    sql = (f"SELECT {', '.join(c for c, _ in definicao.colunas)}, {', '.join(chave)} "
+           f"FROM {definicao.tabela} {where} ORDER BY {', '.join(c + direcao for c in chave)}")
+    return sql, parametros, len(definicao.colunas)
+
+def pagina(visao, filtros=None, ordem=None, decrescente=False, apos=None,
+           tamanho=TAMANHO_PAGINA, caminho_banco=None) -> Pagina:
+    """Uma página da visão (VISOES), a partir da chave `apos` (None = primeira página)
+
+    `filtros` é {nome do filtro: valor}; `ordem`, um nome de Visao.ordens
+    (padrão: o primeiro). Valor de filtro inválido levanta ValueError.
+    """
+    sql, parametros, quantidade = _consulta(visao, filtros, ordem, decrescente, apos)
+    with medir('consulta_regras'), conexao(caminho_banco) as conn:
+        linhas = conn.execute(f'{sql} LIMIT ?', (*parametros, tamanho + 1)).fetchall()
+    proxima = tuple(linhas[tamanho - 1][quantidade:]) if len(linhas) > tamanho else None
+    return Pagina([linha[:quantidade] for linha in linhas[:tamanho]], proxima)
+
+def exportar_csv(visao, destino, filtros=None, ordem=None, decrescente=False, caminho_banco=None):
+    """Grava a visão inteira (com os filtros) em CSV no arquivo de texto `destino`; retorna as linhas
+
+    Lê o cursor em blocos de TAMANHO_BLOCO_EXPORTACAO: a memória não cresce com a tabela.
+    """
+    sql, parametros, quantidade = _consulta(visao, filtros, ordem, decrescente)
+    escritor = csv.writer(destino)
+    escritor.writerow([coluna for coluna, _ in VISOES[visao].colunas])
+    total = 0
+    with medir('exportar_regras'), conexao(caminho_banco) as conn:
+        cursor = conn.execute(sql, parametros)
+        while bloco := cursor.fetchmany(TAMANHO_BLOCO_EXPORTACAO):
+            escritor.writerows(linha[:quantidade] for linha in bloco)
+            total += len(bloco)
+    return total
+
+# ============================================
+# LINHA DE COMANDO
+# ============================================
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Exporta uma tabela de regras em CSV")
+    parser.add_argument('visao', choices=list(VISOES))
+    parser.add_argument('-o', '--saida', help="arquivo CSV (padrão: saída padrão)")
+    parser.add_argument('--ordem', help="ordenação (padrão: a primeira da tabela)")
+    parser.add_argument('--decrescente', action='store_true')
+    parser.add_argument('--prefixo-ncm')
+    parser.add_argument('--uf-origem')
+    parser.add_argument('--uf-destino')
+    parser.add_argument('--marketplace')
+    parser.add_argument('--banco', help="caminho do banco de regras (padrão: PRECIFICADOR_DB)")
+    args = parser.parse_args(argv)
+
+    filtros = {nome: valor for nome in ('prefixo_ncm', 'uf_origem', 'uf_destino', 'marketplace')
+               if (valor := getattr(args, nome))}
+    inicializar_banco(args.banco)
+    try:
+        if args.saida:
+            with open(args.saida, 'w', encoding='utf-8', newline='') as arquivo:
+                total = exportar_csv(args.visao, arquivo, filtros, args.ordem, args.decrescente, args.banco)
+        else:
+            total = exportar_csv(args.visao, sys.stdout, filtros, args.ordem, args.decrescente, args.banco)
+    except ValueError as erro:
+        print(erro, file=sys.stderr)
+        return 1
+    print(f"{total} linhas exportadas", file=sys.stderr)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
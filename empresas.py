@@ -0,0 +1,105 @@
+"""
+Empresas (Camadas de Regras por CNPJ)
+
+Cada empresa tem só as suas exceções (NCMs, rotas de ICMS, comissões
+negociadas, faixas) em um banco próprio, PRECIFICADOR_EMPRESAS/<cnpj>.db,
+com o mesmo schema do banco compartilhado mas sem as regras padrão. Nas
+buscas, a camada vale sobre as regras compartilhadas (cache_regras.CacheEmpresa).
+
+Para rodar: python empresas.py criar 12.345.678/0001-90 "Loja Exemplo" --uf-origem MG
+            python empresas.py listar
+            python importador_regras.py marketplace comissoes.csv --empresa 12345678000190
+"""
+
+import argparse
+import glob
+import os
+import sys
+from typing import NamedTuple, Optional
+
+from banco_dados import (caminho_empresa, conexao, diretorio_empresas, inicializar_banco,
+                         normalizar_cnpj, transacao)
+from motor_precificacao import UFS
+
+class Empresa(NamedTuple):
+    cnpj: str
+    nome: str
+    uf_origem: str
+
+def criar_empresa(cnpj, nome, uf_origem='SP') -> Empresa:
+    """Cria a camada da empresa (ou atualiza nome e UF de origem, se já existe)"""
+    cnpj = normalizar_cnpj(cnpj)
+    uf_origem = uf_origem.strip().upper()
+    if uf_origem not in UFS:
+        raise ValueError(f"UF de origem inválida: {uf_origem!r}")
+    caminho = caminho_empresa(cnpj)
+    os.makedirs(os.path.dirname(caminho) or '.', exist_ok=True)
+    inicializar_banco(caminho, regras_padrao=False)
+    inicializar_banco()
+    with conexao() as conn:
+        ultima_compartilhada = conn.execute('SELECT COALESCE(MAX(id), 0) FROM regras_alteracao').fetchone()[0]
+    with transacao(caminho) as conn:
+        if conn.execute('SELECT 1 FROM empresa WHERE id = 1').fetchone() is None:
+            # Empresa nova não tem preços: nada do que o compartilhado já alterou está pendente
+            conn.execute('UPDATE reprecificacao SET ultima_alteracao_compartilhada = ? WHERE id = 1',
+                         (ultima_compartilhada,))
+        conn.execute('''INSERT INTO empresa (id, cnpj, nome, uf_origem) VALUES (1, ?, ?, ?)
+                        ON CONFLICT (id) DO UPDATE SET nome = excluded.nome,
+                                                       uf_origem = excluded.uf_origem''',
+                     (cnpj, nome.strip(), uf_origem))
+    # Para o arquivo .db (e não só o WAL): a interface percebe a empresa pelo mtime dele
+    with conexao(caminho) as conn:
+        conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+    return Empresa(cnpj, nome.strip(), uf_origem)
+
+def ler_empresa(cnpj) -> Optional[Empresa]:
+    """Dados da empresa (None se a camada não existe)"""
+    caminho = caminho_empresa(cnpj)
+    if not os.path.exists(caminho):
+        return None
+    inicializar_banco(caminho, regras_padrao=False)
+    with conexao(caminho) as conn:
+        linha = conn.execute('SELECT cnpj, nome, uf_origem FROM empresa WHERE id = 1').fetchone()
+    return Empresa(*linha) if linha else None
+
+def listar_empresas() -> list[Empresa]:
+    """Empresas com camada no diretório de empresas, por nome"""
+    empresas = []
+    for caminho in glob.glob(os.path.join(diretorio_empresas(), '*.db')):
+        try:
+            empresa = ler_empresa(os.path.basename(caminho)[:-3])
+        except ValueError:
+            continue  # arquivo que não é de uma empresa
+        if empresa is not None:
+            empresas.append(empresa)
+    return sorted(empresas, key=lambda e: (e.nome, e.cnpj))
+
+# ============================================
+# LINHA DE COMANDO
+# ============================================
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Camadas de regras por empresa (CNPJ)")
+    comandos = parser.add_subparsers(dest='comando', required=True)
+    criar = comandos.add_parser('criar', help="cria a camada da empresa (ou atualiza os dados)")
+    criar.add_argument('cnpj')
+    criar.add_argument('nome')
+    criar.add_argument('--uf-origem', default='SP', help="UF de origem padrão da empresa (padrão: SP)")
+    comandos.add_parser('listar', help="lista as empresas cadastradas")
+    args = parser.parse_args(argv)
+
+    if args.comando == 'criar':
+        try:
+            empresa = criar_empresa(args.cnpj, args.nome, args.uf_origem)
+        except ValueError as erro:
+            print(erro, file=sys.stderr)
+            return 1
+        print(f"{empresa.nome} ({empresa.cnpj}, origem {empresa.uf_origem}) -> {caminho_empresa(empresa.cnpj)}")
+        return 0
+
+    for empresa in listar_empresas():
+        print(f"{empresa.cnpj}  {empresa.uf_origem}  {empresa.nome}")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
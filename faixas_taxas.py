@@ -0,0 +1,46 @@
+"""
+Taxas de Marketplace por Faixa de Preço
+
+Comissão e taxa fixa que dependem do preço de venda (ex.: taxa fixa só
+abaixo de R$ 79, comissão menor acima de R$ 500): o preço depende da taxa e
+a taxa do preço. Na faixa i, [mínimo_i, mínimo_i+1), o gross-up tem forma
+fechada com as taxas da faixa; o menor preço que atinge a meta é o menor
+max(P_i, mínimo_i) que ainda cai na própria faixa.
+
+Mesma solução de motor_precificacao._preco_nas_faixas, vetorizada: as faixas
+de cada linha vêm em arrays (..., K), e o cálculo é um passo por coluna de
+faixa (K passos no total, o maior número de faixas de um canal), sem laço
+por linha nem iteração até convergir. Sobra de colunas: mínimo +infinito.
+"""
+
+import numpy as np
+
+def resolver_faixas(numerador, pct_fixo, minimos, pct_variaveis, fixas):
+    """(preço, faixa) do menor preço P com P * (1 - pct_fixo - pct_variaveis) >= numerador + fixa
+
+    `numerador` e `pct_fixo` (fração do preço que não depende da faixa:
+    margem, tributos) têm a forma das linhas; `minimos`, `pct_variaveis`
+    (fração do preço cobrada pelo canal na faixa) e `fixas` (R$) têm uma
+    coluna a mais, uma por faixa. Onde nenhuma faixa comporta os percentuais
+    (ou há NaN), o preço é NaN e a faixa -1.
+    """
+    forma = np.broadcast_shapes(np.shape(numerador), np.shape(pct_fixo), np.shape(minimos)[:-1])
+    preco = np.full(forma, np.inf)
+    faixa = np.full(forma, -1, dtype=np.int8)
+    quantidade = np.shape(minimos)[-1]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        for i in range(quantidade):
+            fator = 1 - (pct_fixo + pct_variaveis[..., i])
+            candidato = np.maximum((numerador + fixas[..., i]) / fator, minimos[..., i])
+            limite = minimos[..., i + 1] if i + 1 < quantidade else np.inf
+            melhor = (fator > 0) & (candidato < limite) & (candidato < preco)
+            preco = np.where(melhor, candidato, preco)
+            faixa[melhor] = i
+    preco[faixa < 0] = np.nan
+    return preco, faixa
+
+def na_faixa(valores, faixa):
+    """Valor da coluna da faixa escolhida em cada linha (`valores` com uma coluna por faixa)"""
+    indice = np.maximum(faixa, 0)[..., None]
+    valores = np.broadcast_to(valores, indice.shape[:-1] + np.shape(valores)[-1:])
+    return np.take_along_axis(valores, indice, axis=-1)[..., 0]
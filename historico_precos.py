@@ -0,0 +1,216 @@
+"""
+Histórico de Preços
+
+Cada preço calculado (calculadora, lote, API) vira um snapshot em
+preco_snapshot com as entradas, as alíquotas resolvidas e o resultado.
+A gravação é em lotes (executemany) dentro de uma transação; o produto de
+cada SKU é atualizado em produto e o último snapshot por SKU e canal fica em
+preco_atual, então "preço atual" não varre o histórico. Cada snapshot leva a
+empresa (CNPJ) cujas regras o calcularam ('' = regras compartilhadas) e o
+preço atual é por empresa.
+"""
+
+import itertools
+import sqlite3
+import threading
+from datetime import datetime
+from decimal import Decimal
+
+from banco_dados import conexao, empresa_ativa, transacao
+from instrumentacao import contar
+
+TAMANHO_LOTE = 5000
+
+# Ordem das colunas gravadas (todas as de preco_snapshot, menos o id)
+COLUNAS_SNAPSHOT = (
+    'data', 'origem', 'sku', 'nome', 'ncm', 'uf_origem', 'uf_destino', 'tipo_cliente',
+    'marketplace', 'custo_total', 'margem_alvo',
+    'aliquota_pis', 'aliquota_cofins', 'aliquota_icms', 'aliquota_difal', 'aliquota_fcp',
+    'comissao', 'taxa_fixa', 'taxa_antecipacao', 'taxa_gateway',
+    'preco_venda', 'total_tributos', 'total_custos_canal', 'margem_contribuicao',
+    'lucro_liquido', 'lucro_liquido_pct', 'preco_equilibrio', 'data_referencia', 'empresa',
+)
+
+# Colunas do snapshot que têm outro nome na saída do cálculo
+NOMES_ALTERNATIVOS = {'custo_total': 'custo', 'taxa_fixa': 'valor_taxa_fixa'}
+
+# Colunas devolvidas pelas consultas
+COLUNAS_CONSULTA = (
+    'data', 'origem', 'sku', 'nome', 'ncm', 'uf_origem', 'uf_destino', 'tipo_cliente',
+    'marketplace', 'custo_total', 'margem_alvo', 'preco_venda', 'lucro_liquido',
+    'lucro_liquido_pct', 'preco_equilibrio',
+)
+
+_SQL_SNAPSHOT = (f'INSERT INTO preco_snapshot ({", ".join(COLUNAS_SNAPSHOT)}) '
+                 f'VALUES ({", ".join("?" * len(COLUNAS_SNAPSHOT))})')
+
+_SQL_PRODUTO = '''INSERT INTO produto (sku, nome, ncm, custo_total, data_cadastro)
+    VALUES (?, ?, ?, ?, ?)
+    ON CONFLICT (sku) DO UPDATE SET
+        nome = COALESCE(excluded.nome, produto.nome),
+        ncm = excluded.ncm,
+        custo_total = excluded.custo_total'''
+
+# Uma instrução por transação (e não um gatilho por linha): cerca de 30% mais rápido.
+# Com MAX(id), o SQLite tira ncm e uf_origem da mesma linha do snapshot mais recente.
+_SQL_PRECO_ATUAL = '''INSERT INTO preco_atual
+        (empresa, sku, marketplace, uf_destino, tipo_cliente, snapshot_id, ncm, uf_origem)
+    SELECT empresa, sku, marketplace, uf_destino, tipo_cliente, MAX(id), ncm, uf_origem
+    FROM preco_snapshot
+    WHERE id > ? AND sku IS NOT NULL
+    GROUP BY empresa, sku, marketplace, uf_destino, tipo_cliente
+    ON CONFLICT (empresa, sku, marketplace, uf_destino, tipo_cliente)
+    DO UPDATE SET snapshot_id = excluded.snapshot_id, ncm = excluded.ncm,
+                  uf_origem = excluded.uf_origem'''
+
+_I_SKU, _I_NOME, _I_NCM, _I_CUSTO, _I_DATA = (
+    COLUNAS_SNAPSHOT.index(c) for c in ('sku', 'nome', 'ncm', 'custo_total', 'data'))
+
+# Tipos que o sqlite3 aceita como parâmetro (inteiros só até 64 bits)
+_TIPOS_SQLITE = (str, float, bytes, type(None))
+
+def _gravavel(snapshot):
+    return all(isinstance(v, _TIPOS_SQLITE) or (isinstance(v, int) and -2**63 <= v < 2**63)
+               for v in snapshot)
+
+def _empresa(empresa):
+    """CNPJ gravado no histórico: o informado ou o da empresa ativa ('' sem empresa)"""
+    return (empresa_ativa() or '') if empresa is None else empresa
+
+def agora():
+    """Data e hora no formato gravado no banco"""
+    return datetime.now().isoformat(sep=' ', timespec='seconds')
+
+# ============================================
+# MONTAGEM DOS SNAPSHOTS
+# ============================================
+
+def snapshot(valores, origem, data=None, empresa=None):
+    """Snapshot (tupla na ordem de COLUNAS_SNAPSHOT) a partir de um dicionário de entradas e saídas
+
+    empresa: CNPJ cujas regras calcularam o preço (padrão: a empresa ativa).
+    """
+    linha = []
+    for coluna in COLUNAS_SNAPSHOT:
+        valor = valores.get(coluna, valores.get(NOMES_ALTERNATIVOS.get(coluna)))
+        # Valores do motor (Decimal) com centavos, como na saída do lote
+        linha.append(round(float(valor), 2) if isinstance(valor, Decimal) else valor)
+    linha[0] = data or agora()
+    linha[1] = origem
+    linha[-1] = _empresa(empresa)
+    return tuple(linha)
+
+def snapshots_do_catalogo(saida, origem, data=None, empresa=None):
+    """Snapshots das linhas sem erro de uma saída de precificar_catalogo (um só timestamp por execução)"""
+    validas = saida[saida['erro'] == '']
+    n = len(validas)
+    colunas = []
+    for coluna in COLUNAS_SNAPSHOT:
+        if coluna == 'data':
+            colunas.append(itertools.repeat(data or agora(), n))
+        elif coluna == 'origem':
+            colunas.append(itertools.repeat(origem, n))
+        elif coluna == 'empresa':
+            colunas.append(itertools.repeat(_empresa(empresa), n))
+        else:
+            nome = coluna if coluna in validas.columns else NOMES_ALTERNATIVOS.get(coluna)
+            colunas.append(validas[nome].tolist() if nome in validas.columns else itertools.repeat(None, n))
+    return zip(*colunas)
+
+# ============================================
+# GRAVAÇÃO
+# ============================================
+
+def gravar_snapshots(snapshots, caminho_banco=None):
+    """Grava snapshots em lotes, numa única transação, e atualiza os produtos dos SKUs
+
+    Retorna o número de snapshots gravados.
+    """
+    gravados = 0
+    snapshots = iter(snapshots)
+    with transacao(caminho_banco) as conn:
+        ultimo_id = conn.execute('SELECT COALESCE(MAX(id), 0) FROM preco_snapshot').fetchone()[0]
+        while True:
+            lote = list(itertools.islice(snapshots, TAMANHO_LOTE))
+            if not lote:
+                break
+            conn.executemany(_SQL_SNAPSHOT, lote)
+            # Um upsert por SKU no lote, não um por combinação de canal/UF
+            produtos = {s[_I_SKU]: (s[_I_SKU], s[_I_NOME], s[_I_NCM], s[_I_CUSTO], s[_I_DATA])
+                        for s in lote if s[_I_SKU] is not None}
+            conn.executemany(_SQL_PRODUTO, produtos.values())
+            gravados += len(lote)
+        if gravados:
+            conn.execute(_SQL_PRECO_ATUAL, (ultimo_id,))
+    return gravados
+
+class GravadorHistorico:
+    """Acumula snapshots em memória e grava em lotes (para quem calcula item a item, como a API)"""
+
+    def __init__(self, caminho_banco=None):
+        self._caminho = caminho_banco
+        self._pendentes = []
+        self._lock = threading.Lock()
+
+    def adicionar(self, snapshots):
+        with self._lock:
+            self._pendentes.extend(snapshots)
+
+    def descarregar(self):
+        """Grava tudo o que está pendente; retorna quantos snapshots foram gravados
+
+        Snapshots com valores que o SQLite não grava são descartados (contador
+        historico_descartados) sem perder os outros; se o banco falha, os
+        pendentes voltam para a fila e o erro sobe.
+        """
+        with self._lock:
+            pendentes, self._pendentes = self._pendentes, []
+        if not pendentes:
+            return 0
+        try:
+            try:
+                return gravar_snapshots(pendentes, self._caminho)
+            except (sqlite3.InterfaceError, sqlite3.ProgrammingError, OverflowError):
+                validos = [s for s in pendentes if _gravavel(s)]
+                if len(validos) == len(pendentes):
+                    raise
+                contar('historico_descartados', len(pendentes) - len(validos))
+                pendentes = validos
+                return gravar_snapshots(pendentes, self._caminho)
+        except Exception:
+            with self._lock:
+                self._pendentes[:0] = pendentes
+            raise
+
+# ============================================
+# CONSULTAS
+# ============================================
+
+_SELECT_CONSULTA = ', '.join(f's.{c}' for c in COLUNAS_CONSULTA)
+
+def precos_atuais(sku=None, marketplace=None, limite=1000, caminho_banco=None, empresa=None):
+    """Último preço de cada SKU por canal (marketplace, UF de destino e tipo de cliente) da empresa"""
+    filtros, parametros = ['a.empresa = ?'], [_empresa(empresa)]
+    if sku:
+        filtros.append('a.sku = ?')
+        parametros.append(sku)
+    if marketplace:
+        filtros.append('a.marketplace = ?')
+        parametros.append(marketplace)
+    with conexao(caminho_banco) as conn:
+        return conn.execute(f'''SELECT {_SELECT_CONSULTA}
+            FROM preco_atual a JOIN preco_snapshot s ON s.id = a.snapshot_id
+            WHERE {' AND '.join(filtros)}
+            ORDER BY a.sku, a.marketplace, a.uf_destino, a.tipo_cliente
+            LIMIT ?''', (*parametros, limite)).fetchall()
+
+def historico_sku(sku, marketplace=None, limite=1000, caminho_banco=None, empresa=None):
+    """Preços calculados para um SKU pela empresa, do mais recente para o mais antigo"""
+    parametros = (sku, _empresa(empresa), marketplace) if marketplace else (sku, _empresa(empresa))
+    filtro = 'AND s.marketplace = ?' if marketplace else ''
+    with conexao(caminho_banco) as conn:
+        return conn.execute(f'''SELECT {_SELECT_CONSULTA}
+            FROM preco_snapshot s
+            WHERE s.sku = ? AND s.empresa = ? {filtro}
+            ORDER BY s.data DESC, s.id DESC
+            LIMIT ?''', (*parametros, limite)).fetchall()
@@ -0,0 +1,307 @@
+"""
+Importação de Regras Tributárias via CSV
+
+Lê o arquivo linha a linha (gerador, memória constante), valida cada linha
+e grava em lotes com executemany dentro de uma única transação. Linhas já
+existentes são atualizadas (upsert). Erros são reportados por linha, sem
+interromper a importação.
+
+Para rodar: python importador_regras.py ncm tabela_ncm.csv
+            python importador_regras.py icms rotas.csv
+            python importador_regras.py marketplace taxas.csv
+            python importador_regras.py faixa faixas_taxas.csv
+            python importador_regras.py marketplace comissoes.csv --empresa 12345678000190
+
+Colunas esperadas (cabeçalho na primeira linha, separador ',' ou ';'):
+    ncm:         codigo (8 dígitos; 2, 4 ou 6 = regra de todo o capítulo,
+                 posição ou subposição), descricao, aliquota_pis, aliquota_cofins, aliquota_ipi,
+                 [gera_credito_pis, gera_credito_cofins, gera_credito_icms, observacoes]
+    icms:        uf_origem, uf_destino, aliquota_interna, aliquota_interestadual,
+                 [aliquota_fcp, calcula_difal]
+    marketplace: nome, comissao_padrao, [taxa_fixa, taxa_antecipacao, taxa_gateway, ativo]
+    faixa:       marketplace, preco_minimo, comissao, [taxa_fixa, categoria]
+                 (faixa de preço das taxas, de preco_minimo até o mínimo seguinte;
+                 categoria = prefixo de NCM com 2, 4, 6 ou 8 dígitos, vazia = todos)
+
+Todas aceitam [vigencia_inicio, vigencia_fim] (AAAA-MM-DD, inclusive; vazias =
+vigência aberta). A linha é atualizada se já existir a mesma chave com o mesmo
+início de vigência; um início novo cria outra versão da regra.
+"""
+
+import argparse
+import csv
+import datetime as dt
+import io
+import itertools
+import sys
+import time
+
+from banco_dados import caminho_regras, definir_empresa, inicializar_banco, transacao
+from motor_precificacao import UFS
+from tabelas_regras import NIVEIS_NCM
+from vigencia import FIM_ABERTO, INICIO_ABERTO
+
+TAMANHO_LOTE = 1000
+
+# Quantos erros guardar com a mensagem completa (o total é sempre contado)
+MAXIMO_ERROS_DETALHADOS = 1000
+
+class ErroLinha(ValueError):
+    """Linha do CSV com valor inválido"""
+
+class RelatorioImportacao:
+    """Resultado de uma importação: linhas gravadas e erros por linha"""
+
+    def __init__(self, tabela):
+        self.tabela = tabela
+        self.importadas = 0
+        self.total_erros = 0
+        self.erros = []  # (número da linha no arquivo, mensagem)
+        self.duracao = 0.0
+
+    def registrar_erro(self, linha, mensagem):
+        self.total_erros += 1
+        if len(self.erros) < MAXIMO_ERROS_DETALHADOS:
+            self.erros.append((linha, mensagem))
+
+    def __repr__(self):
+        return (f"RelatorioImportacao({self.tabela}: {self.importadas} importadas, "
+                f"{self.total_erros} com erro, {self.duracao:.2f}s)")
+
+# ============================================
+# VALIDAÇÃO
+# ============================================
+
+def _texto(linha, campo, obrigatorio=True):
+    valor = (linha.get(campo) or '').strip()
+    if obrigatorio and not valor:
+        raise ErroLinha(f"campo '{campo}' vazio")
+    return valor
+
+def _numero(linha, campo, padrao=None, minimo=0.0, maximo=100.0):
+    texto = (linha.get(campo) or '').strip()
+    if not texto:
+        if padrao is None:
+            raise ErroLinha(f"campo '{campo}' vazio")
+        return padrao
+    try:
+        valor = float(texto.replace(',', '.'))
+    except ValueError:
+        raise ErroLinha(f"'{campo}' não é número: {texto!r}") from None
+    if not minimo <= valor <= maximo:
+        raise ErroLinha(f"'{campo}' fora da faixa {minimo:g}-{maximo:g}: {valor:g}")
+    return valor
+
+def _flag(linha, campo, padrao):
+    texto = (linha.get(campo) or '').strip().lower()
+    if not texto:
+        return padrao
+    if texto in ('1', 'sim', 's', 'true', 'verdadeiro'):
+        return 1
+    if texto in ('0', 'nao', 'não', 'n', 'false', 'falso'):
+        return 0
+    raise ErroLinha(f"'{campo}' deve ser 0/1 ou sim/não: {texto!r}")
+
+def _uf(linha, campo):
+    uf = _texto(linha, campo).upper()
+    if uf not in UFS:
+        raise ErroLinha(f"'{campo}' não é uma UF válida: {uf!r}")
+    return uf
+
+def _data(linha, campo, padrao):
+    texto = (linha.get(campo) or '').strip()
+    if not texto:
+        return padrao
+    try:
+        return dt.date.fromisoformat(texto).isoformat()
+    except ValueError:
+        raise ErroLinha(f"'{campo}' não é uma data AAAA-MM-DD: {texto!r}") from None
+
+def _vigencia(linha):
+    inicio = _data(linha, 'vigencia_inicio', INICIO_ABERTO)
+    fim = _data(linha, 'vigencia_fim', FIM_ABERTO)
+    if fim < inicio:
+        raise ErroLinha(f"vigência termina antes de começar: {inicio} a {fim}")
+    return inicio, fim
+
+def _validar_ncm(linha):
+    codigo = _texto(linha, 'codigo').replace('.', '')
+    if len(codigo) not in NIVEIS_NCM or not codigo.isdigit():
+        raise ErroLinha(f"código NCM deve ter 8, 6, 4 ou 2 dígitos: {codigo!r}")
+    return (
+        codigo,
+        _texto(linha, 'descricao'),
+        _numero(linha, 'aliquota_pis', 1.65),
+        _numero(linha, 'aliquota_cofins', 7.60),
+        _numero(linha, 'aliquota_ipi', 0.0),
+        _flag(linha, 'gera_credito_pis', 1),
+        _flag(linha, 'gera_credito_cofins', 1),
+        _flag(linha, 'gera_credito_icms', 1),
+        _texto(linha, 'observacoes', obrigatorio=False) or None,
+        *_vigencia(linha),
+    )
+
+def _validar_icms(linha):
+    return (
+        _uf(linha, 'uf_origem'),
+        _uf(linha, 'uf_destino'),
+        _numero(linha, 'aliquota_interna'),
+        _numero(linha, 'aliquota_interestadual'),
+        _numero(linha, 'aliquota_fcp', 0.0),
+        _flag(linha, 'calcula_difal', 0),
+        *_vigencia(linha),
+    )
+
+def _validar_marketplace(linha):
+    return (
+        _texto(linha, 'nome'),
+        _numero(linha, 'comissao_padrao'),
+        _numero(linha, 'taxa_fixa', 0.0, maximo=float('inf')),
+        _numero(linha, 'taxa_antecipacao', 0.0),
+        _numero(linha, 'taxa_gateway', 0.0),
+        _flag(linha, 'ativo', 1),
+        *_vigencia(linha),
+    )
+
+def _validar_faixa(linha):
+    categoria = _texto(linha, 'categoria', obrigatorio=False).replace('.', '')
+    if categoria and (len(categoria) not in NIVEIS_NCM or not categoria.isdigit()):
+        raise ErroLinha(f"categoria deve ser um prefixo de NCM com 2, 4, 6 ou 8 dígitos: {categoria!r}")
+    return (
+        _texto(linha, 'marketplace'),
+        categoria,
+        _numero(linha, 'preco_minimo', 0.0, maximo=float('inf')),
+        _numero(linha, 'comissao'),
+        _numero(linha, 'taxa_fixa', 0.0, maximo=float('inf')),
+        *_vigencia(linha),
+    )
+
+# Tabela -> (validação, upsert)
+IMPORTADORES = {
+    'ncm': (_validar_ncm, '''INSERT INTO ncm
+        (codigo, descricao, aliquota_pis, aliquota_cofins, aliquota_ipi,
+         gera_credito_pis, gera_credito_cofins, gera_credito_icms, observacoes,
+         vigencia_inicio, vigencia_fim)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT (codigo, vigencia_inicio) DO UPDATE SET
+            descricao = excluded.descricao,
+            aliquota_pis = excluded.aliquota_pis,
+            aliquota_cofins = excluded.aliquota_cofins,
+            aliquota_ipi = excluded.aliquota_ipi,
+            gera_credito_pis = excluded.gera_credito_pis,
+            gera_credito_cofins = excluded.gera_credito_cofins,
+            gera_credito_icms = excluded.gera_credito_icms,
+            observacoes = excluded.observacoes,
+            vigencia_fim = excluded.vigencia_fim'''),
+    'icms': (_validar_icms, '''INSERT INTO icms_uf
+        (uf_origem, uf_destino, aliquota_interna, aliquota_interestadual, aliquota_fcp, calcula_difal,
+         vigencia_inicio, vigencia_fim)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT (uf_origem, uf_destino, vigencia_inicio) DO UPDATE SET
+            aliquota_interna = excluded.aliquota_interna,
+            aliquota_interestadual = excluded.aliquota_interestadual,
+            aliquota_fcp = excluded.aliquota_fcp,
+            calcula_difal = excluded.calcula_difal,
+            vigencia_fim = excluded.vigencia_fim'''),
+    'marketplace': (_validar_marketplace, '''INSERT INTO marketplace
+        (nome, comissao_padrao, taxa_fixa, taxa_antecipacao, taxa_gateway, ativo,
+         vigencia_inicio, vigencia_fim)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT (nome, vigencia_inicio) DO UPDATE SET
+            comissao_padrao = excluded.comissao_padrao,
+            taxa_fixa = excluded.taxa_fixa,
+            taxa_antecipacao = excluded.taxa_antecipacao,
+            taxa_gateway = excluded.taxa_gateway,
+            ativo = excluded.ativo,
+            vigencia_fim = excluded.vigencia_fim'''),
+    'faixa': (_validar_faixa, '''INSERT INTO marketplace_faixa
+        (marketplace, categoria, preco_minimo, comissao, taxa_fixa, vigencia_inicio, vigencia_fim)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT (marketplace, categoria, vigencia_inicio, preco_minimo) DO UPDATE SET
+            comissao = excluded.comissao,
+            taxa_fixa = excluded.taxa_fixa,
+            vigencia_fim = excluded.vigencia_fim'''),
+}
+
+# ============================================
+# LEITURA E GRAVAÇÃO
+# ============================================
+
+def ler_linhas(arquivo):
+    """Gera (número da linha, dicionário) a partir de um arquivo texto com cabeçalho"""
+    cabecalho = arquivo.readline()
+    separador = ';' if cabecalho.count(';') > cabecalho.count(',') else ','
+    campos = [c.strip().lower() for c in next(csv.reader([cabecalho], delimiter=separador))]
+    for numero, valores in enumerate(csv.reader(arquivo, delimiter=separador), start=2):
+        if valores:
+            yield numero, dict(zip(campos, valores))
+
+def _validas(linhas, validar, relatorio):
+    for numero, linha in linhas:
+        try:
+            yield validar(linha)
+        except ErroLinha as erro:
+            relatorio.registrar_erro(numero, str(erro))
+
+def importar(tabela, arquivo, caminho_banco=None):
+    """Importa um CSV (caminho ou arquivo aberto, texto ou binário) para a tabela
+
+    Sem `caminho_banco`, grava na camada da empresa ativa (ou no banco
+    compartilhado). Retorna um RelatorioImportacao com o total gravado e os
+    erros por linha.
+    """
+    if tabela not in IMPORTADORES:
+        raise ValueError(f"Tabela desconhecida: {tabela} (use {', '.join(IMPORTADORES)})")
+    if isinstance(arquivo, str):
+        with open(arquivo, encoding='utf-8-sig', newline='') as f:
+            return importar(tabela, f, caminho_banco)
+    if isinstance(arquivo, (io.RawIOBase, io.BufferedIOBase)) or 'b' in getattr(arquivo, 'mode', ''):
+        arquivo = io.TextIOWrapper(arquivo, encoding='utf-8-sig', newline='')
+
+    validar, upsert = IMPORTADORES[tabela]
+    relatorio = RelatorioImportacao(tabela)
+    inicio = time.perf_counter()
+
+    validas = _validas(ler_linhas(arquivo), validar, relatorio)
+    with transacao(caminho_banco or caminho_regras()) as conn:
+        while True:
+            lote = list(itertools.islice(validas, TAMANHO_LOTE))
+            if not lote:
+                break
+            conn.executemany(upsert, lote)
+            relatorio.importadas += len(lote)
+
+    relatorio.duracao = time.perf_counter() - inicio
+    return relatorio
+
+# ============================================
+# LINHA DE COMANDO
+# ============================================
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Importa regras tributárias de um CSV")
+    parser.add_argument('tabela', choices=sorted(IMPORTADORES))
+    parser.add_argument('arquivo', help="arquivo CSV com cabeçalho")
+    parser.add_argument('--banco', help="caminho do banco de regras (padrão: PRECIFICADOR_DB)")
+    parser.add_argument('--empresa', help="CNPJ da empresa: grava na camada dela (empresas.py criar)")
+    args = parser.parse_args(argv)
+    if args.empresa and args.banco:
+        parser.error("use --banco ou --empresa, não os dois")
+
+    inicializar_banco(args.banco)
+    if args.empresa:
+        try:
+            definir_empresa(args.empresa)
+        except ValueError as erro:
+            parser.error(str(erro))
+    relatorio = importar(args.tabela, args.arquivo, args.banco)
+    for linha, mensagem in relatorio.erros:
+        print(f"linha {linha}: {mensagem}", file=sys.stderr)
+    if relatorio.total_erros > len(relatorio.erros):
+        print(f"... e mais {relatorio.total_erros - len(relatorio.erros)} erros", file=sys.stderr)
+    print(f"{relatorio.importadas} linhas importadas em {relatorio.duracao:.2f}s "
+          f"({relatorio.total_erros} com erro)")
+    return 1 if relatorio.total_erros else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
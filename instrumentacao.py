@@ -0,0 +1,172 @@
+"""
+Instrumentação dos Caminhos Quentes
+
+Tempos por etapa (medir) e contadores (contar) com custo quase zero quando
+desligados: medir() devolve um objeto nulo compartilhado e contar() retorna
+na primeira linha (bem menos de 1 µs por etapa).
+
+Liga para o processo inteiro com PRECIFICADOR_METRICAS=1 (ou ativar()), ou
+só para uma execução do script com iniciar_execucao(rastrear=True): é o que
+faz o painel de diagnóstico da interface. Os totais do processo saem em
+texto do Prometheus (texto_prometheus, rota /metrics da API, ou gravar()
+para o coletor de arquivos do node_exporter).
+"""
+
+import os
+import threading
+import time
+
+PREFIXO = 'precificador'
+
+_ativa = os.environ.get('PRECIFICADOR_METRICAS', '') not in ('', '0')
+
+_lock = threading.Lock()
+# Totais do processo: etapa -> [chamadas, segundos, máximo]; evento -> contagem
+_etapas = {}
+_eventos = {}
+
+class _Estado(threading.local):
+    # Execução rastreada na thread (um rerun do Streamlit): {'etapas': ..., 'eventos': ...}
+    execucao = None
+
+_estado = _Estado()
+# Threads com execução rastreada: enquanto zero, nem se consulta o estado da thread
+_rastreando = 0
+
+def ativar(ativa=True):
+    """Liga (ou desliga) a instrumentação para o processo inteiro"""
+    global _ativa
+    _ativa = ativa
+
+def ativa():
+    """Se há medição nesta thread (processo inteiro ou execução rastreada)"""
+    return _ativa or (_rastreando and _estado.execucao is not None)
+
+# ============================================
+# ETAPAS E CONTADORES
+# ============================================
+
+class _Nulo:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *erro):
+        return False
+
+_NULO = _Nulo()
+
+class _Etapa:
+    __slots__ = ('nome', 'inicio')
+
+    def __init__(self, nome):
+        self.nome = nome
+
+    def __enter__(self):
+        self.inicio = time.perf_counter()
+        return self
+
+    def __exit__(self, *erro):
+        segundos = time.perf_counter() - self.inicio
+        with _lock:
+            total = _etapas.get(self.nome)
+            if total is None:
+                _etapas[self.nome] = [1, segundos, segundos]
+            else:
+                total[0] += 1
+                total[1] += segundos
+                total[2] = max(total[2], segundos)
+        execucao = _estado.execucao
+        if execucao is not None:
+            etapa = execucao['etapas'].setdefault(self.nome, [0, 0.0])
+            etapa[0] += 1
+            etapa[1] += segundos
+        return False
+
+def medir(nome):
+    """Context manager que soma o tempo do bloco na etapa `nome`"""
+    if _ativa or (_rastreando and _estado.execucao is not None):
+        return _Etapa(nome)
+    return _NULO
+
+def contar(nome, quantidade=1):
+    """Soma `quantidade` ao contador `nome`"""
+    if not (_ativa or (_rastreando and _estado.execucao is not None)):
+        return
+    with _lock:
+        _eventos[nome] = _eventos.get(nome, 0) + quantidade
+    execucao = _estado.execucao
+    if execucao is not None:
+        execucao['eventos'][nome] = execucao['eventos'].get(nome, 0) + quantidade
+
+def contar_consulta(sql):
+    """Callback de rastreamento do sqlite3: uma consulta ao banco por instrução executada"""
+    contar('consultas_sql')
+
+# ============================================
+# EXECUÇÃO RASTREADA (UM RERUN)
+# ============================================
+
+def iniciar_execucao(rastrear=True):
+    """Começa (ou, com rastrear=False, encerra) o rastreamento da execução nesta thread"""
+    global _rastreando
+    with _lock:
+        _rastreando += bool(rastrear) - (_estado.execucao is not None)
+    _estado.execucao = {'etapas': {}, 'eventos': {}, 'inicio': time.perf_counter()} if rastrear else None
+
+def execucao_atual():
+    """Etapas {nome: (chamadas, segundos)} e eventos {nome: contagem} da execução, e o tempo total"""
+    execucao = _estado.execucao
+    if execucao is None:
+        return None
+    return {
+        'etapas': {nome: tuple(valores) for nome, valores in execucao['etapas'].items()},
+        'eventos': dict(execucao['eventos']),
+        'segundos': time.perf_counter() - execucao['inicio'],
+    }
+
+# ============================================
+# EXPORTAÇÃO
+# ============================================
+
+def totais():
+    """Cópia dos totais do processo: (etapas {nome: (chamadas, segundos, máximo)}, eventos)"""
+    with _lock:
+        return ({nome: tuple(valores) for nome, valores in _etapas.items()}, dict(_eventos))
+
+def zerar():
+    with _lock:
+        _etapas.clear()
+        _eventos.clear()
+
+def texto_prometheus():
+    """Totais do processo no formato de texto do Prometheus (versão 0.0.4)"""
+    etapas, eventos = totais()
+    linhas = [
+        f'# HELP {PREFIXO}_etapa_segundos Tempo gasto por etapa instrumentada',
+        f'# TYPE {PREFIXO}_etapa_segundos summary',
+    ]
+    for nome, (chamadas, segundos, _) in sorted(etapas.items()):
+        linhas.append(f'{PREFIXO}_etapa_segundos_count{{etapa="{nome}"}} {chamadas}')
+        linhas.append(f'{PREFIXO}_etapa_segundos_sum{{etapa="{nome}"}} {segundos:.9f}')
+    linhas += [
+        f'# HELP {PREFIXO}_etapa_maximo_segundos Maior duração de uma chamada por etapa',
+        f'# TYPE {PREFIXO}_etapa_maximo_segundos gauge',
+    ]
+    for nome, (_, _, maximo) in sorted(etapas.items()):
+        linhas.append(f'{PREFIXO}_etapa_maximo_segundos{{etapa="{nome}"}} {maximo:.9f}')
+    linhas += [
+        f'# HELP {PREFIXO}_eventos_total Contadores (cálculos, acertos do cache, consultas SQL)',
+        f'# TYPE {PREFIXO}_eventos_total counter',
+    ]
+    for nome, contagem in sorted(eventos.items()):
+        linhas.append(f'{PREFIXO}_eventos_total{{evento="{nome}"}} {contagem}')
+    return '\n'.join(linhas) + '\n'
+
+def gravar(caminho):
+    """Grava texto_prometheus() no arquivo (troca atômica, para o coletor de arquivos)"""
+    temporario = f'{caminho}.{os.getpid()}.tmp'
+    with open(temporario, 'w', encoding='utf-8') as arquivo:
+        arquivo.write(texto_prometheus())
+    os.replace(temporario, caminho)
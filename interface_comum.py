@@ -0,0 +1,45 @@
+"""
+Partes Comuns da Interface
+
+Usadas pelas páginas que consultam as regras (pagina_*.py). Cada página só
+prepara o banco quando é exibida: a "Como Funciona" não abre o banco.
+"""
+
+import streamlit as st
+
+from banco_dados import inicializar_banco
+from busca_ncm import buscar_ncms
+from cache_regras import buscar_ncm, obter_cache
+from instrumentacao import medir
+from tabelas_regras import NOMES_NIVEIS_NCM
+
+def preparar_regras():
+    """Banco inicializado (uma vez por processo) e cache em dia com escritas de outros processos"""
+    with medir("inicializar_banco"):
+        inicializar_banco()
+    # Uma consulta por rerun; as buscas seguintes são servidas da memória
+    with medir("sincronizar_cache"):
+        obter_cache().sincronizar()
+
+def uf_origem_padrao():
+    """UF de origem da empresa selecionada na barra lateral (SP sem empresa)"""
+    return obter_cache().uf_origem
+
+def seletor_ncm(chave, rotulo, vazio=True):
+    """Busca de NCM por código ou descrição; o seletor recebe só os primeiros resultados"""
+    termo = st.text_input(rotulo, key=f"{chave}_busca",
+                          placeholder="Código (ex.: 8517) ou descrição (ex.: calcado)")
+    opcoes = [f"{codigo} - {descricao}" for codigo, descricao in buscar_ncms(termo)]
+    # Código completo sem regra própria: oferece com a regra herdada do prefixo
+    codigo = termo.strip().replace(".", "")
+    if len(codigo) == 8 and codigo.isdigit() and not any(o.startswith(codigo) for o in opcoes):
+        regra = buscar_ncm(codigo)
+        if regra:
+            nivel = NOMES_NIVEIS_NCM[len(regra.codigo)]
+            opcoes.insert(0, f"{codigo} - {regra.descricao} (regra herdada: {nivel} {regra.codigo})")
+    if not opcoes:
+        st.warning("Nenhum NCM encontrado. Cadastre na aba 'Cadastrar NCM'.")
+        return None
+    escolhido = st.selectbox(rotulo, [""] + opcoes if vazio else opcoes, key=chave,
+                             label_visibility="collapsed")
+    return escolhido.split(" - ")[0] if escolhido else None
@@ -0,0 +1,125 @@
+"""
+Matriz de ICMS Efetivo
+
+Todas as combinações UF origem x UF destino x tipo de cliente pré-calculadas
+em um array (27 x 27 x 2 x 3): ICMS, DIFAL e FCP já com as regras de mesma
+UF, DIFAL para consumidor final e o padrão 12%/18% de rota não cadastrada.
+Uma consulta vira um índice de array, sem SQL nem ramificação.
+
+Com rotas de vigências diferentes, a matriz ganha um eixo de período: um
+período começa a cada início ou fim de vigência e a data escolhe o período
+por busca binária.
+"""
+
+import numpy as np
+
+from motor_precificacao import (
+    CONSUMIDOR_FINAL,
+    CONTRIBUINTE_ICMS,
+    UFS,
+    ICMSEfetivo,
+    resolver_icms,
+)
+from vigencia import INICIO_ABERTO, dia
+
+TIPOS_CLIENTE = (CONSUMIDOR_FINAL, CONTRIBUINTE_ICMS)
+
+# Códigos inteiros pequenos: posição em UFS (ordem alfabética) e em TIPOS_CLIENTE
+INDICE_UF = {uf: i for i, uf in enumerate(UFS)}
+INDICE_TIPO_CLIENTE = {tipo: i for i, tipo in enumerate(TIPOS_CLIENTE)}
+
+# Última dimensão da matriz
+ICMS, DIFAL, FCP = 0, 1, 2
+
+_UFS_ORDENADAS = np.array(UFS)
+_TIPOS_ORDENADOS = np.array(sorted(TIPOS_CLIENTE))
+_TIPOS_POSICAO = np.array([INDICE_TIPO_CLIENTE[t] for t in sorted(TIPOS_CLIENTE)])
+
+def _indices(valores, ordenados):
+    valores = np.asarray(valores, dtype=ordenados.dtype)
+    pos = np.minimum(np.searchsorted(ordenados, valores), len(ordenados) - 1)
+    return np.where(ordenados[pos] == valores, pos, -1)
+
+def indices_uf(ufs):
+    """Código de cada sigla de UF (-1 se inválida), vetorizado"""
+    return _indices(ufs, _UFS_ORDENADAS)
+
+def indices_tipo_cliente(tipos):
+    """Código de cada tipo de cliente (-1 se inválido), vetorizado"""
+    pos = _indices(tipos, _TIPOS_ORDENADOS)
+    return np.where(pos >= 0, _TIPOS_POSICAO[np.maximum(pos, 0)], -1)
+
+def _montar(rotas):
+    n = len(UFS)
+    aliquotas = np.zeros((n, n, len(TIPOS_CLIENTE), 3), dtype=np.float64)
+    cadastrada = np.zeros((n, n), dtype=bool)
+    for o, uf_origem in enumerate(UFS):
+        for d, uf_destino in enumerate(UFS):
+            rota = rotas.get((uf_origem, uf_destino))
+            cadastrada[o, d] = rota is not None
+            for t, tipo_cliente in enumerate(TIPOS_CLIENTE):
+                efetivo = resolver_icms(uf_origem, uf_destino, tipo_cliente, rota)
+                aliquotas[o, d, t] = (efetivo.icms, efetivo.difal, efetivo.fcp)
+    return aliquotas, cadastrada
+
+class MatrizICMS:
+    """Alíquotas efetivas de ICMS, DIFAL e FCP indexadas por período, códigos de UF e tipo de cliente"""
+
+    __slots__ = ('aliquotas', 'cadastrada', 'inicios')
+
+    def __init__(self, aliquotas, cadastrada, inicios):
+        self.aliquotas = aliquotas    # float64 [período, origem, destino, tipo_cliente, ICMS|DIFAL|FCP]
+        self.cadastrada = cadastrada  # bool [período, origem, destino]
+        self.inicios = inicios        # int64 [período]: dia de início de cada período, crescente
+
+    @classmethod
+    def de_rotas(cls, rotas):
+        """Matriz de período único a partir de {(uf_origem, uf_destino): RotaICMS}"""
+        aliquotas, cadastrada = _montar(rotas)
+        return cls(aliquotas[None], cadastrada[None], np.array([dia(INICIO_ABERTO)]))
+
+    @classmethod
+    def de_versoes(cls, versoes):
+        """Matriz por período a partir de {(uf_origem, uf_destino): [RotaICMS com vigência, ...]}"""
+        todas = [(chave, dia(r.vigencia_inicio), dia(r.vigencia_fim), r)
+                 for chave, lista in versoes.items() for r in lista]
+        inicios = sorted({dia(INICIO_ABERTO)} | {i for _, i, _, _ in todas}
+                         | {f + 1 for _, _, f, _ in todas})
+        # Versão de início mais recente até o período, se ainda vigente
+        # (sobrepostas: vale a mais nova, como no CacheRegras)
+        todas.sort(key=lambda versao: versao[1])
+        matrizes = []
+        for inicio in inicios:
+            ultimas = {chave: (f, r) for chave, i, f, r in todas if i <= inicio}
+            matrizes.append(_montar({chave: r for chave, (f, r) in ultimas.items() if f >= inicio}))
+        return cls(np.stack([m[0] for m in matrizes]), np.stack([m[1] for m in matrizes]),
+                   np.array(inicios, dtype=np.int64))
+
+    def periodo(self, dias):
+        """Período de cada dia (escalar ou array)"""
+        return np.searchsorted(self.inicios, dias, side='right') - 1
+
+    def efetivo(self, uf_origem, uf_destino, tipo_cliente, data=None):
+        """ICMSEfetivo de uma rota na data (padrão: hoje), o mesmo de resolver_icms"""
+        o = INDICE_UF.get(uf_origem)
+        d = INDICE_UF.get(uf_destino)
+        t = INDICE_TIPO_CLIENTE.get(tipo_cliente, INDICE_TIPO_CLIENTE[CONTRIBUINTE_ICMS])
+        if o is None or d is None:
+            return resolver_icms(uf_origem, uf_destino, tipo_cliente, None)
+        p = int(self.periodo(dia(data)))
+        icms, difal, fcp = self.aliquotas[p, o, d, t].tolist()
+        return ICMSEfetivo(icms, difal, fcp, bool(self.cadastrada[p, o, d]))
+
+    def vetorizado(self, origem, destino, tipo_cliente, dias=None):
+        """(icms, difal, fcp, cadastrada) para arrays de códigos de UF e tipo de cliente
+
+        `dias` (dias desde 1970, escalar ou array) escolhe o período de cada
+        linha; padrão: hoje. Códigos -1 (inválidos) devem ser filtrados por
+        quem chama: aqui eles apenas não causam erro de índice.
+        """
+        p = self.periodo(dia() if dias is None else dias)
+        o = np.maximum(origem, 0)
+        d = np.maximum(destino, 0)
+        t = np.maximum(tipo_cliente, 0)
+        celulas = self.aliquotas[p, o, d, t]
+        return celulas[..., ICMS], celulas[..., DIFAL], celulas[..., FCP], self.cadastrada[p, o, d]
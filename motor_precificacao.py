@@ -0,0 +1,342 @@
+"""
+Motor de Precificação - Lucro Real
+
+Cálculo puro do preço de venda por gross-up, sem dependência de interface
+(não importa streamlit). Recebe alíquotas já resolvidas e devolve um
+resultado imutável.
+
+    preço = (custo + custos fixos) / (1 - margem - tributos - custos variáveis)
+
+Canais com taxas por faixa de preço (comissão e taxa fixa que mudam com o
+preço) resolvem a faixa junto com o preço: ver _preco_nas_faixas.
+"""
+
+from decimal import Decimal
+from functools import lru_cache
+from typing import NamedTuple
+
+D = Decimal
+
+CEM = D('100')
+UM = D('1')
+INFINITO = D('Infinity')
+
+# IRPJ + CSLL sobre a margem de contribuição (estimativa Lucro Real)
+ALIQUOTA_IRPJ_CSLL = D('0.34')
+
+UFS = (
+    'AC', 'AL', 'AM', 'AP', 'BA', 'CE', 'DF', 'ES', 'GO', 'MA', 'MG', 'MS', 'MT', 'PA',
+    'PB', 'PE', 'PI', 'PR', 'RJ', 'RN', 'RO', 'RR', 'RS', 'SC', 'SE', 'SP', 'TO',
+)
+
+# Tipos de cliente
+CONSUMIDOR_FINAL = "Consumidor Final"
+CONTRIBUINTE_ICMS = "Contribuinte ICMS"
+
+# Alíquotas usadas quando a rota não está cadastrada
+ICMS_PADRAO_INTERESTADUAL = 12.0
+ICMS_PADRAO_INTERNO = 18.0
+
+class ErroPrecificacao(ValueError):
+    """Parâmetros que não permitem calcular um preço de venda"""
+
+# ============================================
+# ICMS EFETIVO DA ROTA
+# ============================================
+
+class ICMSEfetivo(NamedTuple):
+    icms: float
+    difal: float
+    fcp: float
+    rota_cadastrada: bool
+
+def resolver_icms(uf_origem, uf_destino, tipo_cliente, rota):
+    """Alíquotas efetivas de ICMS, DIFAL e FCP para a rota e o tipo de cliente
+
+    `rota` é (aliquota_interna, aliquota_interestadual, aliquota_fcp, calcula_difal)
+    ou None quando a rota não está cadastrada.
+    """
+    if rota is None:
+        icms = ICMS_PADRAO_INTERESTADUAL if uf_origem != uf_destino else ICMS_PADRAO_INTERNO
+        return ICMSEfetivo(icms, 0.0, 0.0, False)
+
+    aliq_interna, aliq_inter, aliq_fcp, calcula_difal = rota[:4]
+
+    # Se for mesmo estado, usar alíquota interna
+    if uf_origem == uf_destino:
+        return ICMSEfetivo(aliq_interna, 0.0, 0.0, True)
+    if tipo_cliente == CONSUMIDOR_FINAL and calcula_difal:
+        return ICMSEfetivo(aliq_inter, aliq_interna - aliq_inter, aliq_fcp, True)
+    return ICMSEfetivo(aliq_inter, 0.0, 0.0, True)
+
+# ============================================
+# PERFIS PRÉ-CALCULADOS
+# ============================================
+
+class PerfilTributos:
+    """Tributos sobre o preço (PIS, COFINS, ICMS, DIFAL, FCP) já em Decimal"""
+
+    __slots__ = ('aliquotas', 'pis', 'cofins', 'icms', 'difal', 'fcp', 'total')
+
+    def __init__(self, aliq_pis, aliq_cofins, aliq_icms, aliq_difal, aliq_fcp):
+        self.aliquotas = (aliq_pis, aliq_cofins, aliq_icms, aliq_difal, aliq_fcp)
+        pis, cofins, icms, difal, fcp = (D(str(a)) for a in self.aliquotas)
+        self.total = (pis + cofins + icms + difal + fcp) / CEM
+        self.pis = pis / CEM
+        self.cofins = cofins / CEM
+        self.icms = icms / CEM
+        self.difal = difal / CEM
+        self.fcp = fcp / CEM
+
+class PerfilCanal:
+    """Custos do canal de venda (comissão, antecipação, gateway, taxa fixa) já em Decimal
+
+    Com `faixas` ((preço mínimo, comissão, taxa fixa), ...), comissão e taxa
+    fixa dependem do preço: cada faixa vai do seu mínimo ao da seguinte, e
+    abaixo da primeira valem as taxas padrão do canal.
+    """
+
+    __slots__ = ('taxas', 'comissao', 'antecipacao', 'gateway', 'taxa_fixa', 'total', 'faixas')
+
+    def __init__(self, comissao, taxa_fixa, taxa_antecipacao, taxa_gateway, faixas=()):
+        self.taxas = (comissao, taxa_fixa, taxa_antecipacao, taxa_gateway)
+        comissao, antecipacao, gateway = D(str(comissao)), D(str(taxa_antecipacao)), D(str(taxa_gateway))
+        self.total = (comissao + antecipacao + gateway) / CEM
+        self.comissao = comissao / CEM
+        self.antecipacao = antecipacao / CEM
+        self.gateway = gateway / CEM
+        self.taxa_fixa = D(str(taxa_fixa))
+        # ((mínimo, perfil da faixa), ...), começando pelas taxas padrão em -infinito
+        self.faixas = ()
+        if faixas:
+            padrao = PerfilCanal(*self.taxas)
+            self.faixas = ((-INFINITO, padrao),) + tuple(
+                (D(str(minimo)), PerfilCanal(comissao_faixa, fixa_faixa, taxa_antecipacao, taxa_gateway))
+                for minimo, comissao_faixa, fixa_faixa in sorted(faixas))
+
+    def na_faixa(self, preco):
+        """Perfil com as taxas da faixa do preço (o próprio perfil, sem faixas)"""
+        perfil = self
+        for minimo, faixa in self.faixas:
+            if minimo > preco:
+                break
+            perfil = faixa
+        return perfil
+
+# Poucas rotas e marketplaces distintos: cada combinação é montada uma vez
+@lru_cache(maxsize=4096)
+def perfil_tributos(aliq_pis, aliq_cofins, aliq_icms, aliq_difal=0.0, aliq_fcp=0.0):
+    """Perfil de tributos (em cache) para as alíquotas percentuais informadas"""
+    return PerfilTributos(aliq_pis, aliq_cofins, aliq_icms, aliq_difal, aliq_fcp)
+
+@lru_cache(maxsize=1024)
+def perfil_canal(comissao=0.0, taxa_fixa=0.0, taxa_antecipacao=0.0, taxa_gateway=0.0, faixas=()):
+    """Perfil do canal (em cache) para as taxas informadas e as faixas de preço, se houver"""
+    return PerfilCanal(comissao, taxa_fixa, taxa_antecipacao, taxa_gateway, faixas)
+
+# ============================================
+# RESULTADO
+# ============================================
+
+class ResultadoPrecificacao:
+    """Resultado imutável de um cálculo de preço (valores em Decimal)"""
+
+    __slots__ = (
+        'preco_venda', 'custo',
+        'valor_pis', 'valor_cofins', 'valor_icms', 'valor_difal', 'valor_fcp', 'total_tributos',
+        'valor_comissao', 'valor_taxa_fixa', 'valor_antecipacao', 'valor_gateway', 'total_custos_canal',
+        'margem_contribuicao', 'margem_percentual',
+        'irpj_csll', 'lucro_liquido', 'lucro_liquido_pct',
+    )
+
+    def __init__(self, **valores):
+        for campo in self.__slots__:
+            object.__setattr__(self, campo, valores[campo])
+
+    def __setattr__(self, nome, valor):
+        raise AttributeError(f"ResultadoPrecificacao é imutável ('{nome}')")
+
+    def __delattr__(self, nome):
+        raise AttributeError(f"ResultadoPrecificacao é imutável ('{nome}')")
+
+    def __repr__(self):
+        return f"ResultadoPrecificacao(preco_venda={self.preco_venda:.2f}, lucro_liquido={self.lucro_liquido:.2f})"
+
+    def como_dict(self):
+        """Campos do resultado em um dicionário"""
+        return {campo: getattr(self, campo) for campo in self.__slots__}
+
+# ============================================
+# CÁLCULO
+# ============================================
+
+def _decimal(valor):
+    return valor if isinstance(valor, Decimal) else D(str(valor))
+
+def custo_total_unitario(custo_aquisicao, ipi_nao_recuperavel=0.0, outros_custos=0.0,
+                         credito_icms=0.0, credito_pis=0.0, credito_cofins=0.0):
+    """Custo unitário: aquisição + IPI não recuperável + outros custos - créditos"""
+    return (
+        custo_aquisicao
+        + ipi_nao_recuperavel
+        + outros_custos
+        - credito_icms
+        - credito_pis
+        - credito_cofins
+    )
+
+def calcular_preco(custo_total, margem_alvo, tributos, canal):
+    """Preço de venda por gross-up e detalhamento dos tributos, custos e lucro
+
+    `margem_alvo` em % sobre o preço; `tributos` e `canal` vêm de
+    perfil_tributos() e perfil_canal().
+    """
+    custo = D(str(custo_total))
+    pct_margem = D(str(margem_alvo)) / CEM
+
+    if canal.faixas:
+        achado = _preco_nas_faixas(custo, pct_margem + tributos.total, canal)
+        if achado is None:
+            raise ErroPrecificacao(
+                "Margem, tributos e custos do canal somam 100% do preço ou mais em todas as "
+                "faixas de taxa do canal")
+        preco_venda, faixa = achado
+        return detalhar_preco(preco_venda, custo, tributos, faixa)
+
+    total_pct = pct_margem + tributos.total + canal.total
+    if total_pct >= UM:
+        raise ErroPrecificacao(
+            f"Margem, tributos e custos do canal somam {float(total_pct * CEM):.2f}% do preço "
+            "(precisam ficar abaixo de 100%)")
+
+    preco_venda = (custo + canal.taxa_fixa) / (UM - total_pct)
+    return detalhar_preco(preco_venda, custo, tributos, canal)
+
+def detalhar_preco(preco_venda, custo, tributos, canal):
+    """Detalhamento de tributos, custos do canal, margem e lucro para um preço dado"""
+    preco_venda = _decimal(preco_venda)
+    custo = _decimal(custo)
+    canal = canal.na_faixa(preco_venda)
+
+    # Detalhamento
+    valor_pis = preco_venda * tributos.pis
+    valor_cofins = preco_venda * tributos.cofins
+    valor_icms = preco_venda * tributos.icms
+    valor_difal = preco_venda * tributos.difal
+    valor_fcp = preco_venda * tributos.fcp
+
+    total_tributos = valor_pis + valor_cofins + valor_icms + valor_difal + valor_fcp
+
+    valor_comissao = preco_venda * canal.comissao
+    valor_antecipacao = preco_venda * canal.antecipacao
+    valor_gateway = preco_venda * canal.gateway
+
+    total_custos_canal = valor_comissao + canal.taxa_fixa + valor_antecipacao + valor_gateway
+
+    margem_contribuicao = preco_venda - custo - total_tributos - total_custos_canal
+    margem_percentual = (margem_contribuicao / preco_venda) * CEM
+
+    irpj_csll = margem_contribuicao * ALIQUOTA_IRPJ_CSLL
+    lucro_liquido = margem_contribuicao - irpj_csll
+    lucro_liquido_pct = (lucro_liquido / preco_venda) * CEM
+
+    return ResultadoPrecificacao(
+        preco_venda=preco_venda,
+        custo=custo,
+        valor_pis=valor_pis,
+        valor_cofins=valor_cofins,
+        valor_icms=valor_icms,
+        valor_difal=valor_difal,
+        valor_fcp=valor_fcp,
+        total_tributos=total_tributos,
+        valor_comissao=valor_comissao,
+        valor_taxa_fixa=canal.taxa_fixa,
+        valor_antecipacao=valor_antecipacao,
+        valor_gateway=valor_gateway,
+        total_custos_canal=total_custos_canal,
+        margem_contribuicao=margem_contribuicao,
+        margem_percentual=margem_percentual,
+        irpj_csll=irpj_csll,
+        lucro_liquido=lucro_liquido,
+        lucro_liquido_pct=lucro_liquido_pct,
+    )
+
+# ============================================
+# SOLUÇÃO INVERSA (PREÇO A PARTIR DO LUCRO)
+# ============================================
+
+# Margem de contribuição em função do preço P:
+#   MC(P) = P * (1 - tributos - custos variáveis) - (custo + taxa fixa)
+# e lucro líquido = MC * (1 - IRPJ/CSLL). Os dois são lineares em P, então o
+# preço de equilíbrio e o preço para um lucro alvo saem em forma fechada
+# (por faixa, quando as taxas do canal dependem do preço).
+
+def _preco_nas_faixas(numerador, pct_fixo, canal):
+    """Menor preço P com P * (1 - pct_fixo - taxas da faixa) >= numerador + taxa fixa da faixa
+
+    Dentro da faixa i, [mínimo_i, mínimo_i+1), o menor preço que atinge a meta
+    é max(P_i, mínimo_i), com P_i a fórmula fechada com as taxas da faixa; vale
+    o menor desses que ainda cai na própria faixa. Uma conta por faixa, sem
+    iteração: termina mesmo quando a taxa fixa some acima de um limite e
+    nenhum P_i cai na sua faixa (o preço fica no limite). Retorna (preço,
+    perfil da faixa) ou None se nenhuma faixa comporta os percentuais.
+    """
+    melhor = None
+    limites = [minimo for minimo, _ in canal.faixas[1:]] + [INFINITO]
+    for (minimo, faixa), limite in zip(canal.faixas, limites):
+        fator = UM - pct_fixo - faixa.total
+        if fator <= 0:
+            continue
+        preco = max((numerador + faixa.taxa_fixa) / fator, minimo)
+        if preco < limite and (melhor is None or preco < melhor[0]):
+            melhor = (preco, faixa)
+    return melhor
+
+def _fator_liquido(tributos, canal):
+    fator = UM - tributos.total - canal.total
+    if fator <= 0:
+        raise ErroPrecificacao(
+            f"Tributos e custos do canal somam {float((tributos.total + canal.total) * CEM):.2f}% "
+            "do preço: nenhum preço cobre os custos")
+    return fator
+
+def preco_equilibrio(custo_total, tributos, canal):
+    """Preço em que a margem de contribuição (e o lucro) é zero"""
+    return preco_para_lucro_liquido(custo_total, 0, tributos, canal)
+
+def preco_para_lucro_liquido(custo_total, lucro_liquido_alvo, tributos, canal):
+    """Preço que resulta no lucro líquido (após IRPJ/CSLL) informado, em R$"""
+    custo = D(str(custo_total))
+    margem_necessaria = D(str(lucro_liquido_alvo)) / (UM - ALIQUOTA_IRPJ_CSLL)
+    if canal.faixas:
+        achado = _preco_nas_faixas(custo + margem_necessaria, tributos.total, canal)
+        if achado is None:
+            raise ErroPrecificacao(
+                "Tributos e custos do canal somam 100% do preço ou mais em todas as faixas de "
+                "taxa: nenhum preço cobre os custos")
+        return detalhar_preco(achado[0], custo, tributos, achado[1])
+    preco_venda = (custo + canal.taxa_fixa + margem_necessaria) / _fator_liquido(tributos, canal)
+    return detalhar_preco(preco_venda, custo, tributos, canal)
+
+class PrecoCanal(NamedTuple):
+    marketplace: str
+    preco_equilibrio: Decimal
+    preco_alvo: Decimal
+    resultado_alvo: ResultadoPrecificacao
+
+def precos_por_canal(custo_total, tributos, canais, lucro_liquido_alvo=0):
+    """Preço de equilíbrio e preço para o lucro alvo em cada canal
+
+    `canais` é {nome do marketplace: perfil_canal(...)}. Canais em que nenhum
+    preço cobre os custos ficam de fora. Retorna a lista ordenada pelo preço alvo.
+    """
+    tabela = []
+    for nome, canal in canais.items():
+        try:
+            equilibrio = preco_equilibrio(custo_total, tributos, canal)
+            alvo = preco_para_lucro_liquido(custo_total, lucro_liquido_alvo, tributos, canal)
+        except ErroPrecificacao:
+            continue
+        tabela.append(PrecoCanal(nome, equilibrio.preco_venda, alvo.preco_venda, alvo))
+    tabela.sort(key=lambda linha: linha.preco_alvo)
+    return tabela
@@ -0,0 +1,186 @@
+"""
+Página: Base de Dados
+
+Regras cadastradas, preços calculados, reprecificação dos afetados por
+regras alteradas e planilhas de preços por canal (geradas em segundo plano,
+planilhas_precos). As tabelas de regras vêm paginadas do banco
+(consulta_regras): cada rerun busca só a página exibida.
+"""
+
+import functools
+import io
+import shutil
+import tempfile
+
+import pandas as pd
+import streamlit as st
+
+from banco_dados import empresa_ativa
+from cache_regras import listar_marketplaces
+from consulta_regras import exportar_csv, pagina, rotulos
+from historico_precos import COLUNAS_CONSULTA, historico_sku, precos_atuais
+from interface_comum import preparar_regras
+from motor_precificacao import UFS
+from planilhas_precos import FORMATOS, blocos_precos_atuais, exportar_em_segundo_plano
+from reprecificacao import contar_afetados, reprecificar_alterados
+
+# Contagem dos preços desatualizados para aqui: acima, a página mostra "1.000+"
+LIMITE_AFETADOS = 1000
+
+def _gerador_csv(visao, filtros, ordem, decrescente):
+    # Só roda no clique do download; o CSV vai do cursor para um arquivo temporário
+    def gerar():
+        arquivo = tempfile.TemporaryFile()
+        texto = io.TextIOWrapper(arquivo, encoding='utf-8', newline='')
+        exportar_csv(visao, texto, filtros, ordem, decrescente)
+        texto.flush()
+        texto.detach()
+        arquivo.seek(0)
+        return arquivo
+    return gerar
+
+def _tabela_paginada(visao, chave, filtros, ordens):
+    """Uma página da visão, com ordenação, navegação e exportação em CSV
+
+    `ordens` é {nome da ordenação: rótulo}. A posição (chave da última linha
+    de cada página vista) fica na sessão e volta ao início quando filtros ou
+    ordenação mudam.
+    """
+    col_ordem, col_direcao = st.columns([3, 1])
+    with col_ordem:
+        ordem = st.selectbox("Ordenar por", list(ordens), format_func=ordens.get, key=f"{chave}_ordem")
+    with col_direcao:
+        decrescente = st.toggle("Decrescente", key=f"{chave}_decrescente")
+
+    consulta = (tuple(sorted(filtros.items())), ordem, decrescente)
+    navegacao = st.session_state.setdefault(f"{chave}_paginas", {'consulta': consulta, 'inicios': [None]})
+    if navegacao['consulta'] != consulta:
+        navegacao.update(consulta=consulta, inicios=[None])
+    inicios = navegacao['inicios']
+
+    try:
+        resultado = pagina(visao, filtros, ordem, decrescente, apos=inicios[-1])
+    except ValueError as erro:
+        st.warning(f"⚠️ {erro}")
+        return None
+    st.dataframe(pd.DataFrame(resultado.linhas, columns=rotulos(visao)), hide_index=True)
+
+    col_anterior, col_proxima, col_pagina, col_exportar = st.columns([1, 1, 1, 2])
+    with col_anterior:
+        st.button("⬅️ Anterior", key=f"{chave}_anterior", disabled=len(inicios) == 1,
+                  on_click=inicios.pop)
+    with col_proxima:
+        st.button("Próxima ➡️", key=f"{chave}_proxima", disabled=resultado.proxima is None,
+                  on_click=inicios.append, args=(resultado.proxima,))
+    with col_pagina:
+        st.caption(f"Página {len(inicios)}")
+    with col_exportar:
+        st.download_button("⬇️ Exportar CSV", _gerador_csv(visao, filtros, ordem, decrescente),
+                           file_name=f"{visao}.csv", mime="text/csv", key=f"{chave}_exportar")
+    return resultado
+
+def _andamento_planilhas():
+    tarefa = st.session_state.get('planilhas_tarefa')
+    if tarefa is None:
+        return
+    if not tarefa.concluida:
+        st.info(f"⏳ Gerando planilhas... {tarefa.linhas:,} linhas lidas")
+        return
+    if st.session_state.pop('planilhas_acompanhando', False):
+        st.rerun()  # fim da exportação: a página toda volta a rodar e o fragmento para de atualizar
+    if tarefa.erro:
+        st.error(f"❌ Erro ao gerar as planilhas: {tarefa.erro}")
+        return
+    st.success(f"✅ {len(tarefa.arquivos)} arquivos gerados em {tarefa.duracao:.1f}s "
+               f"({tarefa.linhas:,} linhas)")
+    st.download_button("⬇️ Baixar Planilhas (.zip)", functools.partial(open, tarefa.pacote, 'rb'),
+                       file_name="planilhas_precos.zip", mime="application/zip", key="planilhas_baixar")
+
+def _planilhas_por_canal(marketplace):
+    """Planilhas dos preços atuais geradas em uma thread; só o andamento reroda, a cada segundo"""
+    st.markdown("**📦 Planilhas por canal**")
+    st.caption("Um CSV por marketplace e UF, um XLSX por marketplace (uma aba por UF) e o resumo em PDF")
+    col_formatos, col_pdf, col_gerar = st.columns([2, 1, 1])
+    with col_formatos:
+        formatos = st.multiselect("Formatos", list(FORMATOS), default=list(FORMATOS), key="planilhas_formatos")
+    with col_pdf:
+        pdf = st.checkbox("Resumo em PDF", value=True, key="planilhas_pdf")
+    tarefa = st.session_state.get('planilhas_tarefa')
+    em_andamento = tarefa is not None and not tarefa.concluida
+    with col_gerar:
+        if st.button("📦 Gerar Planilhas", disabled=em_andamento or not (formatos or pdf)):
+            if tarefa is not None:
+                shutil.rmtree(tarefa.destino, ignore_errors=True)
+            st.session_state['planilhas_tarefa'] = exportar_em_segundo_plano(
+                blocos_precos_atuais(marketplace), formatos=formatos, pdf=pdf)
+            st.session_state['planilhas_acompanhando'] = em_andamento = True
+    st.fragment(_andamento_planilhas, run_every=1 if em_andamento else None)()
+
+def exibir():
+    preparar_regras()
+    
+    st.header("📚 Base de Dados Tributária")
+    if empresa_ativa():
+        st.caption("🏢 As tabelas são as do banco compartilhado (as exceções da empresa valem nos cálculos); "
+                   "o histórico, a reprecificação e as planilhas são só os da empresa")
+    
+    tab1, tab2, tab3, tab4 = st.tabs(["📋 NCMs", "🗺️ ICMS", "🏪 Marketplaces", "💾 Histórico de Preços"])
+    
+    with tab1:
+        st.subheader("NCMs Cadastrados")
+        prefixo = st.text_input("Prefixo do NCM", "", placeholder="Ex.: 85 ou 8517", key="base_prefixo_ncm")
+        _tabela_paginada('ncm', 'base_ncm', {'prefixo_ncm': prefixo},
+                         {'codigo': "Código", 'descricao': "Descrição"})
+    
+    with tab2:
+        st.subheader("Rotas de ICMS Cadastradas")
+        col_origem, col_destino = st.columns(2)
+        with col_origem:
+            uf_origem = st.selectbox("UF Origem", ["Todas", *UFS], key="base_uf_origem")
+        with col_destino:
+            uf_destino = st.selectbox("UF Destino", ["Todas", *UFS], key="base_uf_destino")
+        _tabela_paginada('icms', 'base_icms',
+                         {'uf_origem': None if uf_origem == "Todas" else uf_origem,
+                          'uf_destino': None if uf_destino == "Todas" else uf_destino},
+                         {'origem': "UF de origem", 'destino': "UF de destino"})
+    
+    with tab3:
+        st.subheader("Marketplaces Cadastrados")
+        mkt_base = st.selectbox("Marketplace", ["Todos"] + listar_marketplaces(), key="base_marketplace")
+        filtro_mkt = {'marketplace': None if mkt_base == "Todos" else mkt_base}
+        _tabela_paginada('marketplace', 'base_marketplace', filtro_mkt, {'nome': "Nome"})
+        st.markdown("**📶 Taxas por faixa de preço**")
+        st.caption("Cada faixa vale do seu preço mínimo até o da seguinte; abaixo da primeira, as taxas acima")
+        _tabela_paginada('faixa', 'base_faixa', filtro_mkt, {'marketplace': "Marketplace"})
+    
+    with tab4:
+        st.subheader("Preços Calculados")
+        col_h1, col_h2 = st.columns(2)
+        with col_h1:
+            sku_historico = st.text_input("SKU / Produto", "")
+        with col_h2:
+            mkt_historico = st.selectbox("Marketplace", ["Todos"] + listar_marketplaces(), key="mkt_historico")
+        mkt_filtro = None if mkt_historico == "Todos" else mkt_historico
+        
+        if sku_historico.strip():
+            st.markdown("**📈 Histórico do SKU**")
+            linhas = historico_sku(sku_historico.strip(), mkt_filtro)
+        else:
+            st.markdown("**🏷️ Preço atual por SKU e canal**")
+            linhas = precos_atuais(marketplace=mkt_filtro)
+        st.dataframe(pd.DataFrame(linhas, columns=COLUNAS_CONSULTA), hide_index=True)
+        
+        # Regras alteradas depois do cálculo: recalcula só os preços afetados
+        desatualizados = contar_afetados(limite=LIMITE_AFETADOS + 1)
+        if desatualizados:
+            quantos = f"{LIMITE_AFETADOS:,}+".replace(",", ".") if desatualizados > LIMITE_AFETADOS else desatualizados
+            st.warning(f"🔄 {quantos} preços usam regras alteradas depois do cálculo")
+            if st.button("🔄 Reprecificar Alterados"):
+                with st.spinner("Recalculando preços afetados..."):
+                    relatorio = reprecificar_alterados()
+                st.success(f"✅ {relatorio.reprecificados} preços recalculados em {relatorio.duracao:.2f}s")
+                if relatorio.erros:
+                    st.error(f"❌ {relatorio.erros} preços sem cálculo (NCM ou marketplace removido)")
+        
+        st.divider()
+        _planilhas_por_canal(mkt_filtro)
@@ -0,0 +1,72 @@
+"""
+Página: Cadastrar NCM
+
+Cadastro de um NCM (ou regra de capítulo/posição/subposição) e importação
+de regras via CSV.
+"""
+
+import streamlit as st
+
+from banco_dados import cadastrar_ncm_customizado, empresa_ativa
+from importador_regras import importar as importar_regras
+from interface_comum import preparar_regras
+from tabelas_regras import NIVEIS_NCM
+
+def exibir():
+    preparar_regras()
+    
+    st.header("📝 Cadastrar Novo NCM")
+    
+    st.info("Adicione NCMs personalizados à base de dados")
+    if empresa_ativa():
+        st.caption(f"🏢 Cadastros e importações vão para as exceções da empresa {empresa_ativa()}; "
+                   "as regras compartilhadas não mudam")
+    
+    with st.form("form_ncm"):
+        col1, col2 = st.columns(2)
+        
+        with col1:
+            novo_ncm = st.text_input("Código NCM (8 dígitos)", max_chars=8,
+                                     help="Com 2, 4 ou 6 dígitos, a regra vale para todo o capítulo, "
+                                          "posição ou subposição (NCMs sem regra própria)")
+            descricao_ncm = st.text_input("Descrição do Produto")
+        
+        with col2:
+            pis_ncm = st.number_input("Alíquota PIS (%)", 0.0, 100.0, 1.65, 0.01)
+            cofins_ncm = st.number_input("Alíquota COFINS (%)", 0.0, 100.0, 7.60, 0.01)
+            ipi_ncm = st.number_input("Alíquota IPI (%)", 0.0, 100.0, 0.0, 0.1)
+        
+        submitted = st.form_submit_button("➕ Cadastrar NCM")
+        
+        if submitted:
+            if len(novo_ncm) in NIVEIS_NCM and novo_ncm.isdigit() and descricao_ncm:
+                sucesso = cadastrar_ncm_customizado(novo_ncm, descricao_ncm, pis_ncm, cofins_ncm, ipi_ncm)
+                if sucesso:
+                    st.success(f"✅ NCM {novo_ncm} cadastrado com sucesso!")
+                else:
+                    st.error("❌ NCM já existe ou erro ao cadastrar")
+            else:
+                st.error("❌ Preencha todos os campos corretamente")
+    
+    st.markdown("---")
+    st.subheader("📥 Importar Regras de CSV")
+    st.caption("Arquivo com cabeçalho, separado por ',' ou ';'. Linhas já cadastradas são atualizadas.")
+    
+    tipos_importacao = {
+        "📋 NCMs": "ncm",
+        "🗺️ Rotas de ICMS": "icms",
+        "🏪 Marketplaces": "marketplace",
+        "📶 Faixas de Taxas": "faixa",
+    }
+    tipo_importacao = st.radio("Tabela", list(tipos_importacao), horizontal=True)
+    arquivo_csv = st.file_uploader("Arquivo CSV", type=["csv"])
+    
+    if arquivo_csv and st.button("📥 Importar"):
+        with st.spinner("Importando..."):
+            relatorio = importar_regras(tipos_importacao[tipo_importacao], arquivo_csv)
+        if relatorio.importadas:
+            st.success(f"✅ {relatorio.importadas} linhas importadas em {relatorio.duracao:.2f}s")
+        if relatorio.total_erros:
+            st.error(f"❌ {relatorio.total_erros} linhas com erro (não importadas)")
+            st.dataframe([{"Linha": linha, "Erro": mensagem} for linha, mensagem in relatorio.erros],
+                         hide_index=True)
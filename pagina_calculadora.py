@@ -0,0 +1,331 @@
+"""
+Página: Calculadora Automática
+
+Preço de um produto com as regras buscadas pelo NCM, pela rota e pelo
+marketplace (motor Decimal), gravado no histórico.
+"""
+
+from datetime import date
+
+import streamlit as st
+
+from cache_regras import (
+    buscar_faixas,
+    buscar_icms_efetivo,
+    buscar_marketplace,
+    buscar_ncm,
+    listar_marketplaces,
+)
+from historico_precos import gravar_snapshots, snapshot
+from instrumentacao import contar, medir
+from interface_comum import preparar_regras, seletor_ncm, uf_origem_padrao
+from motor_precificacao import (
+    CONSUMIDOR_FINAL,
+    CONTRIBUINTE_ICMS,
+    UFS,
+    ErroPrecificacao,
+    calcular_preco,
+    custo_total_unitario,
+    perfil_canal,
+    perfil_tributos,
+    preco_equilibrio,
+    precos_por_canal,
+)
+from tabelas_regras import NOMES_NIVEIS_NCM
+
+def exibir():
+    preparar_regras()
+    
+    col1, col2 = st.columns([2, 1])
+    
+    with col1:
+        st.header("📦 Dados do Produto")
+        
+        # NCM com busca
+        ncm_codigo = seletor_ncm("ncm_calculadora", "🔍 Selecione o NCM do Produto")
+        
+        if ncm_codigo:
+            dados_ncm = buscar_ncm(ncm_codigo)
+            
+            if dados_ncm:
+                st.success(f"✅ NCM encontrado: {dados_ncm[1]}")
+                if dados_ncm.codigo != ncm_codigo:
+                    st.info(f"ℹ️ Sem regra própria: usando a regra herdada "
+                            f"({NOMES_NIVEIS_NCM[len(dados_ncm.codigo)]} {dados_ncm.codigo})")
+                
+                with st.expander("📋 Regras Tributárias do NCM"):
+                    col_a, col_b = st.columns(2)
+                    with col_a:
+                        st.metric("PIS", f"{dados_ncm[2]}%")
+                        st.metric("COFINS", f"{dados_ncm[3]}%")
+                    with col_b:
+                        st.metric("IPI", f"{dados_ncm[4]}%")
+                        st.metric("Gera Crédito", "✅ Sim" if dados_ncm[5] else "❌ Não")
+        
+        # Custos do produto
+        st.subheader("💰 Custos")
+        
+        col3, col4 = st.columns(2)
+        with col3:
+            produto_nome = st.text_input("Nome do Produto (opcional)", "")
+            custo_aquisicao = st.number_input("Custo de Aquisição (R$)", min_value=0.0, value=100.0, step=1.0)
+        
+        with col4:
+            outros_custos = st.number_input("Outros Custos (R$)", min_value=0.0, value=19.0, step=1.0,
+                                           help="Frete, armazenagem, despachante, etc")
+        
+        # IPI e Créditos
+        with st.expander("🔧 Ajustes de Impostos (Opcional)"):
+            col5, col6 = st.columns(2)
+            with col5:
+                st.markdown("**Impostos que viram CUSTO:**")
+                ipi_nao_recuperavel = st.number_input("IPI não recuperável (R$)", min_value=0.0, value=15.0, step=0.1)
+            
+            with col6:
+                st.markdown("**Créditos Tributários:**")
+                credito_icms = st.number_input("Crédito ICMS (R$)", min_value=0.0, value=18.0, step=0.1)
+                credito_pis = st.number_input("Crédito PIS (R$)", min_value=0.0, value=1.65, step=0.01)
+                credito_cofins = st.number_input("Crédito COFINS (R$)", min_value=0.0, value=7.60, step=0.01)
+        
+        # Calcular custo total
+        custo_total = custo_total_unitario(custo_aquisicao, ipi_nao_recuperavel, outros_custos,
+                                           credito_icms, credito_pis, credito_cofins)
+        
+        st.success(f"✅ **Custo Total Unitário: R$ {custo_total:.2f}**")
+    
+    with col2:
+        st.header("🎯 Venda")
+        
+        # Origem: a da empresa selecionada (SP sem empresa)
+        uf_origem = st.selectbox("UF Origem", UFS, index=UFS.index(uf_origem_padrao()))
+        
+        # Destino
+        uf_destino = st.selectbox("UF Destino", 
+                                 ["SP", "RJ", "MG", "RS", "BA", "PR", "SC", "PE", "CE", "GO", "AM", "DF"],
+                                 index=1)
+        
+        # Tipo de cliente
+        tipo_cliente = st.radio("Cliente", [CONSUMIDOR_FINAL, CONTRIBUINTE_ICMS])
+        
+        # Marketplace
+        marketplaces = listar_marketplaces()
+        marketplace_selecionado = st.selectbox("Marketplace", marketplaces)
+        
+        # Margem
+        margem_alvo = st.slider("Margem Desejada (%)", 0.0, 100.0, 20.0, 0.5)
+        
+        # Lucro alvo (cálculo inverso em todos os marketplaces)
+        lucro_alvo = st.number_input("Lucro Líquido Alvo (R$)", min_value=0.0, value=0.0, step=1.0,
+                                     help="Mostra, para cada marketplace, o preço que entrega este lucro após IRPJ/CSLL")
+        
+        # Vigência das regras
+        data_referencia = st.date_input("📅 Data de Referência", value=date.today(), format="DD/MM/YYYY",
+                                        help="Calcula com as regras tributárias e taxas vigentes nesta data")
+        
+        st.markdown("---")
+        
+        # Botão calcular
+        calcular = st.button("🚀 CALCULAR PREÇO", type="primary", use_container_width=True)
+        
+        # Comparação: todos os marketplaces ativos (e UFs) de uma vez
+        todas_ufs = st.checkbox("Comparar em todas as UFs de destino")
+        comparar = st.button("📊 COMPARAR MARKETPLACES", use_container_width=True)
+    
+    # ============================================
+    # CÁLCULO AUTOMÁTICO
+    # ============================================
+    
+    if calcular:
+        if not ncm_codigo:
+            st.error("❌ Selecione um NCM primeiro!")
+        else:
+            with st.spinner("🤖 Buscando regras tributárias automaticamente..."):
+                
+                # Buscar dados do NCM (regras vigentes na data de referência)
+                dados_ncm = buscar_ncm(ncm_codigo, data_referencia)
+                if dados_ncm is None:
+                    st.error(f"❌ NCM {ncm_codigo} sem regra vigente em {data_referencia:%d/%m/%Y}")
+                    st.stop()
+                aliq_pis = dados_ncm[2]
+                aliq_cofins = dados_ncm[3]
+                
+                # ICMS efetivo da rota (matriz pré-calculada)
+                aliq_icms, aliq_difal, aliq_fcp_final, rota_cadastrada = buscar_icms_efetivo(
+                    uf_origem, uf_destino, tipo_cliente, data_referencia)
+                if not rota_cadastrada:
+                    st.warning(f"⚠️ Rota {uf_origem} → {uf_destino} não cadastrada. Usando padrões.")
+                
+                # Buscar dados do marketplace
+                dados_marketplace = buscar_marketplace(marketplace_selecionado, data_referencia)
+                if dados_marketplace:
+                    comissao = dados_marketplace[2]
+                    taxa_fixa = dados_marketplace[3]
+                    taxa_antecipacao = dados_marketplace[4]
+                    taxa_gateway = dados_marketplace[5]
+                else:
+                    comissao = 0.0
+                    taxa_fixa = 0.0
+                    taxa_antecipacao = 0.0
+                    taxa_gateway = 0.0
+                
+                # Faixas de preço das taxas (comissão e taxa fixa que mudam com o preço)
+                faixas = buscar_faixas(marketplace_selecionado, ncm_codigo, data_referencia) if dados_marketplace else ()
+                
+                # CALCULAR PREÇO
+                tributos = perfil_tributos(aliq_pis, aliq_cofins, aliq_icms, aliq_difal, aliq_fcp_final)
+                canal = perfil_canal(comissao, taxa_fixa, taxa_antecipacao, taxa_gateway, faixas)
+                try:
+                    with medir("calculo_preco"):
+                        resultado = calcular_preco(custo_total, margem_alvo, tributos, canal)
+                    contar("calculos")
+                    # Taxas da faixa em que o preço caiu
+                    comissao, taxa_fixa = canal.na_faixa(resultado.preco_venda).taxas[:2]
+                except ErroPrecificacao as erro:
+                    resultado = None
+                    st.error(f"❌ {erro}")
+                
+                # Histórico: o nome do produto, se informado, identifica o SKU
+                if resultado:
+                    with medir("gravar_historico"):
+                        gravar_snapshots([snapshot({
+                            **resultado.como_dict(),
+                            'sku': produto_nome.strip() or None, 'nome': produto_nome.strip() or None,
+                            'ncm': ncm_codigo, 'uf_origem': uf_origem, 'uf_destino': uf_destino,
+                            'tipo_cliente': tipo_cliente, 'marketplace': marketplace_selecionado,
+                            'margem_alvo': margem_alvo,
+                            'aliquota_pis': aliq_pis, 'aliquota_cofins': aliq_cofins,
+                            'aliquota_icms': aliq_icms, 'aliquota_difal': aliq_difal, 'aliquota_fcp': aliq_fcp_final,
+                            'comissao': comissao, 'taxa_fixa': taxa_fixa,
+                            'taxa_antecipacao': taxa_antecipacao, 'taxa_gateway': taxa_gateway,
+                            'preco_equilibrio': preco_equilibrio(custo_total, tributos, canal).preco_venda,
+                            'data_referencia': None if data_referencia == date.today() else data_referencia.isoformat(),
+                        }, 'calculadora')])
+            
+            if resultado:
+                with medir("renderizacao"):
+                    # MOSTRAR RESULTADOS
+                    st.markdown("---")
+                    st.markdown("## 🎉 RESULTADO")
+                
+                    st.markdown(f'<p class="big-font">R$ {float(resultado.preco_venda):.2f}</p>', unsafe_allow_html=True)
+                
+                    margem_float = float(resultado.margem_percentual)
+                    if margem_float >= 20:
+                        st.markdown('<div class="success-card"><h3>🟢 MARGEM SAUDÁVEL</h3></div>', unsafe_allow_html=True)
+                    elif margem_float >= 10:
+                        st.markdown('<div class="warning-card"><h3>🟡 MARGEM BAIXA - ATENÇÃO</h3></div>', unsafe_allow_html=True)
+                    else:
+                        st.markdown('<div class="warning-card"><h3>🔴 MARGEM CRÍTICA</h3></div>', unsafe_allow_html=True)
+                
+                    st.markdown("---")
+                
+                    # Regras aplicadas
+                    with st.expander("🤖 Regras Tributárias Aplicadas AUTOMATICAMENTE"):
+                        col_r1, col_r2, col_r3 = st.columns(3)
+                        with col_r1:
+                            st.markdown("**📋 Do NCM:**")
+                            st.write(f"• PIS: {aliq_pis}%")
+                            st.write(f"• COFINS: {aliq_cofins}%")
+                        with col_r2:
+                            st.markdown(f"**🗺️ Da Rota {uf_origem}→{uf_destino}:**")
+                            st.write(f"• ICMS: {aliq_icms}%")
+                            if aliq_difal > 0:
+                                st.write(f"• DIFAL: {aliq_difal}%")
+                            if aliq_fcp_final > 0:
+                                st.write(f"• FCP: {aliq_fcp_final}%")
+                        with col_r3:
+                            st.markdown(f"**🏪 Do {marketplace_selecionado}:**")
+                            st.write(f"• Comissão: {comissao}%")
+                            if taxa_fixa > 0:
+                                st.write(f"• Taxa Fixa: R$ {taxa_fixa:.2f}")
+                            if faixas:
+                                minimo = max(m for m, _ in canal.faixas if m <= resultado.preco_venda)
+                                st.write(f"• Faixa de preço: a partir de R$ {float(minimo):.2f}"
+                                         if minimo.is_finite() else "• Faixa de preço: abaixo da primeira faixa")
+                
+                    # Métricas
+                    col1, col2, col3 = st.columns(3)
+                
+                    with col1:
+                        st.metric("📦 Custo", f"R$ {float(resultado.custo):.2f}", 
+                                 f"{float(resultado.custo/resultado.preco_venda*100):.1f}%")
+                
+                    with col2:
+                        st.metric("💸 Tributos", f"R$ {float(resultado.total_tributos):.2f}",
+                                 f"{float(resultado.total_tributos/resultado.preco_venda*100):.1f}%")
+                
+                    with col3:
+                        st.metric("🏪 Custos Canal", f"R$ {float(resultado.total_custos_canal):.2f}",
+                                 f"{float(resultado.total_custos_canal/resultado.preco_venda*100):.1f}%")
+                
+                    st.markdown("---")
+                
+                    col4, col5 = st.columns(2)
+                
+                    with col4:
+                        st.metric("📈 Margem de Contribuição", f"R$ {float(resultado.margem_contribuicao):.2f}",
+                                 f"{float(resultado.margem_percentual):.2f}%")
+                
+                    with col5:
+                        st.metric("💰 Lucro Líquido Estimado", f"R$ {float(resultado.lucro_liquido):.2f}",
+                                 f"{float(resultado.lucro_liquido_pct):.2f}%")
+                
+                    # Equilíbrio e lucro alvo em todos os marketplaces
+                    with st.expander("⚖️ Preço de Equilíbrio e de Lucro Alvo por Marketplace"):
+                        vigentes = {nome: buscar_marketplace(nome, data_referencia) for nome in marketplaces}
+                        canais = {nome: perfil_canal(*taxas[2:6], buscar_faixas(nome, ncm_codigo, data_referencia))
+                                  for nome, taxas in vigentes.items() if taxas}
+                        tabela_canais = precos_por_canal(custo_total, tributos, canais, lucro_alvo)
+                        st.dataframe([{
+                            "Marketplace": linha.marketplace,
+                            "Equilíbrio (R$)": round(float(linha.preco_equilibrio), 2),
+                            f"Lucro R$ {lucro_alvo:.2f} (R$)": round(float(linha.preco_alvo), 2),
+                            "Margem Contrib. %": round(float(linha.resultado_alvo.margem_percentual), 2),
+                        } for linha in tabela_canais], hide_index=True)
+    
+    # ============================================
+    # COMPARAÇÃO ENTRE MARKETPLACES
+    # ============================================
+    
+    if comparar:
+        if not ncm_codigo:
+            st.error("❌ Selecione um NCM primeiro!")
+            return
+        produto = {
+            'ncm': ncm_codigo, 'custo_aquisicao': custo_aquisicao,
+            'ipi_nao_recuperavel': ipi_nao_recuperavel, 'outros_custos': outros_custos,
+            'credito_icms': credito_icms, 'credito_pis': credito_pis, 'credito_cofins': credito_cofins,
+            'uf_origem': uf_origem, 'uf_destino': uf_destino, 'tipo_cliente': tipo_cliente,
+            'margem_alvo': margem_alvo,
+            'data_referencia': None if data_referencia == date.today() else data_referencia.isoformat(),
+        }
+        if lucro_alvo > 0:
+            produto['lucro_liquido_alvo'] = lucro_alvo
+        # Só aqui: o cálculo vetorizado traz o pandas, que a calculadora não usa
+        from comparacao_canais import comparar_canais
+        
+        with medir("comparar_canais"):
+            comparacao = comparar_canais(produto, ufs_destino=UFS if todas_ufs else None)
+        contar("calculos", len(comparacao))
+        
+        validos = comparacao[comparacao['erro'] == '']
+        st.markdown("---")
+        st.markdown("## 📊 Comparação entre Marketplaces")
+        if validos.empty:
+            st.error("❌ Nenhum marketplace com preço possível para este produto")
+            return
+        melhor = validos.iloc[0]
+        st.success(f"🏆 Maior lucro líquido: **{melhor['marketplace']}** → {melhor['uf_destino']} "
+                   f"(R$ {melhor['lucro_liquido']:.2f} vendendo a R$ {melhor['preco_venda']:.2f})")
+        colunas = {
+            'posicao': "#", 'marketplace': "Marketplace", 'uf_destino': "UF Destino",
+            'preco_venda': "Preço (R$)", 'lucro_liquido': "Lucro Líquido (R$)",
+            'lucro_liquido_pct': "Lucro %", 'total_tributos': "Tributos (R$)",
+            'total_custos_canal': "Custos Canal (R$)", 'preco_equilibrio': "Equilíbrio (R$)",
+        }
+        if 'preco_lucro_alvo' in validos.columns:
+            colunas['preco_lucro_alvo'] = f"Preço p/ Lucro R$ {lucro_alvo:.2f}"
+        st.dataframe(validos[list(colunas)].rename(columns=colunas), hide_index=True)
+        sem_calculo = len(comparacao) - len(validos)
+        if sem_calculo:
+            st.caption(f"{sem_calculo} combinações sem preço (fora da vigência ou percentuais acima de 100%)")
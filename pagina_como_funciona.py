@@ -0,0 +1,60 @@
+"""
+Página: Como Funciona
+
+Só texto: não abre o banco nem carrega as regras.
+"""
+
+import streamlit as st
+
+def exibir():
+    st.header("ℹ️ Como Funciona o Sistema Inteligente")
+    
+    st.markdown("""
+    ## 🤖 Inteligência Automática
+    
+    Este sistema possui uma **base de dados tributária** que elimina 90% do trabalho manual!
+    
+    ### ✨ O que o sistema faz automaticamente:
+    
+    1. **Busca PIS/COFINS pelo NCM**
+       - Cada NCM tem suas alíquotas pré-configuradas
+       - 1,65% PIS e 7,60% COFINS (não cumulativo) para maioria
+       
+    2. **Busca ICMS pela rota (UF Origem → UF Destino)**
+       - Alíquotas interestaduais (7% ou 12%)
+       - Alíquotas internas (18% geralmente)
+       - DIFAL automático para consumidor final
+       - FCP por estado
+       
+    3. **Busca comissões do Marketplace**
+       - Mercado Livre: 16% + R$ 5,00
+       - Shopee: 14%
+       - Amazon: 15%
+       - E outros...
+    
+    ### 📊 Você só precisa informar:
+    
+    - ✅ NCM do produto (busca por código ou descrição)
+    - ✅ UF de destino
+    - ✅ Tipo de cliente (consumidor ou contribuinte)
+    - ✅ Marketplace
+    - ✅ Custo do produto
+    - ✅ Margem desejada
+    
+    **O resto é AUTOMÁTICO!** 🎉
+    
+    ### 🔧 Personalizável
+    
+    - Cadastre novos NCMs na aba "Cadastrar NCM"
+    - Ajuste créditos tributários se necessário
+    - Base de dados SQLite local (portátil)
+    
+    ### ⚠️ Importante
+    
+    - Base de dados vem com regras padrão
+    - Sempre valide com seu contador
+    - Legislação muda - mantenha atualizado
+    - Sistema é ferramenta de APOIO
+    """)
+    
+    st.success("💡 **Vantagem:** Precificação em segundos sem precisar lembrar de alíquotas!")
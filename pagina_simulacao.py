@@ -0,0 +1,123 @@
+"""
+Página: Simulação
+
+Grade de sensibilidade (margem x custo x marketplace) em mapas de calor.
+"""
+
+import time
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+from cache_regras import (
+    buscar_faixas,
+    buscar_icms_efetivo,
+    buscar_marketplace,
+    buscar_ncm,
+    listar_marketplaces,
+)
+from interface_comum import preparar_regras, seletor_ncm, uf_origem_padrao
+from motor_precificacao import CONSUMIDOR_FINAL, CONTRIBUINTE_ICMS, UFS, perfil_canal, perfil_tributos
+from simulacao import PONTOS_CUSTO, PONTOS_MARGEM, VARIACAO_CUSTO_MAXIMA, grade_sensibilidade
+
+def espec_mapa(indicador):
+    """Mapa de calor (Vega-Lite) por marketplace
+
+    Especificação pronta, sem Altair: a validação do esquema a cada rerun
+    custava mais que o cálculo da grade.
+    """
+    return {
+        'mark': 'rect',
+        'width': 220,
+        'height': 320,
+        'encoding': {
+            'x': {'field': 'variacao_custo', 'type': 'ordinal', 'title': "Variação do custo (%)",
+                  'axis': {'labelOverlap': True}},
+            'y': {'field': 'margem', 'type': 'ordinal', 'title': "Margem (%)", 'sort': 'descending',
+                  'axis': {'labelOverlap': True}},
+            'color': {'field': 'valor', 'type': 'quantitative', 'title': indicador,
+                      'scale': {'scheme': 'viridis'}},
+            'column': {'field': 'marketplace', 'type': 'nominal', 'title': None},
+            'tooltip': [
+                {'field': 'marketplace', 'type': 'nominal', 'title': "Marketplace"},
+                {'field': 'margem', 'type': 'quantitative', 'title': "Margem (%)"},
+                {'field': 'variacao_custo', 'type': 'quantitative', 'title': "Variação do custo (%)"},
+                {'field': 'valor', 'type': 'quantitative', 'title': indicador},
+            ],
+        },
+    }
+
+def exibir():
+    preparar_regras()
+    
+    st.header("📈 Simulação de Sensibilidade")
+    st.info("Preço e lucro em toda a faixa de margem (0-100%) e de variação de custo, para todos os marketplaces de uma vez")
+    
+    col1, col2 = st.columns([2, 1])
+    
+    with col1:
+        ncm_simulacao = seletor_ncm("ncm_simulacao", "🔍 NCM do Produto", vazio=False)
+        custo_simulacao = st.number_input("Custo Total Unitário (R$)", min_value=0.01, value=100.0, step=1.0)
+        
+        with st.expander("⚙️ Resolução da Grade"):
+            pontos_margem = st.slider("Pontos de margem", 10, 400, PONTOS_MARGEM, 10)
+            pontos_custo = st.slider("Pontos de custo", 5, 120, PONTOS_CUSTO, 5)
+            variacao_maxima = st.slider("Variação de custo (± %)", 5.0, 100.0, VARIACAO_CUSTO_MAXIMA, 5.0)
+    
+    with col2:
+        uf_origem_sim = st.selectbox("UF Origem", UFS, index=UFS.index(uf_origem_padrao()))
+        uf_destino_sim = st.selectbox("UF Destino", UFS, index=UFS.index("RJ"))
+        tipo_cliente_sim = st.radio("Cliente", [CONSUMIDOR_FINAL, CONTRIBUINTE_ICMS])
+    
+    indicador = st.radio("Indicador", ["Preço de Venda (R$)", "Lucro Líquido (R$)", "Lucro Líquido (%)"],
+                         horizontal=True)
+    
+    if ncm_simulacao:
+        dados_ncm = buscar_ncm(ncm_simulacao)
+        icms_sim = buscar_icms_efetivo(uf_origem_sim, uf_destino_sim, tipo_cliente_sim)
+        tributos = perfil_tributos(dados_ncm[2], dados_ncm[3], icms_sim.icms, icms_sim.difal, icms_sim.fcp)
+        canais = {nome: perfil_canal(*buscar_marketplace(nome)[2:6], buscar_faixas(nome, ncm_simulacao))
+                  for nome in listar_marketplaces()}
+        
+        inicio = time.perf_counter()
+        grade = grade_sensibilidade(
+            custo_simulacao, tributos, canais,
+            np.linspace(0.0, 100.0, pontos_margem),
+            np.linspace(-variacao_maxima, variacao_maxima, pontos_custo),
+        )
+        duracao_ms = (time.perf_counter() - inicio) * 1000
+        st.caption(f"⚡ {grade.preco_venda.size:,} cenários calculados em {duracao_ms:.1f} ms".replace(",", "."))
+        
+        valores = {
+            "Preço de Venda (R$)": grade.preco_venda,
+            "Lucro Líquido (R$)": grade.lucro_liquido,
+            "Lucro Líquido (%)": grade.lucro_liquido_pct,
+        }[indicador]
+        
+        # Formato longo: uma linha por célula da grade
+        i_canal, i_margem, i_custo = np.indices(valores.shape)
+        df_grade = pd.DataFrame({
+            'marketplace': np.asarray(grade.marketplaces)[i_canal.ravel()],
+            'margem': grade.margens[i_margem.ravel()].round(2),
+            'variacao_custo': grade.variacoes_custo[i_custo.ravel()].round(2),
+            'valor': valores.ravel().round(2),
+        }).dropna()
+        
+        if df_grade.empty:
+            st.error("❌ Nenhum cenário viável: tributos e taxas já somam 100% ou mais do preço")
+        else:
+            st.vega_lite_chart(df_grade, espec_mapa(indicador))
+        
+        # Corte no custo informado: margens de 10 em 10% por marketplace
+        st.subheader("📋 No custo informado")
+        i_custo_atual = int(np.abs(grade.variacoes_custo).argmin())
+        margens_corte = np.arange(0, 100, 10)
+        i_margens = np.abs(grade.margens[:, None] - margens_corte[None, :]).argmin(axis=0)
+        df_corte = pd.DataFrame(
+            valores[:, i_margens, i_custo_atual].T,
+            index=[f"{m:.0f}%" for m in grade.margens[i_margens]],
+            columns=grade.marketplaces,
+        )
+        df_corte.index.name = "Margem"
+        st.dataframe(df_corte.style.format("{:.2f}", na_rep="—"), use_container_width=True)
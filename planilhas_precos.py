@@ -0,0 +1,524 @@
+"""
+Planilhas de Preços por Canal
+
+Resultado do lote (ou os preços atuais do histórico) em planilhas para subir
+em cada marketplace: um CSV por marketplace e UF de destino, uma pasta XLSX
+por marketplace com uma aba por UF e, opcional, um PDF com o resumo de cada
+grupo (custo, tributos, custos do canal, margem e lucro líquido).
+
+A entrada é lida em blocos e cada grupo grava as suas linhas à medida que
+chegam, com buffer de linhas: a memória não cresce com o catálogo. CSV, XLSX
+e PDF são escritos aqui mesmo, sem dependências: o XLSX é um zip de XML, com
+cada aba em um arquivo temporário até a pasta ser fechada, e o PDF usa só as
+fontes padrão do leitor. Na interface a exportação roda em uma thread
+(exportar_em_segundo_plano) e a página só acompanha o andamento.
+
+Para rodar: python planilhas_precos.py precos.parquet -o planilhas/ --pdf
+            python planilhas_precos.py precos/ -o planilhas/ --formatos xlsx
+            python planilhas_precos.py --atuais -o planilhas/ --pdf
+(precos/ = diretório de partes do lote em paralelo; --atuais = preços atuais do histórico)
+"""
+
+import argparse
+import glob
+import os
+import re
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import zipfile
+from datetime import datetime
+from typing import Callable, NamedTuple
+
+import numpy as np
+import pandas as pd
+
+from banco_dados import conexao, empresa_ativa, inicializar_banco, normalizar_cnpj
+from instrumentacao import medir
+from precificacao_lote import COLUNAS_TEXTO
+
+FORMATOS = ('csv', 'xlsx')
+
+COLUNAS_PLANILHA = (
+    'sku', 'ncm', 'uf_origem', 'uf_destino', 'tipo_cliente',
+    'preco_venda', 'custo_total', 'total_tributos', 'total_custos_canal',
+    'margem_contribuicao', 'lucro_liquido', 'lucro_liquido_pct', 'preco_equilibrio',
+)
+COLUNAS_TEXTO_PLANILHA = COLUNAS_PLANILHA[:5]
+
+# Somas do resumo por marketplace e UF (o PDF mostra os totais e o lucro % médio)
+COLUNAS_RESUMO = ('preco_venda', 'custo_total', 'total_tributos', 'total_custos_canal',
+                  'margem_contribuicao', 'lucro_liquido')
+
+LINHAS_POR_BLOCO = 100_000
+LINHAS_BUFFER = 10_000
+# Limite de linhas de uma aba do Excel, menos o cabeçalho; o resto vai para "SP (2)"
+LINHAS_POR_ABA = 1_048_575
+
+# ============================================
+# ENTRADA EM BLOCOS
+# ============================================
+
+def blocos_do_arquivo(caminho, linhas=LINHAS_POR_BLOCO):
+    """Blocos de um resultado do lote: arquivo CSV/Parquet ou diretório de partes"""
+    if os.path.isdir(caminho):
+        arquivos = sorted(glob.glob(os.path.join(caminho, 'parte-*')))
+    else:
+        arquivos = [caminho]
+    for arquivo in arquivos:
+        if arquivo.lower().endswith(('.parquet', '.pq')):
+            import pyarrow.parquet as pq
+            parquet = pq.ParquetFile(arquivo)
+            # Um row group por vez: iter_batches no arquivo inteiro retém memória até o fim
+            for grupo in range(parquet.num_row_groups):
+                for lote in parquet.iter_batches(batch_size=linhas, row_groups=[grupo]):
+                    yield lote.to_pandas()
+        else:
+            yield from pd.read_csv(arquivo, dtype={c: str for c in COLUNAS_TEXTO},
+                                   keep_default_na=False, na_values=[''], chunksize=linhas)
+
+_SQL_PRECOS_ATUAIS = f'''SELECT s.marketplace, {', '.join(f's.{c}' for c in COLUNAS_PLANILHA)}
+    FROM preco_atual a JOIN preco_snapshot s ON s.id = a.snapshot_id
+    WHERE a.empresa = ? {{filtro}}
+    ORDER BY a.marketplace, a.uf_destino, a.sku'''
+
+def blocos_precos_atuais(marketplace=None, linhas=LINHAS_POR_BLOCO, caminho_banco=None, empresa=None):
+    """Blocos dos preços atuais (último por SKU e canal) da empresa, lidos do cursor
+
+    empresa: CNPJ (padrão: a empresa ativa na chamada, e não na thread que lê
+    os blocos; '' = preços sem empresa).
+    """
+    empresa = (empresa_ativa() or '') if empresa is None else empresa
+    return _ler_precos_atuais(marketplace, linhas, caminho_banco, empresa)
+
+def _ler_precos_atuais(marketplace, linhas, caminho_banco, empresa):
+    filtro, parametros = ('AND a.marketplace = ?', (empresa, marketplace)) if marketplace else ('', (empresa,))
+    colunas = ('marketplace',) + COLUNAS_PLANILHA
+    with conexao(caminho_banco) as conn:
+        cursor = conn.execute(_SQL_PRECOS_ATUAIS.format(filtro=filtro), parametros)
+        while bloco := cursor.fetchmany(linhas):
+            yield pd.DataFrame(bloco, columns=colunas)
+
+# ============================================
+# CSV E XLSX
+# ============================================
+
+def _nome_arquivo(nome):
+    return re.sub(r'[^\w\- ]+', '_', str(nome)).strip() or 'sem_nome'
+
+def _escapar_csv(valores):
+    especiais = valores.str.contains(r'[,"\r\n]')
+    if not especiais.any():
+        return valores
+    return valores.where(~especiais, '"' + valores.str.replace('"', '""', regex=False) + '"')
+
+def _escapar_xml(valores):
+    if not valores.str.contains(r'[&<>]').any():
+        return valores
+    return (valores.str.replace('&', '&amp;', regex=False)
+            .str.replace('<', '&lt;', regex=False)
+            .str.replace('>', '&gt;', regex=False))
+
+class _Formato(NamedTuple):
+    celula_texto: str    # modelo '%' da célula de texto
+    celula_numero: str   # modelo da célula de número ({} = '%.2f')
+    vazio: str           # célula de número vazio (NaN)
+    escapar: Callable
+    separador: str
+    inicio: str
+    fim: str
+
+_CSV = _Formato('%s', '{}', '', _escapar_csv, ',', '', '\n')
+_XML = _Formato('<c t="inlineStr"><is><t>%s</t></is></c>', '<c><v>{}</v></c>', '<c/>',
+                _escapar_xml, '', '<row>', '</row>')
+
+def _texto_linhas(grupo, formato):
+    # Um modelo '%' por linha aplicado às colunas em listas: bem mais rápido que
+    # formatar célula a célula no pandas. Valores com 2 casas decimais.
+    modelos, colunas = [], []
+    for coluna in COLUNAS_PLANILHA:
+        if coluna in COLUNAS_TEXTO_PLANILHA:
+            modelos.append(formato.celula_texto)
+            colunas.append(formato.escapar(grupo[coluna].fillna('').astype(str)).tolist())
+            continue
+        numeros = pd.to_numeric(grupo[coluna], errors='coerce').to_numpy(np.float64, na_value=np.nan)
+        finitos = np.isfinite(numeros)
+        celula = formato.celula_numero.format('%.2f')
+        if finitos.all():
+            modelos.append(celula)
+            colunas.append(numeros.tolist())
+        else:
+            modelos.append('%s')
+            colunas.append([celula % v if ok else formato.vazio
+                            for v, ok in zip(numeros.tolist(), finitos.tolist())])
+    modelo = formato.inicio + formato.separador.join(modelos) + formato.fim
+    return ''.join([modelo % linha for linha in zip(*colunas)])
+
+class _ArquivoLinhas:
+    """Linhas de um grupo acumuladas e gravadas no arquivo de LINHAS_BUFFER em LINHAS_BUFFER"""
+
+    def __init__(self, arquivo, formato):
+        self.arquivo = arquivo
+        self.linhas = 0
+        self._formato = formato
+        self._buffer = []
+        self._no_buffer = 0
+        cabecalho = [formato.celula_texto % c for c in COLUNAS_PLANILHA]
+        arquivo.write((formato.inicio + formato.separador.join(cabecalho) + formato.fim).encode())
+
+    def escrever(self, grupo):
+        self._buffer.append(grupo)
+        self._no_buffer += len(grupo)
+        self.linhas += len(grupo)
+        if self._no_buffer >= LINHAS_BUFFER:
+            self.descarregar()
+
+    def descarregar(self):
+        if self._buffer:
+            texto = _texto_linhas(pd.concat(self._buffer, ignore_index=True), self._formato)
+            self.arquivo.write(texto.encode())
+            self._buffer, self._no_buffer = [], 0
+
+class _PlanilhaCSV(_ArquivoLinhas):
+    """CSV de um marketplace e UF"""
+
+    def __init__(self, caminho):
+        self.caminho = caminho
+        super().__init__(open(caminho, 'wb'), _CSV)
+
+    def fechar(self):
+        self.descarregar()
+        self.arquivo.close()
+
+class _AbaXLSX(_ArquivoLinhas):
+    """Uma aba da pasta, em arquivo temporário até a pasta ser fechada"""
+
+    def __init__(self, nome):
+        self.nome = nome
+        super().__init__(tempfile.TemporaryFile(), _XML)
+
+_CONTENT_TYPES = '''<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">
+<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>
+<Default Extension="xml" ContentType="application/xml"/>
+<Override PartName="/xl/workbook.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>
+{abas}</Types>'''
+_CONTENT_TYPE_ABA = ('<Override PartName="/xl/worksheets/sheet{i}.xml" ContentType='
+                     '"application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>\n')
+_RELS = '''<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">
+<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="xl/workbook.xml"/>
+</Relationships>'''
+_WORKBOOK = '''<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">
+<sheets>{abas}</sheets>
+</workbook>'''
+_WORKBOOK_RELS = '''<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">
+{abas}</Relationships>'''
+_REL_ABA = ('<Relationship Id="rId{i}" Type="http://schemas.openxmlformats.org/officeDocument/2006/'
+            'relationships/worksheet" Target="worksheets/sheet{i}.xml"/>\n')
+_INICIO_ABA = ('<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+               '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>')
+_FIM_ABA = '</sheetData></worksheet>'
+
+class _PastaXLSX:
+    """Pasta XLSX de um marketplace: uma aba por UF (e mais abas se passar do limite do Excel)"""
+
+    def __init__(self, caminho):
+        self.caminho = caminho
+        self._abas = {}  # UF -> abas, a última recebe as linhas
+
+    def escrever(self, uf, grupo):
+        abas = self._abas.setdefault(uf, [_AbaXLSX(uf)])
+        inicio = 0
+        while inicio < len(grupo):
+            aba = abas[-1]
+            if aba.linhas >= LINHAS_POR_ABA:
+                aba.descarregar()
+                aba = _AbaXLSX(f'{uf} ({len(abas) + 1})')
+                abas.append(aba)
+            parte = grupo.iloc[inicio:inicio + LINHAS_POR_ABA - aba.linhas]
+            aba.escrever(parte)
+            inicio += len(parte)
+
+    def fechar(self):
+        abas = [aba for uf in sorted(self._abas) for aba in self._abas[uf]]
+        with zipfile.ZipFile(self.caminho, 'w', zipfile.ZIP_DEFLATED, compresslevel=1) as pasta:
+            pasta.writestr('[Content_Types].xml', _CONTENT_TYPES.format(
+                abas=''.join(_CONTENT_TYPE_ABA.format(i=i) for i in range(1, len(abas) + 1))))
+            pasta.writestr('_rels/.rels', _RELS)
+            pasta.writestr('xl/workbook.xml', _WORKBOOK.format(abas=''.join(
+                f'<sheet name="{aba.nome}" sheetId="{i}" r:id="rId{i}"/>'
+                for i, aba in enumerate(abas, 1))))
+            pasta.writestr('xl/_rels/workbook.xml.rels', _WORKBOOK_RELS.format(
+                abas=''.join(_REL_ABA.format(i=i) for i in range(1, len(abas) + 1))))
+            for i, aba in enumerate(abas, 1):
+                aba.descarregar()
+                aba.arquivo.seek(0)
+                with pasta.open(f'xl/worksheets/sheet{i}.xml', 'w', force_zip64=True) as destino:
+                    destino.write(_INICIO_ABA.encode())
+                    shutil.copyfileobj(aba.arquivo, destino, 1 << 20)
+                    destino.write(_FIM_ABA.encode())
+                aba.arquivo.close()
+
+    def descartar(self):
+        """Fecha os temporários sem gravar a pasta"""
+        for abas in self._abas.values():
+            for aba in abas:
+                aba.arquivo.close()
+
+# ============================================
+# RESUMO EM PDF
+# ============================================
+
+def _pdf_texto(texto):
+    texto = texto.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)')
+    return texto.encode('cp1252', errors='replace')
+
+def gravar_pdf(caminho, titulo, linhas, linhas_por_pagina=58):
+    """PDF de texto (A4 paisagem, Courier 8): uma linha da lista por linha da página"""
+    paginas = [linhas[i:i + linhas_por_pagina] for i in range(0, max(len(linhas), 1), linhas_por_pagina)]
+    objetos = []  # corpo de cada objeto, na ordem dos números (1 = catálogo, 2 = páginas, 3 = fonte)
+    objetos.append(b'<< /Type /Catalog /Pages 2 0 R >>')
+    filhos = ' '.join(f'{4 + 2 * i} 0 R' for i in range(len(paginas)))
+    objetos.append(f'<< /Type /Pages /Kids [{filhos}] /Count {len(paginas)} >>'.encode())
+    objetos.append(b'<< /Type /Font /Subtype /Type1 /BaseFont /Courier /Encoding /WinAnsiEncoding >>')
+    for numero, pagina in enumerate(paginas, 1):
+        conteudo = [b'BT /F1 11 Tf 40 560 Td (' + _pdf_texto(titulo) + b') Tj',
+                    b'/F1 8 Tf 0 -20 Td 9 TL']
+        conteudo += [b'(' + _pdf_texto(linha) + b") '" for linha in pagina]
+        conteudo += [b'/F1 7 Tf 0 -14 Td (' + _pdf_texto(f'Página {numero} de {len(paginas)}') + b') Tj ET']
+        fluxo = b'\n'.join(conteudo)
+        objetos.append(f'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 842 595] '
+                       f'/Resources << /Font << /F1 3 0 R >> >> /Contents {5 + 2 * (numero - 1)} 0 R >>'
+                       .encode())
+        objetos.append(f'<< /Length {len(fluxo)} >>\nstream\n'.encode() + fluxo + b'\nendstream')
+
+    with open(caminho, 'wb') as arquivo:
+        arquivo.write(b'%PDF-1.4\n')
+        posicoes = []
+        for numero, corpo in enumerate(objetos, 1):
+            posicoes.append(arquivo.tell())
+            arquivo.write(f'{numero} 0 obj\n'.encode() + corpo + b'\nendobj\n')
+        inicio_xref = arquivo.tell()
+        arquivo.write(f'xref\n0 {len(objetos) + 1}\n0000000000 65535 f \n'.encode())
+        arquivo.write(''.join(f'{p:010d} 00000 n \n' for p in posicoes).encode())
+        arquivo.write(f'trailer\n<< /Size {len(objetos) + 1} /Root 1 0 R >>\n'
+                      f'startxref\n{inicio_xref}\n%%EOF\n'.encode())
+
+def _linhas_resumo(resumo, erros):
+    # Tabela de texto: uma linha por marketplace e UF, total do marketplace e total geral
+    cabecalho = (f"{'Marketplace':<20}{'UF':<4}{'Linhas':>10}{'Faturamento':>16}{'Custo':>16}"
+                 f"{'Tributos':>16}{'Custos canal':>16}{'Margem':>16}{'Lucro líq.':>16}{'Lucro %':>9}")
+
+    def linha(marketplace, uf, somas):
+        lucro_pct = somas['lucro_liquido'] / somas['preco_venda'] * 100 if somas['preco_venda'] else 0.0
+        return (f"{marketplace[:19]:<20}{uf:<4}{int(somas['linhas']):>10,}"
+                + ''.join(f"{somas[c]:>16,.2f}" for c in COLUNAS_RESUMO)
+                + f"{lucro_pct:>9.1f}")
+
+    linhas = [cabecalho, '-' * len(cabecalho)]
+    total = dict.fromkeys(('linhas',) + COLUNAS_RESUMO, 0.0)
+    for marketplace in sorted(resumo):
+        do_marketplace = dict.fromkeys(total, 0.0)
+        for uf in sorted(resumo[marketplace]):
+            somas = resumo[marketplace][uf]
+            linhas.append(linha(marketplace, uf, somas))
+            for chave in do_marketplace:
+                do_marketplace[chave] += somas[chave]
+        linhas.append(linha(f'{marketplace} (total)', '', do_marketplace))
+        linhas.append('')
+        for chave in total:
+            total[chave] += do_marketplace[chave]
+    linhas.append(linha('TOTAL', '', total))
+    if erros:
+        linhas.append(f'{erros:,} linhas com erro (sem preço) ficaram fora das planilhas')
+    return linhas
+
+# ============================================
+# EXPORTAÇÃO
+# ============================================
+
+def _somar_resumo(resumo, validas):
+    somas = validas.groupby(['marketplace', 'uf_destino'], sort=False)[list(COLUNAS_RESUMO)].sum()
+    contagens = validas.groupby(['marketplace', 'uf_destino'], sort=False).size()
+    for (marketplace, uf), valores in somas.iterrows():
+        grupo = resumo.setdefault(marketplace, {}).setdefault(
+            uf, dict.fromkeys(('linhas',) + COLUNAS_RESUMO, 0.0))
+        grupo['linhas'] += contagens[(marketplace, uf)]
+        for coluna in COLUNAS_RESUMO:
+            grupo[coluna] += valores[coluna]
+
+def exportar_planilhas(blocos, destino, formatos=FORMATOS, pdf=False, progresso=None):
+    """Grava as planilhas de preços dos `blocos` (DataFrames do lote) no diretório `destino`
+
+    CSV em destino/<marketplace>/<UF>.csv, XLSX em destino/<marketplace>.xlsx
+    (uma aba por UF) e, com `pdf`, o resumo em destino/resumo.pdf. Linhas com
+    erro ficam de fora (e são contadas no resumo). `progresso(linhas)` é
+    chamado a cada bloco. Retorna (linhas gravadas, linhas com erro, arquivos).
+    """
+    desconhecidos = set(formatos) - set(FORMATOS)
+    if desconhecidos:
+        raise ValueError(f"formato desconhecido: {', '.join(sorted(desconhecidos))}")
+    os.makedirs(destino, exist_ok=True)
+    csvs, pastas, resumo = {}, {}, {}
+    linhas = erros = lidas = 0
+    try:
+        with medir('exportar_planilhas'):
+            for bloco in blocos:
+                lidas += len(bloco)
+                if 'erro' in bloco:
+                    com_erro = bloco['erro'].fillna('').astype(str) != ''
+                    erros += int(com_erro.sum())
+                    bloco = bloco[~com_erro]
+                bloco = bloco.reindex(columns=('marketplace',) + COLUNAS_PLANILHA)
+                for coluna in COLUNAS_RESUMO:
+                    bloco[coluna] = pd.to_numeric(bloco[coluna], errors='coerce')
+                bloco['marketplace'] = bloco['marketplace'].fillna('').astype(str)
+                bloco['uf_destino'] = bloco['uf_destino'].fillna('').astype(str)
+
+                for (marketplace, uf), grupo in bloco.groupby(['marketplace', 'uf_destino'], sort=False):
+                    grupo = grupo[list(COLUNAS_PLANILHA)]
+                    if 'csv' in formatos:
+                        planilha = csvs.get((marketplace, uf))
+                        if planilha is None:
+                            pasta = os.path.join(destino, _nome_arquivo(marketplace))
+                            os.makedirs(pasta, exist_ok=True)
+                            planilha = csvs[(marketplace, uf)] = _PlanilhaCSV(
+                                os.path.join(pasta, f'{_nome_arquivo(uf)}.csv'))
+                        planilha.escrever(grupo)
+                    if 'xlsx' in formatos:
+                        pasta = pastas.get(marketplace)
+                        if pasta is None:
+                            pasta = pastas[marketplace] = _PastaXLSX(
+                                os.path.join(destino, f'{_nome_arquivo(marketplace)}.xlsx'))
+                        pasta.escrever(_nome_arquivo(uf)[:31], grupo)
+                if pdf:
+                    _somar_resumo(resumo, bloco)
+                linhas += len(bloco)
+                if progresso:
+                    progresso(lidas)
+
+            arquivos = []
+            for planilha in csvs.values():
+                planilha.fechar()
+                arquivos.append(planilha.caminho)
+            for pasta in pastas.values():
+                pasta.fechar()
+                arquivos.append(pasta.caminho)
+            csvs, pastas = {}, {}
+            if pdf:
+                caminho = os.path.join(destino, 'resumo.pdf')
+                gravar_pdf(caminho, f"Planilhas de preços - resumo ({datetime.now():%d/%m/%Y %H:%M})",
+                           _linhas_resumo(resumo, erros))
+                arquivos.append(caminho)
+    finally:
+        # Em caso de erro, fecha o que ficou aberto (as pastas XLSX não chegam a ser gravadas)
+        for planilha in csvs.values():
+            planilha.fechar()
+        for pasta in pastas.values():
+            pasta.descartar()
+    return linhas, erros, sorted(arquivos)
+
+def compactar(destino, arquivos, caminho_zip):
+    """Junta os arquivos gerados em um zip (XLSX já é compactado: vai sem recompressão)"""
+    with zipfile.ZipFile(caminho_zip, 'w', zipfile.ZIP_DEFLATED, compresslevel=1) as pacote:
+        for arquivo in arquivos:
+            compressao = zipfile.ZIP_STORED if arquivo.endswith('.xlsx') else zipfile.ZIP_DEFLATED
+            pacote.write(arquivo, os.path.relpath(arquivo, destino), compress_type=compressao)
+    return caminho_zip
+
+class TarefaExportacao:
+    """Exportação rodando em uma thread; quem iniciou só consulta o andamento"""
+
+    def __init__(self, destino):
+        self.destino = destino
+        self.linhas = 0          # lidas até agora
+        self.erros = 0
+        self.arquivos = []
+        self.pacote = None       # zip com tudo, ao concluir
+        self.erro = None
+        self.inicio = time.perf_counter()
+        self.duracao = None
+        self._thread = None
+
+    @property
+    def concluida(self):
+        return self.duracao is not None
+
+    def _executar(self, blocos, formatos, pdf):
+        def progresso(linhas):
+            self.linhas = linhas
+        try:
+            linhas, self.erros, self.arquivos = exportar_planilhas(blocos, self.destino, formatos, pdf,
+                                                                   progresso)
+            self.pacote = compactar(self.destino, self.arquivos,
+                                    os.path.join(self.destino, 'planilhas.zip'))
+        except Exception as erro:
+            self.erro = erro
+        finally:
+            self.duracao = time.perf_counter() - self.inicio
+
+    def aguardar(self, timeout=None):
+        self._thread.join(timeout)
+        return self.concluida
+
+def exportar_em_segundo_plano(blocos, destino=None, formatos=FORMATOS, pdf=False):
+    """Inicia exportar_planilhas em uma thread e devolve a TarefaExportacao
+
+    Sem `destino`, grava em um diretório temporário novo.
+    """
+    tarefa = TarefaExportacao(destino or tempfile.mkdtemp(prefix='planilhas-'))
+    tarefa._thread = threading.Thread(target=tarefa._executar, args=(blocos, formatos, pdf),
+                                      name='exportar-planilhas', daemon=True)
+    tarefa._thread.start()
+    return tarefa
+
+# ============================================
+# LINHA DE COMANDO
+# ============================================
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Planilhas de preços por marketplace e UF de destino")
+    parser.add_argument('entrada', nargs='?',
+                        help="resultado do lote (.csv/.parquet) ou diretório das partes")
+    parser.add_argument('-o', '--saida', required=True, help="diretório das planilhas")
+    parser.add_argument('--atuais', action='store_true',
+                        help="usa os preços atuais do histórico no lugar de um arquivo")
+    parser.add_argument('--marketplace', help="com --atuais, só este marketplace")
+    parser.add_argument('--empresa', help="com --atuais, os preços da empresa (CNPJ; padrão: sem empresa)")
+    parser.add_argument('--formatos', default=','.join(FORMATOS),
+                        help="formatos separados por vírgula (padrão: csv,xlsx)")
+    parser.add_argument('--pdf', action='store_true', help="grava também o resumo em PDF")
+    parser.add_argument('--banco', help="caminho do banco de regras (padrão: PRECIFICADOR_DB)")
+    args = parser.parse_args(argv)
+
+    if args.atuais == bool(args.entrada):
+        parser.error("informe o arquivo de entrada ou --atuais")
+    formatos = [f.strip() for f in args.formatos.split(',') if f.strip()]
+    if args.atuais:
+        inicializar_banco(args.banco)
+        try:
+            empresa = normalizar_cnpj(args.empresa) if args.empresa else ''
+        except ValueError as erro:
+            parser.error(str(erro))
+        blocos = blocos_precos_atuais(args.marketplace, caminho_banco=args.banco, empresa=empresa)
+    else:
+        blocos = blocos_do_arquivo(args.entrada)
+
+    inicio = time.perf_counter()
+    try:
+        linhas, erros, arquivos = exportar_planilhas(blocos, args.saida, formatos, args.pdf)
+    except ValueError as erro:
+        print(erro, file=sys.stderr)
+        return 1
+    duracao = time.perf_counter() - inicio
+    print(f"{linhas} linhas em {len(arquivos)} arquivos em {duracao:.2f}s "
+          f"({erros} com erro, fora das planilhas) -> {args.saida}")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,437 @@
+"""
+Precificação em Lote - Catálogo Inteiro
+
+Lê um catálogo (CSV ou Parquet), junta cada linha às regras tributárias e
+calcula preço, tributos, margem e lucro com operações vetorizadas do NumPy
+(mesma fórmula de motor_precificacao, sem laço por linha).
+
+Para rodar: python precificacao_lote.py catalogo.csv -o precos.parquet
+Em paralelo: python precificacao_lote.py catalogo.csv -o precos/ --workers 8 \
+                 --ufs-destino SP,RJ,MG --marketplaces todos --tipos-cliente todos
+Com snapshot: python precificacao_lote.py catalogo.csv -o precos/ --workers 8 --regras regras.snap
+Por empresa: python precificacao_lote.py catalogo.csv -o precos.parquet --empresa 12345678000190
+
+Cada execução grava os preços calculados no histórico (preco_snapshot), com
+o mesmo timestamp em todas as linhas; --sem-historico desliga.
+
+Colunas do catálogo (as opcionais assumem o valor padrão):
+    ncm, custo_aquisicao, uf_destino, marketplace, margem_alvo
+    sku, ipi_nao_recuperavel, outros_custos, credito_icms, credito_pis,
+    credito_cofins, uf_origem (a da empresa; sem empresa, SP), tipo_cliente (Consumidor Final),
+    lucro_liquido_alvo (R$; gera a coluna preco_lucro_alvo),
+    data_referencia (AAAA-MM-DD; regras vigentes nessa data, padrão hoje)
+"""
+
+import argparse
+import itertools
+import math
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, as_completed, wait
+
+import numpy as np
+import pandas as pd
+
+from banco_dados import definir_empresa, empresa_ativa, inicializar_banco
+from cache_regras import obter_cache, listar_marketplaces
+from faixas_taxas import na_faixa, resolver_faixas
+from historico_precos import agora, gravar_snapshots, snapshots_do_catalogo
+from matriz_icms import indices_tipo_cliente, indices_uf
+from snapshot_regras import abrir_snapshot
+from tabelas_regras import TabelasRegras
+from vigencia import dia, dias
+from motor_precificacao import (
+    ALIQUOTA_IRPJ_CSLL,
+    CONSUMIDOR_FINAL,
+    CONTRIBUINTE_ICMS,
+)
+
+COLUNAS_OBRIGATORIAS = ('ncm', 'custo_aquisicao', 'uf_destino', 'marketplace', 'margem_alvo')
+
+PADROES = {
+    'ipi_nao_recuperavel': 0.0,
+    'outros_custos': 0.0,
+    'credito_icms': 0.0,
+    'credito_pis': 0.0,
+    'credito_cofins': 0.0,
+    'uf_origem': 'SP',
+    'tipo_cliente': CONSUMIDOR_FINAL,
+}
+
+COLUNAS_TEXTO = ('sku', 'ncm', 'uf_origem', 'uf_destino', 'tipo_cliente', 'marketplace')
+
+COLUNAS_VALORES = (
+    'custo_total', 'preco_venda',
+    'valor_pis', 'valor_cofins', 'valor_icms', 'valor_difal', 'valor_fcp', 'total_tributos',
+    'valor_comissao', 'valor_taxa_fixa', 'valor_antecipacao', 'valor_gateway', 'total_custos_canal',
+    'margem_contribuicao', 'irpj_csll', 'lucro_liquido', 'preco_equilibrio',
+)
+
+COLUNAS_PERCENTUAIS = ('margem_percentual', 'lucro_liquido_pct')
+
+# ============================================
+# LEITURA E GRAVAÇÃO
+# ============================================
+
+def _formato(caminho):
+    return 'parquet' if caminho.lower().endswith(('.parquet', '.pq')) else 'csv'
+
+def ler_catalogo(caminho):
+    """Lê o catálogo de um arquivo CSV ou Parquet"""
+    if _formato(caminho) == 'parquet':
+        return pd.read_parquet(caminho)
+    # NCM e UFs como texto: preserva zeros à esquerda
+    return pd.read_csv(caminho, dtype={c: str for c in COLUNAS_TEXTO})
+
+def gravar_resultado(resultado, caminho):
+    """Grava o resultado em CSV ou Parquet, conforme a extensão"""
+    if _formato(caminho) == 'parquet':
+        resultado.to_parquet(caminho, index=False)
+    else:
+        resultado.to_csv(caminho, index=False)
+
+# ============================================
+# CÁLCULO VETORIZADO
+# ============================================
+
+def _normalizar(catalogo, uf_origem=None):
+    faltando = [c for c in COLUNAS_OBRIGATORIAS if c not in catalogo.columns]
+    if faltando:
+        raise ValueError(f"Colunas obrigatórias ausentes no catálogo: {', '.join(faltando)}")
+    df = catalogo.copy()
+    padroes = {**PADROES, 'uf_origem': uf_origem} if uf_origem else PADROES
+    for coluna, padrao in padroes.items():
+        if coluna not in df.columns:
+            df[coluna] = padrao
+        else:
+            df[coluna] = df[coluna].fillna(padrao)
+    for coluna in COLUNAS_TEXTO:
+        if coluna in df.columns:
+            df[coluna] = df[coluna].astype(str).str.strip()
+    return df
+
+def tabelas_atuais(cache=None):
+    """Tabelas de regras em arrays, montadas do cache sincronizado com o banco"""
+    cache = cache or obter_cache()
+    cache.sincronizar()
+    return cache.tabelas()
+
+def precificar_catalogo(catalogo, tabelas=None, uf_origem=None):
+    """Preço e detalhamento de cada linha do catálogo (DataFrame de entrada -> DataFrame de saída)
+
+    Linhas com NCM ou marketplace não cadastrado, ou com percentuais somando
+    100% ou mais, saem com a coluna `erro` preenchida e valores vazios.
+    NCM sem regra própria usa a do prefixo; `nivel_ncm` diz de qual (8, 6, 4
+    ou 2 dígitos).
+    Toda linha recebe o preco_equilibrio; com a coluna lucro_liquido_alvo,
+    também o preco_lucro_alvo.
+    Marketplaces com taxas por faixa de preço: comissão e taxa fixa são as da
+    faixa em que cai o preço calculado (faixas_taxas.resolver_faixas).
+    Linhas sem uf_origem usam `uf_origem`; sem ele e sem `tabelas`, a da
+    empresa ativa.
+    """
+    if tabelas is None:
+        cache = obter_cache()
+        tabelas = tabelas_atuais(cache)
+        uf_origem = uf_origem or cache.uf_origem
+    df = _normalizar(catalogo, uf_origem)
+
+    # Data de referência de cada linha: escolhe a vigência das regras
+    if 'data_referencia' in df.columns:
+        dias_ref, data_ok, informada = dias(df['data_referencia'])
+        iso = dias_ref.astype('datetime64[D]').astype(str)
+        df['data_referencia'] = np.where(data_ok, np.where(informada, iso, None), df['data_referencia'])
+    else:
+        dias_ref, data_ok = dia(), np.ones(len(df), dtype=bool)
+
+    # Regras do NCM (ou do capítulo/posição/subposição, sem regra própria)
+    pos_ncm, nivel_ncm = tabelas.buscar_ncm(df['ncm'].to_numpy(), dias_ref)
+    ncm_ok = pos_ncm >= 0
+    aliq_pis, aliq_cofins = tabelas.colunas('ncm', pos_ncm, ('aliquota_pis', 'aliquota_cofins'))
+
+    # ICMS efetivo: um índice na matriz por linha
+    origem = indices_uf(df['uf_origem'].to_numpy())
+    destino = indices_uf(df['uf_destino'].to_numpy())
+    tipo = indices_tipo_cliente(df['tipo_cliente'].to_numpy())
+    uf_ok = (origem >= 0) & (destino >= 0)
+    aliq_icms, aliq_difal, aliq_fcp, rota_ok = tabelas.matriz_icms().vetorizado(
+        origem, destino, tipo, dias_ref)
+
+    # Taxas do marketplace; a taxa única é a primeira faixa de preço
+    pos_mkt = tabelas.buscar('marketplace', df['marketplace'].to_numpy(), dias_ref)
+    mkt_ok = pos_mkt >= 0
+    comissao_padrao, taxa_fixa_padrao, taxa_antecipacao, taxa_gateway = tabelas.colunas(
+        'marketplace', pos_mkt, ('comissao_padrao', 'taxa_fixa', 'taxa_antecipacao', 'taxa_gateway'))
+    minimos, comissoes, fixas = tabelas.faixas(
+        tabelas.buscar_faixas(pos_mkt, df['ncm'].to_numpy(), dias_ref), comissao_padrao, taxa_fixa_padrao)
+
+    custo_total = (
+        df['custo_aquisicao'].to_numpy(np.float64)
+        + df['ipi_nao_recuperavel'].to_numpy(np.float64)
+        + df['outros_custos'].to_numpy(np.float64)
+        - df['credito_icms'].to_numpy(np.float64)
+        - df['credito_pis'].to_numpy(np.float64)
+        - df['credito_cofins'].to_numpy(np.float64)
+    )
+    pct_margem = df['margem_alvo'].to_numpy(np.float64) / 100
+    pct_tributos = (aliq_pis + aliq_cofins + aliq_icms + aliq_difal + aliq_fcp) / 100
+    pct_variaveis_faixas = (comissoes + taxa_antecipacao[:, None] + taxa_gateway[:, None]) / 100
+
+    # Preço e faixa juntos: um passo por faixa, sem laço por linha. NaN já
+    # marca NCM/marketplace ausentes; sem faixa possível (percentuais >= 100%), erro
+    preco_venda, faixa = resolver_faixas(custo_total, pct_margem + pct_tributos,
+                                         minimos, pct_variaveis_faixas, fixas)
+    comissao, taxa_fixa = na_faixa(comissoes, faixa), na_faixa(fixas, faixa)
+    base_ok = ncm_ok & mkt_ok & uf_ok & (tipo >= 0) & data_ok
+    valido = base_ok & (faixa >= 0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        preco_venda = np.where(valido, preco_venda, np.nan)
+
+        valor_pis = preco_venda * (aliq_pis / 100)
+        valor_cofins = preco_venda * (aliq_cofins / 100)
+        valor_icms = preco_venda * (aliq_icms / 100)
+        valor_difal = preco_venda * (aliq_difal / 100)
+        valor_fcp = preco_venda * (aliq_fcp / 100)
+        total_tributos = valor_pis + valor_cofins + valor_icms + valor_difal + valor_fcp
+
+        valor_comissao = preco_venda * (comissao / 100)
+        valor_antecipacao = preco_venda * (taxa_antecipacao / 100)
+        valor_gateway = preco_venda * (taxa_gateway / 100)
+        valor_taxa_fixa = np.where(valido, taxa_fixa, np.nan)
+        total_custos_canal = valor_comissao + valor_taxa_fixa + valor_antecipacao + valor_gateway
+
+        margem_contribuicao = preco_venda - custo_total - total_tributos - total_custos_canal
+        margem_percentual = margem_contribuicao / preco_venda * 100
+
+        irpj_csll = margem_contribuicao * float(ALIQUOTA_IRPJ_CSLL)
+        lucro_liquido = margem_contribuicao - irpj_csll
+        lucro_liquido_pct = lucro_liquido / preco_venda * 100
+
+        # Solução inversa em forma fechada por faixa (ver motor_precificacao.preco_para_lucro_liquido)
+        preco_equilibrio = np.where(base_ok, resolver_faixas(
+            custo_total, pct_tributos, minimos, pct_variaveis_faixas, fixas)[0], np.nan)
+        if 'lucro_liquido_alvo' in df.columns:
+            margem_necessaria = (df['lucro_liquido_alvo'].to_numpy(np.float64)
+                                 / (1 - float(ALIQUOTA_IRPJ_CSLL)))
+            preco_lucro_alvo = np.where(base_ok, resolver_faixas(
+                custo_total + margem_necessaria, pct_tributos, minimos, pct_variaveis_faixas, fixas)[0],
+                np.nan)
+
+    erro = np.full(len(df), '', dtype=object)
+    erro[faixa < 0] = 'percentuais somam 100% ou mais'
+    erro[tipo < 0] = 'tipo de cliente inválido'
+    erro[~uf_ok] = 'UF inválida'
+    erro[~mkt_ok] = 'marketplace não cadastrado'
+    erro[~ncm_ok] = 'NCM não cadastrado'
+    erro[~data_ok] = 'data de referência inválida'
+
+    novas = {
+        'nivel_ncm': nivel_ncm, 'aliquota_pis': aliq_pis, 'aliquota_cofins': aliq_cofins,
+        'aliquota_icms': aliq_icms, 'aliquota_difal': aliq_difal, 'aliquota_fcp': aliq_fcp,
+        'rota_cadastrada': rota_ok, 'comissao': comissao, 'taxa_antecipacao': taxa_antecipacao,
+        'taxa_gateway': taxa_gateway,
+    }
+    valores = {
+        'custo_total': custo_total, 'preco_venda': preco_venda,
+        'valor_pis': valor_pis, 'valor_cofins': valor_cofins, 'valor_icms': valor_icms,
+        'valor_difal': valor_difal, 'valor_fcp': valor_fcp, 'total_tributos': total_tributos,
+        'valor_comissao': valor_comissao, 'valor_taxa_fixa': valor_taxa_fixa,
+        'valor_antecipacao': valor_antecipacao, 'valor_gateway': valor_gateway,
+        'total_custos_canal': total_custos_canal, 'margem_contribuicao': margem_contribuicao,
+        'irpj_csll': irpj_csll, 'lucro_liquido': lucro_liquido,
+        'margem_percentual': margem_percentual, 'lucro_liquido_pct': lucro_liquido_pct,
+        'preco_equilibrio': preco_equilibrio,
+    }
+    for coluna in COLUNAS_VALORES + COLUNAS_PERCENTUAIS:
+        novas[coluna] = np.round(valores[coluna], 2)
+    if 'lucro_liquido_alvo' in df.columns:
+        novas['preco_lucro_alvo'] = np.round(preco_lucro_alvo, 2)
+    novas['erro'] = erro
+    # Um concat só: inserir coluna a coluna custa ~0,5 ms cada, o grosso de um lote pequeno
+    entrada = df.drop(columns=[c for c in novas if c in df.columns])
+    return pd.concat([entrada, pd.DataFrame(novas, index=df.index)], axis=1)
+
+# ============================================
+# EXPANSÃO E EXECUÇÃO PARALELA
+# ============================================
+
+# Linhas de saída por arquivo de parte. Cada worker mantém uma parte em memória
+# (~1,5 KB por linha com os intermediários), então o pico do job fica em torno
+# de workers x LINHAS_POR_PARTE x 1,5 KB: 8 workers x 200 mil linhas ≈ 2,4 GB.
+LINHAS_POR_PARTE = 200_000
+
+EIXOS_EXPANSAO = ('uf_destino', 'marketplace', 'tipo_cliente')
+
+def expandir_catalogo(catalogo, uf_destino=None, marketplace=None, tipo_cliente=None):
+    """Cruza cada linha com as UFs de destino, marketplaces e tipos de cliente informados"""
+    eixos = [(coluna, valores) for coluna, valores in
+             zip(EIXOS_EXPANSAO, (uf_destino, marketplace, tipo_cliente)) if valores]
+    if not eixos:
+        return catalogo
+    combinacoes = list(itertools.product(*(valores for _, valores in eixos)))
+    n, k = len(catalogo), len(combinacoes)
+    expandido = catalogo.iloc[np.repeat(np.arange(n), k)].reset_index(drop=True)
+    for i, (coluna, _) in enumerate(eixos):
+        expandido[coluna] = np.tile(np.array([c[i] for c in combinacoes], dtype=object), n)
+    return expandido
+
+def _ler_em_blocos(caminho, linhas):
+    if _formato(caminho) == 'parquet':
+        import pyarrow.parquet as pq
+        parquet = pq.ParquetFile(caminho)
+        # Um row group por vez: iter_batches no arquivo inteiro retém memória até o fim
+        for grupo in range(parquet.num_row_groups):
+            for lote in parquet.iter_batches(batch_size=linhas, row_groups=[grupo]):
+                yield lote.to_pandas()
+    else:
+        yield from pd.read_csv(caminho, dtype={c: str for c in COLUNAS_TEXTO}, chunksize=linhas)
+
+# Tabelas abertas da memória compartilhada, uma vez por processo worker
+_tabelas_worker = None
+
+def _iniciar_worker(nome_memoria, layout):
+    global _tabelas_worker
+    _tabelas_worker = TabelasRegras.abrir_publicadas(nome_memoria, layout)
+
+def _iniciar_worker_snapshot(caminho):
+    global _tabelas_worker
+    _tabelas_worker = abrir_snapshot(caminho)
+
+def _precificar_parte(numero, bloco, expansao, destino, formato, data_historico, uf_origem, empresa):
+    resultado = precificar_catalogo(expandir_catalogo(bloco, **expansao), _tabelas_worker, uf_origem)
+    gravar_resultado(resultado, os.path.join(destino, f'parte-{numero:05d}.{formato}'))
+    # Os snapshots voltam para o processo principal, o único que grava no banco; a empresa
+    # vem dele (o worker não tem a empresa ativa)
+    snapshots = list(snapshots_do_catalogo(resultado, 'lote', data_historico, empresa)) if data_historico else []
+    return len(resultado), int((resultado['erro'] != '').sum()), snapshots
+
+def precificar_em_paralelo(entrada, destino, workers=None, linhas_por_parte=LINHAS_POR_PARTE,
+                           formato='parquet', tabelas=None, historico=True, snapshot=None,
+                           uf_origem=None, **expansao):
+    """Precifica o arquivo em partes, distribuídas entre processos
+
+    A entrada é lida em blocos de linhas (sem carregar o arquivo inteiro) e
+    cada bloco vira um arquivo parte-NNNNN no diretório de destino. As regras
+    vão para os workers por memória compartilhada: nenhum deles abre o banco.
+    Com `snapshot` (arquivo de snapshot_regras), cada worker mapeia o arquivo
+    e nada é copiado. Sem `uf_origem`, as regras do banco levam a da empresa
+    ativa a todos os workers.
+    No máximo 2 blocos por worker ficam na fila, o que limita a memória.
+    Com `historico`, os workers devolvem os snapshots da sua parte e o
+    processo principal os grava, uma transação por parte: os workers não
+    abrem o banco nem disputam o lock de escrita.
+    Retorna (linhas, linhas com erro, partes).
+    """
+    workers = workers or os.cpu_count() or 1
+    fator = math.prod(len(valores) for valores in expansao.values() if valores)
+    linhas_entrada = max(1, linhas_por_parte // fator)
+    os.makedirs(destino, exist_ok=True)
+
+    data_historico = agora() if historico else None
+    empresa = empresa_ativa() or ''
+    if snapshot:
+        abrir_snapshot(snapshot)  # arquivo inválido falha aqui, antes dos workers
+        memoria = None
+        inicializador, argumentos = _iniciar_worker_snapshot, (snapshot,)
+    else:
+        cache = obter_cache()
+        tabelas = tabelas or tabelas_atuais(cache)
+        uf_origem = uf_origem or cache.uf_origem
+        memoria, layout = tabelas.publicar()
+        inicializador, argumentos = _iniciar_worker, (memoria.name, layout)
+    linhas = erros = partes = 0
+    try:
+        with ProcessPoolExecutor(workers, initializer=inicializador, initargs=argumentos) as executor:
+            pendentes = set()
+            for numero, bloco in enumerate(_ler_em_blocos(entrada, linhas_entrada)):
+                if len(pendentes) >= 2 * workers:
+                    prontos, pendentes = wait(pendentes, return_when=FIRST_COMPLETED)
+                    for futuro in prontos:
+                        n, e, snapshots = futuro.result()
+                        linhas, erros, partes = linhas + n, erros + e, partes + 1
+                        if snapshots:
+                            gravar_snapshots(snapshots)
+                pendentes.add(executor.submit(_precificar_parte, numero, bloco, expansao,
+                                              destino, formato, data_historico, uf_origem, empresa))
+            for futuro in as_completed(pendentes):
+                n, e, snapshots = futuro.result()
+                linhas, erros, partes = linhas + n, erros + e, partes + 1
+                if snapshots:
+                    gravar_snapshots(snapshots)
+    finally:
+        if memoria is not None:
+            memoria.close()
+            memoria.unlink()
+    return linhas, erros, partes
+
+# ============================================
+# LINHA DE COMANDO
+# ============================================
+
+def _lista(valor):
+    return [v.strip() for v in valor.split(',') if v.strip()] if valor else None
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Precifica um catálogo inteiro (CSV/Parquet)")
+    parser.add_argument('catalogo', help="arquivo de entrada (.csv ou .parquet)")
+    parser.add_argument('-o', '--saida', required=True,
+                        help="arquivo de saída (.csv ou .parquet); com --workers, diretório das partes")
+    parser.add_argument('--banco', help="caminho do banco de regras (padrão: PRECIFICADOR_DB)")
+    parser.add_argument('--regras', help="snapshot das regras (snapshot_regras.py) no lugar do banco")
+    parser.add_argument('--empresa', help="CNPJ da empresa: as exceções dela valem sobre as regras do banco")
+    parser.add_argument('--workers', type=int,
+                        help="processos em paralelo (0 = um por núcleo); grava a saída em partes")
+    parser.add_argument('--linhas-por-parte', type=int, default=LINHAS_POR_PARTE,
+                        help=f"linhas de saída por parte (padrão: {LINHAS_POR_PARTE})")
+    parser.add_argument('--formato', choices=('parquet', 'csv'), default='parquet',
+                        help="formato das partes (padrão: parquet)")
+    parser.add_argument('--ufs-destino', help="cruza cada SKU com estas UFs (ex.: SP,RJ,MG)")
+    parser.add_argument('--marketplaces', help="cruza cada SKU com estes marketplaces ('todos' = ativos)")
+    parser.add_argument('--tipos-cliente', help="cruza cada SKU com estes tipos de cliente ('todos' = ambos)")
+    parser.add_argument('--sem-historico', action='store_true',
+                        help="não grava os preços calculados no histórico")
+    args = parser.parse_args(argv)
+    if args.empresa and args.regras:
+        parser.error("--empresa usa as regras do banco; não combina com --regras")
+
+    if args.banco:
+        os.environ['PRECIFICADOR_DB'] = args.banco
+    inicializar_banco()
+    if args.empresa:
+        try:
+            definir_empresa(args.empresa)
+        except ValueError as erro:
+            parser.error(str(erro))
+
+    marketplaces = _lista(args.marketplaces)
+    if marketplaces == ['todos']:
+        marketplaces = listar_marketplaces()
+    tipos_cliente = _lista(args.tipos_cliente)
+    if tipos_cliente == ['todos']:
+        tipos_cliente = [CONSUMIDOR_FINAL, CONTRIBUINTE_ICMS]
+    expansao = {'uf_destino': _lista(args.ufs_destino), 'marketplace': marketplaces,
+                'tipo_cliente': tipos_cliente}
+
+    inicio = time.perf_counter()
+    if args.workers is not None:
+        linhas, erros, partes = precificar_em_paralelo(
+            args.catalogo, args.saida, workers=args.workers or None,
+            linhas_por_parte=args.linhas_por_parte, formato=args.formato,
+            historico=not args.sem_historico, snapshot=args.regras, **expansao)
+        destino = f"{args.saida} ({partes} partes)"
+    else:
+        tabelas = abrir_snapshot(args.regras) if args.regras else None
+        resultado = precificar_catalogo(expandir_catalogo(ler_catalogo(args.catalogo), **expansao), tabelas)
+        gravar_resultado(resultado, args.saida)
+        if not args.sem_historico:
+            gravar_snapshots(snapshots_do_catalogo(resultado, 'lote'))
+        linhas, erros = len(resultado), int((resultado['erro'] != '').sum())
+        destino = args.saida
+    duracao = time.perf_counter() - inicio
+
+    print(f"{linhas} linhas precificadas em {duracao:.2f}s ({erros} com erro) -> {destino}")
+    return 1 if erros else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
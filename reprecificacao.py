@@ -0,0 +1,230 @@
+"""
+Reprecificação Incremental
+
+Gatilhos registram em regras_alteracao cada NCM, rota de ICMS ou marketplace
+alterado. reprecificar_alterados() recalcula só os preços atuais
+(preco_atual) que dependem dessas regras, pelo mesmo cálculo vetorizado do
+lote, e grava os novos preços no histórico.
+
+Cada empresa é reprecificada com as regras dela: os preços atuais da empresa
+dependem das alterações do banco compartilhado e das da camada dela, e cada
+um desses registros tem o seu marco (o da camada guarda também até onde o
+compartilhado já foi aplicado aos preços da empresa).
+
+Para rodar: python reprecificacao.py            (recalcula o que mudou, em todas as empresas)
+            python reprecificacao.py --simular  (só conta os preços afetados)
+            python reprecificacao.py --empresa 12345678000190
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+import pandas as pd
+
+from banco_dados import (caminho_empresa, conexao, empresa_ativa, inicializar_banco, normalizar_cnpj,
+                         obter_pool, transacao)
+from cache_regras import obter_cache, obter_cache_empresa
+from historico_precos import agora, gravar_snapshots, snapshots_do_catalogo
+from precificacao_lote import precificar_catalogo, tabelas_atuais
+
+# Preços afetados recalculados por vez (limita a memória em alterações grandes)
+LINHAS_POR_BLOCO = 200_000
+
+# Entradas do snapshot usadas para recalcular; o custo total entra como aquisição
+_COLUNAS_ENTRADA = ('sku', 'nome', 'ncm', 'uf_origem', 'uf_destino', 'tipo_cliente',
+                    'marketplace', 'custo_aquisicao', 'margem_alvo', 'data_referencia')
+
+# Regra de capítulo/posição/subposição alterada: todos os NCMs com o prefixo
+# (intervalo no índice; ':' vem logo depois de '9'). CROSS JOIN deixa as
+# chaves alteradas por fora: o índice de preco_atual é buscado por chave, sem
+# varrer os preços da empresa. UNION ALL e DISTINCT em quem consulta: a
+# contagem com LIMIT para cedo em vez de montar a união toda.
+_SQL_AFETADOS = '''WITH afetados (snapshot_id) AS (
+        SELECT snapshot_id FROM json_each(:ncm) alterado CROSS JOIN preco_atual
+            ON preco_atual.empresa = :empresa
+            AND preco_atual.ncm >= alterado.value AND preco_atual.ncm < alterado.value || ':'
+        UNION ALL
+        SELECT snapshot_id FROM json_each(:icms_uf) alterado CROSS JOIN preco_atual
+            ON preco_atual.empresa = :empresa
+            AND preco_atual.uf_origem = substr(alterado.value, 1, 2)
+            AND preco_atual.uf_destino = substr(alterado.value, 4, 2)
+        UNION ALL
+        SELECT snapshot_id FROM json_each(:marketplace) alterado CROSS JOIN preco_atual
+            ON preco_atual.empresa = :empresa AND preco_atual.marketplace = alterado.value
+    )'''
+
+class RelatorioReprecificacao:
+    """Resultado de uma reprecificação: regras alteradas e preços recalculados"""
+
+    def __init__(self):
+        self.alteracoes = 0
+        self.afetados = 0
+        self.reprecificados = 0
+        self.erros = 0
+        self.duracao = 0.0
+
+    def __repr__(self):
+        return (f"RelatorioReprecificacao({self.alteracoes} regras alteradas, "
+                f"{self.afetados} preços afetados, {self.reprecificados} recalculados, "
+                f"{self.erros} com erro, {self.duracao:.2f}s)")
+
+def alteracoes_pendentes(conn, marco=None):
+    """(última alteração, {tabela: [chaves]}) das regras alteradas desde a última reprecificação
+
+    `marco` substitui o da tabela reprecificacao (o das empresas para o banco compartilhado).
+    """
+    if marco is None:
+        marco = conn.execute('SELECT ultima_alteracao FROM reprecificacao WHERE id = 1').fetchone()[0]
+    ultima = conn.execute('SELECT COALESCE(MAX(id), 0) FROM regras_alteracao').fetchone()[0]
+    chaves = {'ncm': [], 'icms_uf': [], 'marketplace': []}
+    for tabela, chave in conn.execute('''SELECT DISTINCT tabela, chave FROM regras_alteracao
+                                         WHERE id > ? AND id <= ?''', (marco, ultima)):
+        chaves[tabela].append(chave)
+    return ultima, chaves
+
+def _parametros(chaves, empresa):
+    return {**{tabela: json.dumps(lista) for tabela, lista in chaves.items()}, 'empresa': empresa}
+
+def _empresa(empresa):
+    return (empresa_ativa() or '') if empresa is None else (normalizar_cnpj(empresa) if empresa else '')
+
+def _alteracoes_da_empresa(conn, empresa, caminho_banco):
+    """(marcos, {tabela: [chaves]}) das regras alteradas desde a última reprecificação da empresa
+
+    marcos: (banco, coluna de reprecificacao, última alteração) a gravar depois
+    de recalcular. Sem camada (empresa removida), marcos é None e valem só as
+    alterações do compartilhado desde o início.
+    """
+    if not empresa:
+        ultima, chaves = alteracoes_pendentes(conn)
+        return [(caminho_banco, 'ultima_alteracao', ultima)], chaves
+    camada = caminho_empresa(empresa)
+    if not os.path.exists(camada):
+        return None, alteracoes_pendentes(conn, 0)[1]
+    inicializar_banco(camada, regras_padrao=False)
+    with conexao(camada) as conn_camada:
+        marco = conn_camada.execute(
+            'SELECT ultima_alteracao_compartilhada FROM reprecificacao WHERE id = 1').fetchone()[0]
+        ultima_camada, chaves = alteracoes_pendentes(conn_camada)
+    ultima, compartilhadas = alteracoes_pendentes(conn, marco)
+    for tabela, lista in compartilhadas.items():
+        chaves[tabela] = list(dict.fromkeys(chaves[tabela] + lista))
+    return [(camada, 'ultima_alteracao', ultima_camada),
+            (camada, 'ultima_alteracao_compartilhada', ultima)], chaves
+
+def empresas_com_precos(caminho_banco=None):
+    """Empresas com preços atuais no histórico ('' = regras compartilhadas, sem empresa)"""
+    with conexao(caminho_banco) as conn:
+        return [empresa for (empresa,) in conn.execute('SELECT DISTINCT empresa FROM preco_atual')]
+
+def contar_afetados(caminho_banco=None, limite=None, empresa=None):
+    """Quantos preços atuais da empresa dependem de regras alteradas e ainda não foram recalculados
+
+    empresa: CNPJ (padrão: a empresa ativa; '' = preços sem empresa). Com
+    `limite`, a contagem para ao alcançá-lo (a interface só precisa saber se
+    passa de um tanto).
+    """
+    empresa = _empresa(empresa)
+    with conexao(caminho_banco) as conn:
+        _, chaves = _alteracoes_da_empresa(conn, empresa, caminho_banco)
+        if not any(chaves.values()):
+            return 0
+        return conn.execute(f'{_SQL_AFETADOS} SELECT COUNT(*) FROM (SELECT DISTINCT snapshot_id FROM afetados LIMIT :limite)',
+                            {**_parametros(chaves, empresa), 'limite': -1 if limite is None else limite}).fetchone()[0]
+
+def reprecificar_alterados(caminho_banco=None, simular=False, empresa=None):
+    """Recalcula os preços atuais da empresa afetados por regras alteradas e grava no histórico
+
+    empresa: CNPJ cujas regras (CacheEmpresa) recalculam os preços dela
+    (padrão: a empresa ativa; '' = preços sem empresa, com as regras
+    compartilhadas). Alterações feitas durante a execução ficam para a
+    próxima. Preços que não têm mais cálculo (NCM ou marketplace removido, ou
+    a camada da empresa) são contados em `erros` e mantidos como estão. Com
+    `simular`, só conta os afetados.
+    """
+    relatorio = RelatorioReprecificacao()
+    inicio = time.perf_counter()
+    empresa = _empresa(empresa)
+    data = agora()
+
+    with conexao(caminho_banco) as conn:
+        marcos, chaves = _alteracoes_da_empresa(conn, empresa, caminho_banco)
+        relatorio.alteracoes = sum(len(lista) for lista in chaves.values())
+        if not relatorio.alteracoes:
+            relatorio.duracao = time.perf_counter() - inicio
+            return relatorio
+        tabelas = None
+        if not simular and marcos is not None:
+            # A empresa vai explícita: com caminho, obter_cache ignora a empresa ativa
+            cache = (obter_cache_empresa(empresa, caminho_banco) if empresa
+                     else obter_cache(obter_pool(caminho_banco).caminho))
+            tabelas = tabelas_atuais(cache)
+        entradas = conn.execute(f'''{_SQL_AFETADOS}
+            SELECT s.sku, s.nome, s.ncm, s.uf_origem, s.uf_destino, s.tipo_cliente,
+                   s.marketplace, s.custo_total, s.margem_alvo, s.data_referencia
+            FROM (SELECT DISTINCT snapshot_id FROM afetados) a JOIN preco_snapshot s ON s.id = a.snapshot_id''',
+            _parametros(chaves, empresa))
+        while True:
+            bloco = entradas.fetchmany(LINHAS_POR_BLOCO)
+            if not bloco:
+                break
+            relatorio.afetados += len(bloco)
+            if simular:
+                continue
+            if tabelas is None:
+                relatorio.erros += len(bloco)
+                continue
+            saida = precificar_catalogo(pd.DataFrame(bloco, columns=_COLUNAS_ENTRADA), tabelas)
+            relatorio.erros += int((saida['erro'] != '').sum())
+            relatorio.reprecificados += gravar_snapshots(
+                snapshots_do_catalogo(saida, 'reprecificacao', data, empresa), caminho_banco)
+
+    if not simular and marcos is not None:
+        for banco, coluna, ultima in marcos:
+            with transacao(banco) as conn:
+                conn.execute(f'UPDATE reprecificacao SET {coluna} = ? WHERE id = 1', (ultima,))
+    relatorio.duracao = time.perf_counter() - inicio
+    return relatorio
+
+def reprecificar_empresas(caminho_banco=None, simular=False):
+    """reprecificar_alterados para cada empresa com preços no histórico, num só relatório"""
+    total = RelatorioReprecificacao()
+    inicio = time.perf_counter()
+    for empresa in empresas_com_precos(caminho_banco):
+        relatorio = reprecificar_alterados(caminho_banco, simular, empresa)
+        total.alteracoes += relatorio.alteracoes
+        total.afetados += relatorio.afetados
+        total.reprecificados += relatorio.reprecificados
+        total.erros += relatorio.erros
+    total.duracao = time.perf_counter() - inicio
+    return total
+
+# ============================================
+# LINHA DE COMANDO
+# ============================================
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Recalcula só os preços afetados por regras alteradas")
+    parser.add_argument('--banco', help="caminho do banco de regras (padrão: PRECIFICADOR_DB)")
+    parser.add_argument('--simular', action='store_true', help="só conta os preços afetados")
+    parser.add_argument('--empresa', help="CNPJ: só os preços da empresa (padrão: todas)")
+    args = parser.parse_args(argv)
+
+    inicializar_banco(args.banco)
+    if args.empresa:
+        try:
+            relatorio = reprecificar_alterados(args.banco, args.simular, normalizar_cnpj(args.empresa))
+        except ValueError as erro:
+            parser.error(str(erro))
+    else:
+        relatorio = reprecificar_empresas(args.banco, simular=args.simular)
+    print(f"{relatorio.alteracoes} regras alteradas, {relatorio.afetados} preços afetados, "
+          f"{relatorio.reprecificados} recalculados em {relatorio.duracao:.2f}s "
+          f"({relatorio.erros} com erro)")
+    return 1 if relatorio.erros else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
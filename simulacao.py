@@ -0,0 +1,67 @@
+"""
+Simulação de Sensibilidade
+
+Preço de venda e lucro líquido sobre uma grade margem x variação de custo x
+marketplace, avaliada de uma vez com broadcasting do NumPy (mesma fórmula de
+gross-up de motor_precificacao, com as faixas de preço das taxas de cada
+canal resolvidas por faixas_taxas).
+"""
+
+from typing import NamedTuple
+
+import numpy as np
+
+from faixas_taxas import na_faixa, resolver_faixas
+from motor_precificacao import ALIQUOTA_IRPJ_CSLL
+
+# Grade padrão: margem de 0 a 100% (faixa do slider) e custo de -30% a +30%
+PONTOS_MARGEM = 200
+PONTOS_CUSTO = 60
+VARIACAO_CUSTO_MAXIMA = 30.0
+
+class GradeSensibilidade(NamedTuple):
+    marketplaces: list        # eixo 0
+    margens: np.ndarray       # eixo 1, % sobre o preço
+    variacoes_custo: np.ndarray  # eixo 2, % sobre o custo total
+    preco_venda: np.ndarray   # [marketplace, margem, variação]; NaN onde não há preço
+    lucro_liquido: np.ndarray
+    lucro_liquido_pct: np.ndarray
+
+def grade_sensibilidade(custo_total, tributos, canais, margens=None, variacoes_custo=None):
+    """Avalia a grade inteira em uma passada vetorizada
+
+    `tributos` vem de perfil_tributos(); `canais` é {nome: perfil_canal(...)}.
+    Pontos em que margem + tributos + custos variáveis chegam a 100% ficam NaN.
+    """
+    if margens is None:
+        margens = np.linspace(0.0, 100.0, PONTOS_MARGEM)
+    if variacoes_custo is None:
+        variacoes_custo = np.linspace(-VARIACAO_CUSTO_MAXIMA, VARIACAO_CUSTO_MAXIMA, PONTOS_CUSTO)
+    margens = np.asarray(margens, dtype=np.float64)
+    variacoes_custo = np.asarray(variacoes_custo, dtype=np.float64)
+
+    nomes = list(canais)
+    # Faixas de cada canal: [marketplace, 1, 1, faixa]; sem faixas, a taxa única
+    faixas = [canais[n].faixas or ((-np.inf, canais[n]),) for n in nomes]
+    colunas = max((len(f) for f in faixas), default=1)
+    minimos = np.full((len(nomes), 1, 1, colunas), np.inf)
+    pct_variaveis = np.zeros_like(minimos)
+    fixas = np.zeros_like(minimos)
+    for i, lista in enumerate(faixas):
+        for j, (minimo, perfil) in enumerate(lista):
+            minimos[i, 0, 0, j] = float(minimo)
+            pct_variaveis[i, 0, 0, j] = float(perfil.total)
+            fixas[i, 0, 0, j] = float(perfil.taxa_fixa)
+    pct_tributos = float(tributos.total)
+    pct_margem = (margens / 100)[None, :, None]
+    custo = (custo_total * (1 + variacoes_custo / 100))[None, None, :]
+
+    preco_venda, faixa = resolver_faixas(custo, pct_margem + pct_tributos, minimos, pct_variaveis, fixas)
+    pct_variaveis, taxa_fixa = na_faixa(pct_variaveis, faixa), na_faixa(fixas, faixa)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        margem_contribuicao = preco_venda * (1 - pct_tributos - pct_variaveis) - (custo + taxa_fixa)
+        lucro_liquido = margem_contribuicao * (1 - float(ALIQUOTA_IRPJ_CSLL))
+        lucro_liquido_pct = lucro_liquido / preco_venda * 100
+
+    return GradeSensibilidade(nomes, margens, variacoes_custo,
+                              preco_venda, lucro_liquido, lucro_liquido_pct)
@@ -0,0 +1,118 @@
+"""
+Snapshot das Regras em Arquivo Mapeado
+
+Compila as regras (ncm, icms_uf, marketplace e faixas) em um arquivo binário
+só leitura: os arrays de TabelasRegras, registros de largura fixa com os
+códigos ordenados para busca binária. Cada processo abre o arquivo com mmap:
+abrir custa microssegundos, não consulta o banco e não ocupa memória própria
+(as páginas ficam no cache do sistema, uma vez para todos os processos).
+
+O cabeçalho guarda a versão do formato, a geração das regras (regras_geracao)
+e o banco de origem. Com PRECIFICADOR_REGRAS apontando para o arquivo, o
+cache de regras usa o snapshot enquanto a geração bater; quando o banco muda,
+o primeiro processo que precisar das tabelas grava um novo (troca atômica) e
+os demais passam a abri-lo.
+
+Para rodar: python snapshot_regras.py regras.snap
+            python snapshot_regras.py regras.snap --info
+            python api_precificacao.py --workers 8 --regras regras.snap
+"""
+
+import argparse
+import os
+import sys
+import threading
+import time
+from datetime import datetime
+
+from banco_dados import inicializar_banco
+from instrumentacao import medir
+from tabelas_regras import ErroSnapshot, TabelasRegras
+
+# Snapshots já mapeados neste processo: caminho -> (identidade do arquivo, tabelas)
+_abertos = {}
+_abertos_lock = threading.Lock()
+
+def caminho_snapshot():
+    """Caminho do snapshot configurado para o processo (PRECIFICADOR_REGRAS), ou None"""
+    return os.environ.get('PRECIFICADOR_REGRAS') or None
+
+def abrir_snapshot(caminho=None) -> TabelasRegras:
+    """Tabelas do snapshot, mapeadas uma vez por processo (reabre se o arquivo foi trocado)"""
+    caminho = os.path.abspath(caminho or caminho_snapshot())
+    estado = os.stat(caminho)
+    identidade = (estado.st_ino, estado.st_mtime_ns, estado.st_size)
+    aberto = _abertos.get(caminho)
+    if aberto is not None and aberto[0] == identidade:
+        return aberto[1]
+    with _abertos_lock, medir('abrir_snapshot'):
+        tabelas = TabelasRegras.abrir_arquivo(caminho)
+        _abertos[caminho] = (identidade, tabelas)
+    return tabelas
+
+def snapshot_da_geracao(caminho, caminho_banco, geracao):
+    """Tabelas do snapshot se ele foi gerado do banco nessa geração; senão None"""
+    try:
+        tabelas = abrir_snapshot(caminho)
+    except (OSError, ErroSnapshot):
+        return None
+    metadados = tabelas.metadados
+    if metadados.get('geracao') != geracao or metadados.get('banco') != os.path.abspath(caminho_banco):
+        return None
+    return tabelas
+
+def gravar_snapshot(tabelas, caminho, caminho_banco, geracao):
+    """Grava as tabelas no snapshot com a geração e o banco de origem; retorna o tamanho em bytes"""
+    return tabelas.gravar_arquivo(caminho, {
+        'geracao': geracao,
+        'banco': os.path.abspath(caminho_banco),
+        'criado_em': datetime.now().isoformat(timespec='seconds'),
+    })
+
+def exportar_snapshot(caminho, caminho_banco=None):
+    """Compila as regras atuais do banco no snapshot; retorna (geração, tamanho em bytes)"""
+    # cache_regras importa este módulo para usar o snapshot
+    from cache_regras import obter_cache
+
+    cache = obter_cache(caminho_banco)
+    cache.sincronizar()
+    geracao = cache.estatisticas()['geracao']
+    tamanho = gravar_snapshot(TabelasRegras.de_cache(cache), caminho, cache.caminho_banco, geracao)
+    return geracao, tamanho
+
+# ============================================
+# LINHA DE COMANDO
+# ============================================
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compila as regras em um snapshot mapeável (mmap)")
+    parser.add_argument('snapshot', help="arquivo de saída (ex.: regras.snap)")
+    parser.add_argument('--banco', help="caminho do banco de regras (padrão: PRECIFICADOR_DB)")
+    parser.add_argument('--info', action='store_true', help="só mostra o cabeçalho de um snapshot existente")
+    args = parser.parse_args(argv)
+
+    if args.info:
+        inicio = time.perf_counter()
+        try:
+            tabelas = abrir_snapshot(args.snapshot)
+        except (OSError, ErroSnapshot) as erro:
+            print(erro, file=sys.stderr)
+            return 1
+        duracao = time.perf_counter() - inicio
+        for chave, valor in tabelas.metadados.items():
+            print(f"{chave}: {valor}")
+        print(f"arrays: {len(tabelas.arrays)}, NCMs: {len(tabelas.arrays['ncm.codigo'])}, "
+              f"aberto em {duracao * 1e6:.0f} µs")
+        return 0
+
+    if args.banco:
+        os.environ['PRECIFICADOR_DB'] = args.banco
+    inicializar_banco()
+    inicio = time.perf_counter()
+    geracao, tamanho = exportar_snapshot(args.snapshot)
+    print(f"Snapshot da geração {geracao} gravado em {args.snapshot} "
+          f"({tamanho / 2**20:.1f} MB, {time.perf_counter() - inicio:.2f}s)")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,497 @@
+"""
+Tabelas de Regras em Arrays
+
+As regras tributárias (ncm, marketplace) em arrays NumPy ordenados pela
+chave, com busca binária vetorizada, e a matriz de ICMS efetivo (icms_uf). Os arrays podem ser publicados em
+um bloco de memória compartilhada e abertos por outros processos sem cópia
+e sem acesso ao banco.
+
+Cada chave pode ter várias vigências: as versões ficam ordenadas por
+(chave, início) em um inteiro só, e a versão vigente em uma data sai de uma
+busca binária, sem consulta por linha.
+
+NCM sem regra própria herda a do prefixo cadastrado mais longo (subposição,
+posição ou capítulo): uma busca binária a mais por nível, só para as linhas
+ainda sem regra.
+
+As faixas de preço das taxas dos marketplaces são um índice de intervalos:
+cada tabela vigente (marketplace, categoria) aponta para as suas faixas,
+contíguas e ordenadas pelo preço mínimo.
+
+Os mesmos arrays podem ser gravados em um arquivo (snapshot) e abertos com
+mmap, só leitura: processos novos e workers usam as regras sem banco, sem
+cópia e sem memória própria (as páginas ficam no cache do sistema,
+compartilhadas por todos).
+
+As de uma empresa (TabelasEmpresa) são só as exceções dela em arrays
+pequenos, consultados antes dos do base, que são usados sem cópia.
+"""
+
+import json
+import math
+import mmap
+import os
+import struct
+import threading
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy as np
+
+from matriz_icms import MatrizICMS
+from vigencia import INICIO_ABERTO, dia
+
+# Versão = posição da chave * ESCALA_VERSAO + dias desde o menor início possível
+# (0001-01-01 a 9999-12-31 cabem em 22 bits)
+DIA_MINIMO = dia(INICIO_ABERTO)
+ESCALA_VERSAO = 1 << 22
+
+# Níveis da nomenclatura NCM, do mais específico ao mais geral (dígitos do código)
+NIVEIS_NCM = (8, 6, 4, 2)
+NOMES_NIVEIS_NCM = {8: 'item', 6: 'subposição', 4: 'posição', 2: 'capítulo'}
+
+# Colunas de cada tabela: (chave, tipo da chave, campos numéricos)
+TABELAS = {
+    'ncm': ('codigo', 'U10', ('aliquota_pis', 'aliquota_cofins', 'aliquota_ipi')),
+    'marketplace': ('nome', 'U64', ('comissao_padrao', 'taxa_fixa', 'taxa_antecipacao',
+                                    'taxa_gateway', 'ativo')),
+    'faixa': ('chave', 'i8', ()),
+}
+
+# Chave de uma tabela de faixas = posição do marketplace * ESCALA_CATEGORIA
+# + categoria (prefixo do NCM * 10 + dígitos do prefixo; 0 = todos os NCMs)
+ESCALA_CATEGORIA = 10 ** 10
+
+CAMPOS_FAIXA = ('preco_minimo', 'comissao', 'taxa_fixa')
+
+# Arrays da camada de uma empresa publicados junto com os do base
+PREFIXO_CAMADA = 'camada/'
+
+def chave_faixa(posicao_marketplace, categoria):
+    return posicao_marketplace * ESCALA_CATEGORIA + (int(categoria) * 10 + len(categoria) if categoria else 0)
+
+def _versionar(arrays, tabela, versoes):
+    # Chaves ordenadas, versões (posição da chave, início) e fim de vigência;
+    # retorna os registros na ordem das versões
+    chave, tipo, _ = TABELAS[tabela]
+    chaves = sorted(versoes)
+    registros = [r for c in chaves for r in versoes[c]]
+    posicao = np.repeat(np.arange(len(chaves), dtype=np.int64), [len(versoes[c]) for c in chaves])
+    inicio = np.array([dia(r.vigencia_inicio) for r in registros], dtype=np.int64)
+    fim = np.array([dia(r.vigencia_fim) for r in registros], dtype=np.int64)
+    versao = posicao * ESCALA_VERSAO + (inicio - DIA_MINIMO)
+    ordem = np.argsort(versao, kind='stable')
+    arrays[f'{tabela}.{chave}'] = np.array(chaves, dtype=tipo)
+    arrays[f'{tabela}.versao'] = versao[ordem]
+    arrays[f'{tabela}.vigencia_fim'] = fim[ordem]
+    return [registros[i] for i in ordem]
+
+# Arquivo de snapshot: cabeçalho fixo (assinatura, versão do formato, tamanho
+# do JSON), JSON com os metadados e o layout dos arrays, e os arrays alinhados
+MAGICA_ARQUIVO = b'PRECREGR'
+VERSAO_ARQUIVO = 1
+_CABECALHO = struct.Struct('<8sII')
+ALINHAMENTO_ARQUIVO = 64
+
+class ErroSnapshot(ValueError):
+    """Arquivo de snapshot inválido ou de outra versão do formato"""
+
+def _layout(arrays, inicio=0, alinhamento=16):
+    # {nome: (dtype, forma, deslocamento)} com cada array alinhado; retorna também o fim
+    layout = {}
+    deslocamento = inicio
+    for nome, array in arrays.items():
+        deslocamento = -(-deslocamento // alinhamento) * alinhamento
+        layout[nome] = (array.dtype.str, array.shape, deslocamento)
+        deslocamento += array.nbytes
+    return layout, deslocamento
+
+def _abrir_sem_rastrear(nome_memoria):
+    # Só o processo que publicou deve remover o bloco; quem apenas abre não
+    # pode registrá-lo no resource_tracker (track=False só existe no Python 3.13+)
+    try:
+        return shared_memory.SharedMemory(name=nome_memoria, track=False)
+    except TypeError:
+        pass
+    registrar = resource_tracker.register
+    resource_tracker.register = lambda nome, tipo: None
+    try:
+        return shared_memory.SharedMemory(name=nome_memoria)
+    finally:
+        resource_tracker.register = registrar
+
+class TabelasRegras:
+    """Regras tributárias em arrays ordenados pela chave"""
+
+    def __init__(self, arrays, memoria=None, metadados=None):
+        # arrays: {'ncm.codigo': ndarray, 'ncm.aliquota_pis': ndarray, ...}
+        self.arrays = arrays
+        # Mantém o bloco compartilhado (ou o mmap do arquivo) vivo enquanto as views existirem
+        self._memoria = memoria
+        # Do snapshot: geração das regras, banco de origem, data de criação
+        self.metadados = metadados or {}
+        self.arquivo = None
+
+    @classmethod
+    def de_registros(cls, versoes_ncm, versoes_rota, versoes_marketplace, matriz=None,
+                     versoes_faixas=None):
+        """Monta as tabelas a partir das versões por chave do CacheRegras ({chave: [registro, ...]})"""
+        fontes = {'ncm': versoes_ncm, 'marketplace': versoes_marketplace}
+        matriz = matriz or MatrizICMS.de_versoes(versoes_rota)
+        arrays = {'icms.aliquotas': matriz.aliquotas, 'icms.cadastrada': matriz.cadastrada,
+                  'icms.inicios': matriz.inicios}
+        for tabela, versoes in fontes.items():
+            registros = _versionar(arrays, tabela, versoes)
+            for campo in TABELAS[tabela][2]:
+                arrays[f'{tabela}.{campo}'] = np.array([getattr(r, campo) for r in registros],
+                                                       dtype=np.float64)
+
+        # Faixas: chave inteira (marketplace, categoria); só de marketplaces cadastrados
+        posicao_marketplace = {nome: i for i, nome in enumerate(sorted(versoes_marketplace))}
+        tabelas_faixas = _versionar(arrays, 'faixa', {
+            chave_faixa(posicao_marketplace[marketplace], categoria): versoes
+            for (marketplace, categoria), versoes in (versoes_faixas or {}).items()
+            if marketplace in posicao_marketplace and (categoria == '' or categoria.isdigit())
+        })
+        quantidade = np.array([len(t.faixas) for t in tabelas_faixas], dtype=np.int64)
+        arrays['faixa.quantidade'] = quantidade
+        arrays['faixa.primeira'] = np.cumsum(quantidade) - quantidade
+        faixas = [f for t in tabelas_faixas for f in t.faixas]
+        for i, campo in enumerate(CAMPOS_FAIXA):
+            arrays[f'faixa.{campo}'] = np.array([f[i] for f in faixas], dtype=np.float64)
+        return cls(arrays)
+
+    @classmethod
+    def de_cache(cls, cache):
+        """Monta as tabelas a partir de um CacheRegras já sincronizado"""
+        return cls.de_registros(cache.versoes_ncm, cache.versoes_rota, cache.versoes_marketplace,
+                                cache.matriz_icms(), cache.versoes_faixas)
+
+    def matriz_icms(self):
+        """Matriz de ICMS efetivo (views dos arrays, sem cópia)"""
+        return MatrizICMS(self.arrays['icms.aliquotas'], self.arrays['icms.cadastrada'],
+                          self.arrays['icms.inicios'])
+
+    # ============================================
+    # BUSCA VETORIZADA
+    # ============================================
+
+    def buscar(self, tabela, chaves, dias=None):
+        """Posição da versão vigente de cada chave (-1 se ausente), por busca binária
+
+        `dias` (dias desde 1970, escalar ou array por chave) é a data de
+        referência; padrão: hoje.
+        """
+        chaves = np.asarray(chaves, dtype=TABELAS[tabela][1])
+        versao = self.arrays[f'{tabela}.versao']
+        posicao = self.posicao_chave(tabela, chaves)
+        if len(versao) == 0:
+            return posicao
+
+        # Última versão da chave com início <= data, se a data não passou do fim
+        dias = np.asarray(dia() if dias is None else dias, dtype=np.int64)
+        alvo = posicao * ESCALA_VERSAO + (dias - DIA_MINIMO)
+        linha = np.searchsorted(versao, alvo, side='right') - 1
+        linha_valida = np.maximum(linha, 0)
+        vigente = ((posicao >= 0) & (linha >= 0)
+                   & (versao[linha_valida] // ESCALA_VERSAO == posicao)
+                   & (self.arrays[f'{tabela}.vigencia_fim'][linha_valida] >= dias))
+        return np.where(vigente, linha_valida, -1)
+
+    def posicao_chave(self, tabela, chaves):
+        """Posição de cada chave entre as cadastradas (-1 se ausente), em qualquer vigência"""
+        chave, tipo, _ = TABELAS[tabela]
+        ordenadas = self.arrays[f'{tabela}.{chave}']
+        chaves = np.asarray(chaves, dtype=tipo)
+        if len(ordenadas) == 0:
+            return np.full(chaves.shape, -1, dtype=np.intp)
+        pos = np.minimum(np.searchsorted(ordenadas, chaves), len(ordenadas) - 1)
+        return np.where(ordenadas[pos] == chaves, pos, -1)
+
+    def buscar_ncm(self, codigos, dias=None):
+        """(posição, nível) da regra de cada NCM: a do próprio código ou a do prefixo de 6, 4 ou 2 dígitos
+
+        O nível é o número de dígitos do código da regra encontrada (0 se nenhuma).
+        """
+        tipo = TABELAS['ncm'][1]
+        codigos = np.ascontiguousarray(codigos, dtype=tipo)
+        dias = np.asarray(dia() if dias is None else dias, dtype=np.int64)
+        # Um caractere por uint32: zerar as colunas finais corta o código no
+        # prefixo sem converter as strings a cada nível
+        caracteres = codigos.view(np.uint32).reshape(len(codigos), codigos.itemsize // 4)
+        tamanho = np.count_nonzero(caracteres, axis=1)
+
+        # O próprio código para todas as linhas; os prefixos só para as que faltam
+        pos = self.buscar('ncm', codigos, dias)
+        nivel = np.where(pos >= 0, np.minimum(tamanho, NIVEIS_NCM[0]), 0).astype(np.int8)
+        faltando = np.flatnonzero(pos < 0)
+        for digitos in NIVEIS_NCM[1:]:
+            if len(faltando) == 0:
+                break
+            prefixos = caracteres[faltando]
+            prefixos[:, digitos:] = 0
+            achados = self.buscar('ncm', prefixos.view(tipo).ravel(),
+                                  dias if dias.ndim == 0 else dias[faltando])
+            encontrado = achados >= 0
+            pos[faltando[encontrado]] = achados[encontrado]
+            nivel[faltando[encontrado]] = np.minimum(tamanho[faltando[encontrado]], digitos)
+            faltando = faltando[~encontrado]
+        return pos, nivel
+
+    def buscar_faixas(self, pos_marketplace, codigos, dias=None):
+        """Posição da tabela de faixas vigente de cada linha (-1: taxa única do marketplace)
+
+        `pos_marketplace` vem de buscar('marketplace', ...). Vale a tabela da
+        categoria (prefixo do NCM em `codigos`) mais longa; só as linhas de
+        marketplaces com faixas entram nas buscas.
+        """
+        pos = np.full(len(pos_marketplace), -1, dtype=np.intp)
+        chaves = self.arrays['faixa.chave']
+        if len(chaves) == 0:
+            return pos
+        indice = self.arrays['marketplace.versao'][np.maximum(pos_marketplace, 0)] // ESCALA_VERSAO
+        linhas = np.flatnonzero((pos_marketplace >= 0)
+                                & np.isin(indice, np.unique(chaves // ESCALA_CATEGORIA)))
+        if len(linhas) == 0:
+            return pos
+        dias = np.asarray(dia() if dias is None else dias, dtype=np.int64)
+        dias = dias if dias.ndim == 0 else dias[linhas]
+
+        # Prefixos numéricos do NCM: um caractere por uint32, como em buscar_ncm
+        tipo = TABELAS['ncm'][1]
+        codigos = np.ascontiguousarray(np.asarray(codigos)[linhas], dtype=tipo)
+        caracteres = codigos.view(np.uint32).reshape(len(codigos), codigos.itemsize // 4)
+        digitos = caracteres[:, :NIVEIS_NCM[0]].astype(np.int64) - ord('0')
+        validos = np.cumprod((digitos >= 0) & (digitos <= 9), axis=1).sum(axis=1)
+        prefixos = np.zeros((len(linhas), NIVEIS_NCM[0] + 1), dtype=np.int64)
+        for i in range(NIVEIS_NCM[0]):
+            prefixos[:, i + 1] = prefixos[:, i] * 10 + digitos[:, i]
+
+        base = indice[linhas] * ESCALA_CATEGORIA
+        faltando = np.arange(len(linhas))
+        for nivel in NIVEIS_NCM + (0,):
+            candidatas = faltando[validos[faltando] >= nivel]
+            categoria = prefixos[candidatas, nivel] * 10 + nivel if nivel else 0
+            achados = self.buscar('faixa', base[candidatas] + categoria,
+                                  dias if dias.ndim == 0 else dias[candidatas])
+            encontrado = achados >= 0
+            pos[linhas[candidatas[encontrado]]] = achados[encontrado]
+            faltando = np.setdiff1d(faltando, candidatas[encontrado], assume_unique=True)
+            if len(faltando) == 0:
+                break
+        return pos
+
+    def faixas(self, pos_faixas, comissao, taxa_fixa):
+        """(mínimos, comissões, taxas fixas) de cada linha, uma coluna por faixa
+
+        A primeira coluna é a taxa única do marketplace (mínimo -infinito);
+        colunas além das faixas da linha têm mínimo +infinito. Formato das
+        entradas de faixas_taxas.resolver_faixas.
+        """
+        n = len(pos_faixas)
+        com_faixas = pos_faixas >= 0
+        quantidade = np.zeros(n, dtype=np.int64)
+        primeira = np.zeros(n, dtype=np.int64)
+        if len(self.arrays['faixa.quantidade']):
+            pos = np.maximum(pos_faixas, 0)
+            quantidade = np.where(com_faixas, self.arrays['faixa.quantidade'][pos], 0)
+            primeira = self.arrays['faixa.primeira'][pos]
+        colunas = 1 + (int(quantidade.max()) if n else 0)
+        minimos = np.full((n, colunas), np.inf)
+        minimos[:, 0] = -np.inf
+        comissoes = np.zeros((n, colunas))
+        comissoes[:, 0] = comissao
+        fixas = np.zeros((n, colunas))
+        fixas[:, 0] = taxa_fixa
+        for j in range(1, colunas):
+            linhas = np.flatnonzero(quantidade >= j)
+            faixa = primeira[linhas] + (j - 1)
+            minimos[linhas, j] = self.arrays['faixa.preco_minimo'][faixa]
+            comissoes[linhas, j] = self.arrays['faixa.comissao'][faixa]
+            fixas[linhas, j] = self.arrays['faixa.taxa_fixa'][faixa]
+        return minimos, comissoes, fixas
+
+    def colunas(self, tabela, pos, campos):
+        """Valores dos campos nas posições informadas (NaN onde pos == -1)"""
+        encontrado = pos >= 0
+        pos_valida = np.where(encontrado, pos, 0)
+        resultado = []
+        for campo in campos:
+            coluna = self.arrays[f'{tabela}.{campo}']
+            if len(coluna) == 0:
+                resultado.append(np.full(pos.shape, np.nan))
+            else:
+                resultado.append(np.where(encontrado, coluna[pos_valida], np.nan))
+        return resultado
+
+    def juntar(self, tabela, chaves, campos, dias=None):
+        """Atalho: (encontrado, [colunas]) para as chaves informadas, na data de referência"""
+        pos = self.buscar(tabela, chaves, dias)
+        return pos >= 0, self.colunas(tabela, pos, campos)
+
+    # ============================================
+    # MEMÓRIA COMPARTILHADA
+    # ============================================
+
+    def publicar(self):
+        """Copia os arrays para um bloco de memória compartilhada
+
+        Retorna (SharedMemory, layout). O layout é pequeno e serializável: é o
+        que os outros processos recebem para abrir as tabelas. Quem publica
+        chama close() e unlink() no bloco ao terminar.
+        """
+        layout, deslocamento = _layout(self.arrays)
+        memoria = shared_memory.SharedMemory(create=True, size=max(deslocamento, 1))
+        for nome, array in self.arrays.items():
+            tipo, forma, inicio = layout[nome]
+            destino = np.ndarray(forma, dtype=tipo, buffer=memoria.buf, offset=inicio)
+            destino[...] = array
+        return memoria, layout
+
+    @classmethod
+    def abrir_publicadas(cls, nome_memoria, layout):
+        """Abre (sem cópia) as tabelas publicadas por outro processo"""
+        memoria = _abrir_sem_rastrear(nome_memoria)
+        arrays = {}
+        for nome, (tipo, forma, inicio) in layout.items():
+            array = np.ndarray(forma, dtype=tipo, buffer=memoria.buf, offset=inicio)
+            array.flags.writeable = False
+            arrays[nome] = array
+        if any(nome.startswith(PREFIXO_CAMADA) for nome in arrays):
+            camada = {nome[len(PREFIXO_CAMADA):]: array for nome, array in arrays.items()
+                      if nome.startswith(PREFIXO_CAMADA)}
+            base = {nome: array for nome, array in arrays.items() if not nome.startswith(PREFIXO_CAMADA)}
+            return TabelasEmpresa(TabelasRegras(base), TabelasRegras(camada), memoria)
+        return cls(arrays, memoria)
+
+    # ============================================
+    # ARQUIVO MAPEADO (SNAPSHOT)
+    # ============================================
+
+    def gravar_arquivo(self, caminho, metadados=None):
+        """Grava os arrays em um arquivo de snapshot, trocado atomicamente
+
+        Quem já mapeou o arquivo anterior continua com ele até fechar; quem
+        abrir depois da troca vê o novo. Retorna o tamanho em bytes.
+        """
+        # O JSON vai antes dos arrays: o layout depende do tamanho dele, e o
+        # tamanho dele dos deslocamentos. Reserva espaço e recalcula até caber.
+        reservado = 0
+        while True:
+            layout, fim = _layout(self.arrays, _CABECALHO.size + reservado, ALINHAMENTO_ARQUIVO)
+            cabecalho = json.dumps({'metadados': metadados or {}, 'layout': layout}).encode()
+            if len(cabecalho) <= reservado:
+                break
+            reservado = len(cabecalho) + 256
+        cabecalho = cabecalho.ljust(reservado)
+
+        temporario = f'{caminho}.{os.getpid()}-{threading.get_ident()}.tmp'
+        try:
+            with open(temporario, 'wb') as arquivo:
+                arquivo.write(_CABECALHO.pack(MAGICA_ARQUIVO, VERSAO_ARQUIVO, reservado))
+                arquivo.write(cabecalho)
+                for nome, array in self.arrays.items():
+                    arquivo.seek(layout[nome][2])
+                    arquivo.write(np.ascontiguousarray(array).tobytes())
+                arquivo.truncate(fim)
+                arquivo.flush()
+                os.fsync(arquivo.fileno())
+            os.replace(temporario, caminho)
+        except BaseException:
+            if os.path.exists(temporario):
+                os.remove(temporario)
+            raise
+        return fim
+
+    @classmethod
+    def abrir_arquivo(cls, caminho):
+        """Abre um snapshot com mmap, só leitura: os arrays são views do arquivo, sem cópia"""
+        with open(caminho, 'rb') as arquivo:
+            tamanho = os.fstat(arquivo.fileno()).st_size
+            if tamanho < _CABECALHO.size:
+                raise ErroSnapshot(f"{caminho}: não é um snapshot de regras")
+            memoria = mmap.mmap(arquivo.fileno(), 0, access=mmap.ACCESS_READ)
+        magica, versao, tamanho_json = _CABECALHO.unpack_from(memoria)
+        if magica != MAGICA_ARQUIVO:
+            memoria.close()
+            raise ErroSnapshot(f"{caminho}: não é um snapshot de regras")
+        if versao != VERSAO_ARQUIVO:
+            memoria.close()
+            raise ErroSnapshot(f"{caminho}: formato {versao}, esperado {VERSAO_ARQUIVO}")
+        cabecalho = json.loads(memoria[_CABECALHO.size:_CABECALHO.size + tamanho_json])
+        arrays = {}
+        for nome, (tipo, forma, inicio) in cabecalho['layout'].items():
+            tipo = np.dtype(tipo)
+            quantidade = math.prod(forma)
+            if inicio + quantidade * tipo.itemsize > tamanho:
+                raise ErroSnapshot(f"{caminho}: arquivo truncado ({nome})")
+            arrays[nome] = np.frombuffer(memoria, tipo, quantidade, inicio).reshape(forma)
+        tabelas = cls(arrays, memoria, cabecalho['metadados'])
+        tabelas.arquivo = caminho
+        return tabelas
+
+class TabelasEmpresa(TabelasRegras):
+    """Tabelas de uma empresa: as da camada dela consultadas antes das do base, sem cópia
+
+    Mesma regra do CacheEmpresa: chave cadastrada na camada (em qualquer
+    vigência) vale só a da camada. A camada traz os marketplaces que a
+    empresa substitui (com as faixas dela) e a matriz de ICMS (a do base,
+    se a empresa não tem rotas). Posições a partir do total de linhas do
+    base apontam para a camada.
+    """
+
+    def __init__(self, base, camada, memoria=None):
+        arrays = {**base.arrays, **{f'{PREFIXO_CAMADA}{nome}': array for nome, array in camada.arrays.items()}}
+        super().__init__(arrays, memoria)
+        self.base = base
+        self.camada = camada
+        self._linhas_base = {tabela: len(base.arrays[f'{tabela}.versao']) for tabela in TABELAS}
+
+    def matriz_icms(self):
+        return self.camada.matriz_icms()
+
+    def buscar(self, tabela, chaves, dias=None):
+        chaves = np.asarray(chaves, dtype=TABELAS[tabela][1])
+        na_camada = self.camada.posicao_chave(tabela, chaves) >= 0
+        pos = self.base.buscar(tabela, chaves, dias)
+        if not na_camada.any():
+            return pos
+        pos_camada = self.camada.buscar(tabela, chaves, dias)
+        return np.where(na_camada, np.where(pos_camada >= 0, pos_camada + self._linhas_base[tabela], -1), pos)
+
+    def _separar(self, tabela, pos):
+        # (linhas da camada, posições no base, posições na camada); -1 onde a linha é da outra
+        da_camada = pos >= self._linhas_base[tabela]
+        return (da_camada, np.where(da_camada, -1, pos),
+                np.where(da_camada, pos - self._linhas_base[tabela], -1))
+
+    def colunas(self, tabela, pos, campos):
+        da_camada, pos_base, pos_camada = self._separar(tabela, pos)
+        if not da_camada.any():
+            return self.base.colunas(tabela, pos, campos)
+        return [np.where(da_camada, camada, base) for base, camada in
+                zip(self.base.colunas(tabela, pos_base, campos), self.camada.colunas(tabela, pos_camada, campos))]
+
+    def buscar_faixas(self, pos_marketplace, codigos, dias=None):
+        # Marketplace da camada: só as faixas dela; do base: as do base
+        da_camada, pos_base, pos_camada = self._separar('marketplace', pos_marketplace)
+        pos = self.base.buscar_faixas(pos_base, codigos, dias)
+        if not da_camada.any():
+            return pos
+        achados = self.camada.buscar_faixas(pos_camada, codigos, dias)
+        return np.where(achados >= 0, achados + self._linhas_base['faixa'], pos)
+
+    def faixas(self, pos_faixas, comissao, taxa_fixa):
+        da_camada, pos_base, pos_camada = self._separar('faixa', pos_faixas)
+        if not da_camada.any():
+            return self.base.faixas(pos_faixas, comissao, taxa_fixa)
+        base = self.base.faixas(pos_base, comissao, taxa_fixa)
+        camada = self.camada.faixas(pos_camada, comissao, taxa_fixa)
+        colunas = max(base[0].shape[1], camada[0].shape[1])
+        resultado = []
+        for i, (b, c) in enumerate(zip(base, camada)):
+            # Colunas a mais: mínimo +infinito (faixa inexistente), taxas zero
+            vazio = np.inf if i == 0 else 0.0
+            b = np.pad(b, ((0, 0), (0, colunas - b.shape[1])), constant_values=vazio)
+            c = np.pad(c, ((0, 0), (0, colunas - c.shape[1])), constant_values=vazio)
+            resultado.append(np.where(da_camada[:, None], c, b))
+        return tuple(resultado)
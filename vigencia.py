@@ -0,0 +1,56 @@
+"""
+Vigência das Regras Tributárias
+
+Cada linha de ncm, icms_uf e marketplace vale de vigencia_inicio a
+vigencia_fim (datas ISO, inclusive). No banco e no cache as datas ficam em
+texto ISO (que ordena como data); nos arrays do cálculo vetorizado viram
+inteiros (dias desde 1970-01-01).
+"""
+
+import datetime as dt
+
+import numpy as np
+
+# Limites de uma vigência aberta
+INICIO_ABERTO = '0001-01-01'
+FIM_ABERTO = '9999-12-31'
+
+_EPOCA = dt.date(1970, 1, 1)
+
+def data_iso(data=None):
+    """Data em texto ISO (date, datetime ou texto); None = hoje"""
+    if data is None:
+        return dt.date.today().isoformat()
+    if isinstance(data, str):
+        return dt.date.fromisoformat(data.strip()[:10]).isoformat()
+    if isinstance(data, dt.datetime):
+        return data.date().isoformat()
+    return data.isoformat()
+
+def dia(data=None):
+    """Dias desde 1970-01-01 (date, datetime ou texto ISO); None = hoje"""
+    return (dt.date.fromisoformat(data_iso(data)) - _EPOCA).days
+
+def dias(datas):
+    """Versão vetorizada de dia(): (dias, válida, informada) por elemento
+
+    Vazios viram hoje; inválidos ficam com válida=False. Cada data distinta é
+    convertida uma vez só (catálogos costumam ter poucas).
+    """
+    # pandas só aqui: quem usa só data_iso()/dia() (interface, API) não paga a importação
+    import pandas as pd
+
+    codigos, unicas = pd.factorize(pd.Series(datas, copy=False))
+    unicas = pd.Series(unicas)
+    if not pd.api.types.is_datetime64_any_dtype(unicas):
+        unicas = unicas.astype(str).str.strip()
+        unicas = unicas.mask(unicas == '')
+    convertidas = pd.to_datetime(unicas, errors='coerce', format='ISO8601')
+    informada = unicas.notna().to_numpy()
+    lida = convertidas.notna().to_numpy()
+    dias_unicos = np.where(lida, convertidas.to_numpy().astype('datetime64[D]').astype(np.int64), dia())
+    # Código -1 (NaN/None) pega o último elemento: hoje, válida, não informada
+    dias_unicos = np.append(dias_unicos, dia())
+    valida = np.append(lida | ~informada, True)
+    informada = np.append(informada, False)
+    return dias_unicos[codigos], valida[codigos], informada[codigos]